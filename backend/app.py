@@ -45,11 +45,7 @@ def internal_error(error):
     return {'error': 'Internal server error'}, 500
 
 if __name__ == '__main__':
-    # Create tables
-    with app.app_context():
-        db.create_all()
-    
-    # Run app
+    # Run app (tables come from `flask db upgrade`, or DB_AUTO_CREATE=true)
     debug = os.getenv('FLASK_ENV') == 'development'
     port = int(os.getenv('PORT', 5001))  # Use 5001 to avoid AirPlay conflicts
     app.run(host='0.0.0.0', port=port, debug=debug)
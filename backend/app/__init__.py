@@ -1,13 +1,19 @@
+import click
 from flask import Flask
+from flask.cli import ScriptInfo
 from flask_sqlalchemy import SQLAlchemy
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
-from flask_migrate import Migrate
 from config import get_config
+from app.replicas import RoutingSession, configure_engines, dispose_engines_after_fork
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 jwt = JWTManager()
-migrate = Migrate()
+
+def running_flask_cli():
+    """Whether the app is being loaded by the ``flask`` command"""
+    ctx = click.get_current_context(silent=True)
+    return ctx is not None and ctx.find_object(ScriptInfo) is not None
 
 def create_app(config=None):
     """Application factory"""
@@ -19,13 +25,45 @@ def create_app(config=None):
     app.config.from_object(config)
     
     # Initialize extensions
+    configure_engines(app)
     db.init_app(app)
+    dispose_engines_after_fork(app)
     jwt.init_app(app)
-    migrate.init_app(app, db)
+    # Flask-Migrate (alembic) is slow to import and only serves ``flask db``
+    if running_flask_cli():
+        from flask_migrate import Migrate
+        Migrate(app, db, render_as_batch=True)  # SQLite alters tables in batch mode
     CORS(app, origins=config.CORS_ORIGINS)
     
+    from app.serializers import init_json
+    init_json(app)
+    
+    from app.search import init_search
+    from app.cache import init_cache, get_cache
+    from app.facets import init_facets
+    from app.catalog_index import init_catalog_index
+    init_search(app)
+    init_cache(app)
+    init_facets(app)
+    init_catalog_index(app)
+    
+    from app.ratings import ratings_cli
+    from app.catalog_import import catalog_cli
+    from app.counters import counters
+    from app.metrics import metrics
+    from app.profiler import profiler
+    from app.passwords import hasher
+    from app.replicas import router
+    app.cli.add_command(ratings_cli)
+    app.cli.add_command(catalog_cli)
+    counters.init_app(app)
+    metrics.init_app(app)
+    profiler.init_app(app)
+    hasher.init_app(app)
+    router.init_app(app)
+    
     # Register blueprints
-    from app.routes import auth_bp, products_bp, cart_bp, orders_bp, reviews_bp, users_bp
+    from app.routes import auth_bp, products_bp, cart_bp, orders_bp, reviews_bp, users_bp, admin_bp
     
     app.register_blueprint(auth_bp)
     app.register_blueprint(products_bp)
@@ -33,14 +71,26 @@ def create_app(config=None):
     app.register_blueprint(orders_bp)
     app.register_blueprint(reviews_bp)
     app.register_blueprint(users_bp)
+    app.register_blueprint(admin_bp)
     
     # Health check endpoint
     @app.route('/api/health', methods=['GET'])
     def health():
         return {'status': 'ok', 'message': 'Cat eCommerce API is running'}, 200
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    @app.route('/api/health/cache', methods=['GET'])
+    def cache_stats():
+        cache = get_cache()
+        return {'enabled': cache is not None, **(cache.stats() if cache else {})}, 200
+    
+    # The schema is managed with migrations (flask db upgrade); creating
+    # missing tables at boot is a development shortcut
+    if app.config['DB_AUTO_CREATE']:
+        with app.app_context():
+            db.create_all(bind_key=None)  # a replica gets them through replication
+            if app.config.get('SEARCH_BACKEND') == 'sql':
+                from app.search import create_search_schema
+                with db.engine.begin() as conn:
+                    create_search_schema(conn)
     
     return app
@@ -0,0 +1,570 @@
+"""ASGI serving mode
+
+``AsyncCatalog`` serves the Flask app over ASGI. The read-heavy endpoints
+(product list, detail and categories, a product's reviews, the user's
+orders) are answered by coroutines reading through an ``AsyncSession``
+(asyncpg, aiosqlite or aiomysql), so one worker keeps serving other
+connections while a request waits on the database. Every other request
+(writes, search, admin, failed authentication) runs the unchanged WSGI app
+on a pool of ``ASGI_WSGI_THREADS`` threads.
+
+The async views keep the Flask routes' contract: URLs are matched with the
+app's own url map, each request runs inside a Flask request context through
+the app's before/after-request hooks and error handlers, and they use the
+same models, serializers, pagination cursors, response cache, HTTP
+validators and read-replica routing as the sync views.
+
+    uvicorn asgi:app --workers 4
+    gunicorn -k uvicorn.workers.UvicornWorker asgi:app
+"""
+import io
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from asgiref.wsgi import WsgiToAsgiInstance
+from flask import current_app, g, jsonify, request, request_started
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.exceptions import RevokedTokenError
+from jwt import get_unverified_header
+from sqlalchemy import event, func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import selectinload
+
+from app import db
+from app.authz import token_revoked_async
+from app.cache import (
+    CATEGORIES_TAG, LIST_TAG, cached_body, cached_json, product_tag, store_response
+)
+from app.catalog_index import get_catalog_index
+from app.conditional import add_validators, evaluate
+from app.models import Order, Product, Review
+from app.pagination import (
+    InvalidCursor, cached_total_async, cursor_requested, include_total,
+    keyset_query, keyset_result
+)
+from app.replicas import REPLICA_BIND, engine_options, router
+from app.routes.orders import order_version_statement, requested_order_fields
+from app.routes.products import (
+    SORT_KEYS, catalog_version_statement, categories_statement, filter_products,
+    listing_filters, offset_order, product_version_statement
+)
+from app.routes.reviews import (
+    filter_reviews, rating_summary, rating_summary_statement, review_filters, review_sort,
+    reviews_version_statement
+)
+from app.serializers import InvalidFields, order_serializer, product_serializer, review_serializer
+
+# Sync backend name -> async driver
+ASYNC_DRIVERS = {
+    'postgresql': 'postgresql+asyncpg',
+    'sqlite': 'sqlite+aiosqlite',
+    'mysql': 'mysql+aiomysql',
+}
+
+
+def async_url(url):
+    """``url`` with the async driver for its database"""
+    url = make_url(url)
+    driver = ASYNC_DRIVERS.get(url.get_backend_name())
+    if driver is None:
+        raise ValueError(f'No async driver for {url.get_backend_name()}')
+    return url.set(drivername=driver)
+
+
+def async_engine_options(url, config):
+    """``engine_options()`` with connect arguments in the async driver's terms"""
+    options = engine_options(url, config)
+    if url.get_backend_name() == 'postgresql':
+        connect_args = {'timeout': config['DB_CONNECT_TIMEOUT']}
+        if config['DB_STATEMENT_TIMEOUT_MS']:
+            connect_args['server_settings'] = {'statement_timeout': str(config['DB_STATEMENT_TIMEOUT_MS'])}
+        options['connect_args'] = connect_args
+    return options
+
+
+class AsyncDatabase:
+    """Async engines for the primary and the replica, created on first use
+
+    Engines are bound to the running event loop, so each worker process
+    creates its own.
+    """
+
+    def __init__(self, app):
+        with app.app_context():
+            self._urls = {None: db.engines[None].url}
+            if REPLICA_BIND in db.engines:
+                self._urls[REPLICA_BIND] = db.engines[REPLICA_BIND].url
+        self._config = app.config
+        self._engines = {}
+
+    def engine(self, bind=None):
+        engine = self._engines.get(bind)
+        if engine is None:
+            url = async_url(self._urls[bind])
+            engine = create_async_engine(url, **async_engine_options(url, self._config))
+            if bind == REPLICA_BIND:
+                event.listen(engine.sync_engine, 'handle_error', router._on_replica_error)
+            self._engines[bind] = engine
+        return engine
+
+    async def session(self):
+        """Session for the current request, on the replica when it may read there"""
+        if REPLICA_BIND in self._urls and router.should_read_replica():
+            session = AsyncSession(self.engine(REPLICA_BIND), expire_on_commit=False)
+            # Check out the connection up front so an unreachable replica
+            # falls back to the primary instead of failing the request
+            try:
+                await session.connection()
+                g.replica_used = True
+                return session
+            except Exception:
+                await session.close()
+                router.mark_down()
+        return AsyncSession(self.engine(), expire_on_commit=False)
+
+    async def dispose(self):
+        for engine in self._engines.values():
+            await engine.dispose()
+        self._engines.clear()
+
+
+def _count_statement(statement):
+    return select(func.count()).select_from(statement.order_by(None).subquery())
+
+
+async def _offset_page(session, statement, order, page, per_page):
+    """``(items, total, pages)`` as ``Query.paginate(error_out=False)`` computes them
+
+    ``order`` is an ORDER BY clause or a list of them.
+    """
+    page = max(page, 1)
+    per_page = per_page if per_page >= 1 else 20
+    order = order if isinstance(order, list) else [order]
+    items = (await session.scalars(
+        statement.order_by(*order).limit(per_page).offset((page - 1) * per_page)
+    )).all()
+    total = await session.scalar(_count_statement(statement))
+    return items, total, math.ceil(total / per_page) if total else 0
+
+
+async def _keyset_page(session, statement, columns, sort_key, descending=True):
+    per_page = request.args.get('per_page', 20, type=int)
+    rows = (await session.scalars(keyset_query(
+        statement, columns, sort_key, request.args.get('cursor'), per_page, descending
+    ))).all()
+    return keyset_result(rows, columns, sort_key, per_page)
+
+
+async def _respond(build, parts=None, tags=None, private=False):
+    """``@conditional`` and ``@cached_response`` around the coroutine ``build()``"""
+    if parts is not None:
+        not_modified = evaluate(parts, private)
+        if not_modified is not None:
+            return not_modified
+
+    key = None
+    if tags is not None:
+        key, body = cached_body(tags)
+        if body is not None:
+            return add_validators(cached_json(body), private)
+
+    response = current_app.make_response(await build())
+    store_response(key, response)
+    return add_validators(response, private)
+
+
+def _access_claims():
+    """Claims of a valid access token in the request, or None
+
+    Only checks what needs no database; revocation is checked in the view.
+    """
+    header = request.headers.get('Authorization', '')
+    if not header.startswith('Bearer '):
+        return None
+    try:
+        claims = decode_token(header[7:])
+    except Exception:
+        return None
+    return claims if claims.get('type') == 'access' else None
+
+
+async def _authenticate(session):
+    """``jwt_required()`` for async views: the current user's id"""
+    claims = g.access_claims
+    if await token_revoked_async(claims, session):
+        token = request.headers['Authorization'][7:]
+        raise RevokedTokenError(get_unverified_header(token), claims)
+    # What verify_jwt_in_request() leaves behind, so get_jwt_identity() works
+    g._jwt_extended_jwt = claims
+    g._jwt_extended_jwt_header = get_unverified_header(request.headers['Authorization'][7:])
+    g._jwt_extended_jwt_user = {'loaded_user': None}
+    g._jwt_extended_jwt_location = 'headers'
+    return claims['sub']
+
+
+async def get_products(session):
+    """Async ``GET /api/products`` (without ``search`` or the catalog index)"""
+    parts = (await session.scalar(catalog_version_statement()),)
+
+    async def build():
+        try:
+            page = request.args.get('page', 1, type=int)
+            per_page = request.args.get('per_page', 20, type=int)
+            sort_by = request.args.get('sort_by', 'created_at')
+            filters = listing_filters()
+            fields = product_serializer.requested_fields()
+
+            statement = filter_products(select(Product).filter_by(is_active=True), **filters)
+
+            if cursor_requested():
+                columns, descending = SORT_KEYS.get(sort_by, SORT_KEYS['created_at'])
+                products, next_cursor = await _keyset_page(
+                    session, statement.options(*product_serializer.load_options(fields, columns)),
+                    columns, sort_by if sort_by in SORT_KEYS else 'created_at', descending
+                )
+                result = {
+                    'products': product_serializer.many(products, fields),
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
+                if include_total():
+                    result['total'] = await cached_total_async(
+                        ('products', request.args.get('search'), *filters.values()),
+                        lambda: session.scalar(_count_statement(statement))
+                    )
+                return jsonify(result), 200
+
+            products, total, pages = await _offset_page(
+                session, statement.options(*product_serializer.load_options(fields)),
+                offset_order(sort_by), page, per_page
+            )
+            return jsonify({
+                'products': product_serializer.many(products, fields),
+                'total': total,
+                'pages': pages,
+                'current_page': page
+            }), 200
+
+        except (InvalidCursor, InvalidFields) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return await _respond(build, parts, [LIST_TAG])
+
+
+async def get_product(session, product_id):
+    """Async ``GET /api/products/<product_id>``"""
+    updated_at = await session.scalar(product_version_statement(product_id))
+
+    async def build():
+        try:
+            product = await session.get(Product, product_id)
+            if not product:
+                return jsonify({'error': 'Product not found'}), 404
+            return jsonify({'product': product.to_dict()}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return await _respond(build, (updated_at,) if updated_at else None, [product_tag(product_id)])
+
+
+async def get_categories(session):
+    """Async ``GET /api/products/categories``"""
+    parts = (await session.scalar(catalog_version_statement()),)
+
+    async def build():
+        try:
+            categories = (await session.scalars(categories_statement())).all()
+            return jsonify({'categories': list(categories)}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return await _respond(build, parts, [CATEGORIES_TAG])
+
+
+async def get_product_reviews(session, product_id):
+    """Async ``GET /api/reviews/product/<product_id>``"""
+    row = (await session.execute(reviews_version_statement(product_id))).first()
+    parts = tuple(row) if row else None
+
+    async def build():
+        try:
+            page = request.args.get('page', 1, type=int)
+            per_page = request.args.get('per_page', 10, type=int)
+            sort, columns, descending = review_sort()
+            filters = review_filters()
+            fields = review_serializer.requested_fields()
+
+            summary = (await session.execute(rating_summary_statement(product_id))).first()
+            if not summary:
+                return jsonify({'error': 'Product not found'}), 404
+
+            statement = filter_reviews(select(Review).filter_by(product_id=product_id), **filters)
+
+            if cursor_requested():
+                reviews, next_cursor = await _keyset_page(
+                    session, statement.options(*review_serializer.load_options(fields, columns)),
+                    columns, sort, descending
+                )
+                result = {
+                    'reviews': review_serializer.many(reviews, fields),
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None,
+                    'rating_summary': rating_summary(summary)
+                }
+                if include_total():
+                    result['total'] = await cached_total_async(
+                        ('reviews', product_id, *filters.values()),
+                        lambda: session.scalar(_count_statement(statement))
+                    )
+                return jsonify(result), 200
+
+            reviews, total, pages = await _offset_page(
+                session, statement.options(*review_serializer.load_options(fields)),
+                [column.desc() if descending else column.asc() for column in columns], page, per_page
+            )
+            return jsonify({
+                'reviews': review_serializer.many(reviews, fields),
+                'total': total,
+                'pages': pages,
+                'current_page': page,
+                'rating_summary': rating_summary(summary)
+            }), 200
+
+        except (InvalidCursor, InvalidFields) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return await _respond(build, parts)
+
+
+async def get_orders(session):
+    """Async ``GET /api/orders``"""
+    user_id = await _authenticate(session)
+
+    async def build():
+        try:
+            page = request.args.get('page', 1, type=int)
+            per_page = request.args.get('per_page', 10, type=int)
+            fields = requested_order_fields()
+
+            statement = select(Order).filter_by(user_id=user_id)
+
+            if cursor_requested():
+                columns = [Order.created_at, Order.id]
+                orders, next_cursor = await _keyset_page(
+                    session, statement.options(*order_serializer.load_options(fields, columns)),
+                    columns, 'created_at'
+                )
+                result = {
+                    'orders': order_serializer.many(orders, fields),
+                    'next_cursor': next_cursor,
+                    'has_more': next_cursor is not None
+                }
+                if include_total():
+                    result['total'] = await cached_total_async(
+                        ('orders', user_id), lambda: session.scalar(_count_statement(statement))
+                    )
+                return jsonify(result), 200
+
+            orders, total, pages = await _offset_page(
+                session, statement.options(*order_serializer.load_options(fields)),
+                Order.created_at.desc(), page, per_page
+            )
+            return jsonify({
+                'orders': order_serializer.many(orders, fields),
+                'total': total,
+                'pages': pages,
+                'current_page': page
+            }), 200
+
+        except (InvalidCursor, InvalidFields) as e:
+            return jsonify({'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return await _respond(build)
+
+
+async def get_order(session, order_id):
+    """Async ``GET /api/orders/<order_id>``"""
+    user_id = await _authenticate(session)
+    row = (await session.execute(order_version_statement(order_id, user_id))).first()
+
+    async def build():
+        try:
+            order = (await session.scalars(
+                select(Order).filter_by(id=order_id, user_id=user_id)
+                .options(selectinload(Order.items))
+            )).first()
+            if not order:
+                return jsonify({'error': 'Order not found'}), 404
+            return jsonify({'order': order.to_dict()}), 200
+        except Exception as e:
+            return jsonify({'error': str(e)}), 500
+
+    return await _respond(build, tuple(row) if row else None, private=True)
+
+
+def _searching_or_indexed():
+    # Search and the in-memory catalog index are served by the WSGI view
+    return bool(request.args.get('search')) or get_catalog_index() is not None
+
+
+def _unauthenticated():
+    g.access_claims = _access_claims()
+    return g.access_claims is None
+
+
+# Flask endpoint -> (async view, check sending the request to the WSGI app instead)
+ASYNC_VIEWS = {
+    'products.get_products': (get_products, _searching_or_indexed),
+    'products.get_product': (get_product, None),
+    'products.get_categories': (get_categories, None),
+    'reviews.get_product_reviews': (get_product_reviews, None),
+    'orders.get_orders': (get_orders, _unauthenticated),
+    'orders.get_order': (get_order, _unauthenticated),
+}
+
+
+class _ThreadedWsgiInstance(WsgiToAsgiInstance):
+    """asgiref's WSGI adapter, running requests on a thread pool
+
+    asgiref runs every WSGI request on one shared thread by default.
+    """
+
+    def __init__(self, wsgi_application, executor):
+        super().__init__(wsgi_application)
+        self.run_wsgi_app = sync_to_async(
+            WsgiToAsgiInstance.__dict__['run_wsgi_app'].func.__get__(self),
+            thread_sensitive=False, executor=executor
+        )
+
+
+class AsyncCatalog:
+    """ASGI application: async read views, everything else through WSGI"""
+
+    def __init__(self, app):
+        self.app = app
+        self.database = AsyncDatabase(app)
+        self.executor = ThreadPoolExecutor(
+            max_workers=app.config.get('ASGI_WSGI_THREADS', 8), thread_name_prefix='wsgi'
+        )
+        self._adapter = app.url_map.bind('localhost')
+        app.extensions['async_catalog'] = self
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self._lifespan(receive, send)
+
+        view = self._match(scope) if scope['type'] == 'http' else None
+        if view is None:
+            return await self._wsgi(scope, receive, send)
+
+        body = await self._read_body(receive)
+        handled = await self._dispatch(scope, body, send, *view)
+        if not handled:
+            await self._wsgi(scope, _replay(body, receive), send)
+
+    def _match(self, scope):
+        if scope['method'] not in ('GET', 'HEAD'):
+            return None
+        try:
+            endpoint, view_args = self._adapter.match(scope['path'], method='GET')
+        except Exception:
+            return None
+        if endpoint not in ASYNC_VIEWS:
+            return None
+        return ASYNC_VIEWS[endpoint], view_args
+
+    async def _dispatch(self, scope, body, send, view, view_args):
+        """Run an async view the way ``Flask.wsgi_app`` runs a sync one
+
+        Returns False, before any hook has run, when the view declines.
+        """
+        app = self.app
+        instance = _ThreadedWsgiInstance(app.wsgi_app, self.executor)
+        instance.scope = scope
+        environ = instance.build_environ(scope, io.BytesIO(body))
+        handler, declines = view
+
+        ctx = app.request_context(environ)
+        ctx.push()
+        error = None
+        try:
+            if declines is not None and declines():
+                return False
+            try:
+                request_started.send(app)
+                rv = app.preprocess_request()
+                if rv is None:
+                    session = await self.database.session()
+                    try:
+                        rv = await handler(session, **view_args)
+                    finally:
+                        await session.close()
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.finalize_request(rv)
+        except Exception as e:
+            error = e
+            response = app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+
+        app_iter, status, headers = response.get_wsgi_response(environ)
+        await send({
+            'type': 'http.response.start',
+            'status': int(status.split(' ', 1)[0]),
+            'headers': [(name.lower().encode('latin1'), value.encode('latin1')) for name, value in headers],
+        })
+        await send({'type': 'http.response.body', 'body': b''.join(app_iter)})
+        response.close()
+        return True
+
+    async def _wsgi(self, scope, receive, send):
+        await _ThreadedWsgiInstance(self.app.wsgi_app, self.executor)(scope, receive, send)
+
+    async def _read_body(self, receive):
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get('body', b''))
+            if not message.get('more_body'):
+                return b''.join(chunks)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.database.dispose()
+                self.executor.shutdown(wait=False)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+def _replay(body, receive):
+    """``receive`` that hands out the already read ``body`` first"""
+    sent = False
+
+    async def replayed():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+    return replayed
+
+
+def create_asgi_app(app=None):
+    """``AsyncCatalog`` around ``app`` (a new Flask app by default)"""
+    if app is None:
+        from app import create_app
+        app = create_app()
+    return AsyncCatalog(app)
@@ -0,0 +1,131 @@
+"""Claims-based authorization
+
+Access tokens carry the user's role and active flag (``is_admin``,
+``is_active``) plus a token version (``tv``), all set at login. Routes check
+roles from the claims instead of loading the user.
+
+Revocation: ``User.token_version`` is bumped whenever a user's privileges or
+credentials change (``toggle_admin``, ``toggle_active``, ``change_password``).
+Every JWT-protected request compares the token's ``tv`` with the current
+version, which is cached per worker for ``TOKEN_VERSION_CACHE_TTL`` seconds,
+so the hot path normally makes no database round trip and a revoked token
+stops working within that window (immediately on the worker that made the
+change, once its transaction commits).
+"""
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_jwt_extended import create_access_token, get_jwt, jwt_required
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db, jwt
+
+
+class _TokenVersionCache:
+    """user_id -> (expires_at, token_version) with a TTL"""
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def cached(self, user_id):
+        """``(found, version)`` from the cache"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return True, entry[1]
+        return False, None
+
+    def store(self, user_id, ttl, version):
+        with self._lock:
+            if len(self._entries) >= self.max_entries:
+                self._entries.clear()
+            self._entries[user_id] = (time.monotonic() + ttl, version)
+
+    def get(self, user_id, ttl):
+        found, version = self.cached(user_id)
+        if not found:
+            version = db.session.scalar(token_version_statement(user_id))
+            self.store(user_id, ttl, version)
+        return version
+
+    def forget(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+_token_versions = _TokenVersionCache()
+
+_PENDING_REVOCATIONS = 'revoked_user_ids'
+
+
+def token_version_statement(user_id):
+    from app.models import User
+    return db.select(User.token_version).where(User.id == user_id)
+
+
+def create_user_token(user):
+    """Access token for ``user`` with role, status and version claims"""
+    return create_access_token(
+        identity=user.id,
+        additional_claims={
+            'is_admin': bool(user.is_admin),
+            'is_active': bool(user.is_active),
+            'tv': user.token_version or 0,
+        }
+    )
+
+
+def revoke_user_tokens(user):
+    """Invalidate every token issued to ``user`` so far (commit afterwards)"""
+    user.token_version = (user.token_version or 0) + 1
+    # Dropped from the cache after commit: a request checking the token before
+    # then would otherwise cache the old version again for the whole TTL
+    db.session.info.setdefault(_PENDING_REVOCATIONS, set()).add(user.id)
+
+
+@event.listens_for(Session, 'after_commit')
+def _forget_revoked_versions(session):
+    for user_id in session.info.pop(_PENDING_REVOCATIONS, ()):
+        _token_versions.forget(user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_revoked_versions(session):
+    session.info.pop(_PENDING_REVOCATIONS, None)
+
+
+@jwt.token_in_blocklist_loader
+def _token_revoked(jwt_header, jwt_payload):
+    ttl = current_app.config.get('TOKEN_VERSION_CACHE_TTL', 30)
+    version = _token_versions.get(jwt_payload['sub'], ttl)
+    # Unknown (deleted) users and outdated versions are both revoked
+    return version is None or jwt_payload.get('tv', 0) != version
+
+
+async def token_revoked_async(jwt_payload, session):
+    """Revocation check for async callers, reading through ``session``"""
+    ttl = current_app.config.get('TOKEN_VERSION_CACHE_TTL', 30)
+    user_id = jwt_payload['sub']
+    found, version = _token_versions.cached(user_id)
+    if not found:
+        version = await session.scalar(token_version_statement(user_id))
+        _token_versions.store(user_id, ttl, version)
+    return version is None or jwt_payload.get('tv', 0) != version
+
+
+def admin_required(fn):
+    """Require a valid token issued to an active admin"""
+    @wraps(fn)
+    @jwt_required()
+    def wrapper(*args, **kwargs):
+        claims = get_jwt()
+        if not claims.get('is_admin') or not claims.get('is_active', True):
+            return jsonify({'error': 'Admin access required'}), 403
+        return fn(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,290 @@
+"""Response cache for the public catalog endpoints
+
+Cached responses are keyed on the request path and its normalized query
+string, and tagged (``product:<id>``, ``products:list``,
+``products:categories``). Each tag has a version counter that is part of the
+key; invalidating a tag bumps its version so every entry built from the old
+version becomes unreachable and ages out of the store. This works the same
+for the in-process store and a shared one. The in-process store keeps at
+most ``max_counters`` versions; past that it starts a new generation (also
+part of every key) instead of letting a forgotten tag fall back to an old
+version.
+
+Tags are invalidated from the ``products_changed`` signal, which fires after
+any committed product change (admin edits, checkout stock updates, rating
+changes from reviews).
+
+Stores (``CATALOG_CACHE_BACKEND``):
+
+- ``local``: per-worker LRU with TTL and a byte budget
+- ``redis``: shared store at ``CATALOG_CACHE_URL`` (needs the ``redis``
+  package); ``LocalStore`` stands in for it in tests
+- ``none``: caching disabled
+
+Responses read from the read replica shortly after an invalidation on this
+worker are not stored, so replication lag is not frozen into the cache.
+"""
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import Response, current_app, g, request
+
+from app.replicas import used_replica
+from app.signals import products_changed
+
+LIST_TAG = 'products:list'
+CATEGORIES_TAG = 'products:categories'
+
+# Store-wide counter included in every key; bumping it retires all entries
+GENERATION_KEY = 'generation'
+
+# Product columns that can change the set of categories
+CATEGORY_FIELDS = {'category', 'is_active'}
+
+
+def product_tag(product_id):
+    return f'product:{product_id}'
+
+
+class LocalStore:
+    """In-process key/value store with TTL, LRU eviction and a byte budget"""
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=10000, max_counters=100000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_counters = max_counters
+        self._entries = OrderedDict()  # key -> (expires_at, value)
+        self._counters = {}  # only dropped all at once, see incr()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                return self._counters[key]
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def get_many(self, keys):
+        return [self.get(key) for key in keys]
+
+    def set(self, key, value, ttl=None):
+        size = _sizeof(value)
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._drop(key)
+            expires_at = time.monotonic() + ttl if ttl else None
+            self._entries[key] = (expires_at, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def incr(self, key):
+        with self._lock:
+            if key not in self._counters and len(self._counters) >= self.max_counters:
+                # A dropped tag version would read as 0 again and revive entries
+                # cached before its changes; start a new generation instead
+                self._counters = {GENERATION_KEY: self._counters.get(GENERATION_KEY, 0) + 1}
+            value = self._counters[key] = self._counters.get(key, 0) + 1
+            return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._counters.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= _sizeof(entry[1])
+
+    @property
+    def size_bytes(self):
+        return self._bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class RedisStore:
+    """Shared store backed by Redis"""
+
+    def __init__(self, url, prefix='catalog:'):
+        import redis  # optional dependency, only needed for this store
+
+        self._client = redis.Redis.from_url(url)
+        self.prefix = prefix
+
+    def get(self, key):
+        return self._client.get(self.prefix + key)
+
+    def get_many(self, keys):
+        return self._client.mget([self.prefix + key for key in keys])
+
+    def set(self, key, value, ttl=None):
+        self._client.set(self.prefix + key, value, ex=int(ttl) if ttl else None)
+
+    def incr(self, key):
+        return self._client.incr(self.prefix + key)
+
+    def clear(self):
+        for key in self._client.scan_iter(self.prefix + '*'):
+            self._client.delete(key)
+
+
+def _sizeof(value):
+    return len(value) if isinstance(value, (bytes, str)) else 8
+
+
+class ResponseCache:
+    """Tag-versioned cache of JSON responses"""
+
+    def __init__(self, store, ttl=60):
+        self.store = store
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.last_change = 0.0
+        self._stats_lock = threading.Lock()
+        products_changed.connect(self._on_products_changed)
+
+    def _on_products_changed(self, sender, product_ids=(), fields=None, **kwargs):
+        tags = [LIST_TAG] + [product_tag(pid) for pid in product_ids]
+        if fields is None or fields & CATEGORY_FIELDS:
+            tags.append(CATEGORIES_TAG)
+        self.invalidate(*tags)
+
+    def invalidate(self, *tags):
+        """Make every entry carrying any of ``tags`` unreachable"""
+        for tag in tags:
+            self.store.incr('tag:' + tag)
+        with self._stats_lock:
+            self.invalidations += len(tags)
+        self.last_change = time.monotonic()
+
+    def changed_within(self, seconds):
+        """Whether a tag was invalidated on this worker in the last ``seconds``"""
+        return time.monotonic() - self.last_change < seconds
+
+    def _key(self, tags):
+        versions = self.store.get_many([GENERATION_KEY] + ['tag:' + tag for tag in tags])
+        args = '&'.join(
+            f'{name}={value}'
+            for name, value in sorted(request.args.items(multi=True))
+            if value != ''
+        )
+        version = '.'.join(str(int(v or 0)) for v in versions)
+        # Under @conditional the body must match the ETag it is sent with
+        return f'resp:{request.path}?{args}#{version}#{g.get("etag", "")}'
+
+    def get(self, tags):
+        key = self._key(tags)
+        body = self.store.get(key)
+        with self._stats_lock:
+            if body is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return key, body
+
+    def set(self, key, body):
+        self.store.set(key, body, self.ttl)
+
+    def stats(self):
+        with self._stats_lock:
+            lookups = self.hits + self.misses
+            stats = {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else 0.0,
+                'invalidations': self.invalidations,
+            }
+        if isinstance(self.store, LocalStore):
+            stats['entries'] = len(self.store)
+            stats['bytes'] = self.store.size_bytes
+        return stats
+
+
+def init_cache(app):
+    """Create the configured response cache for ``app``"""
+    backend = app.config.get('CATALOG_CACHE_BACKEND', 'local')
+    if backend == 'none':
+        app.extensions['response_cache'] = None
+        return None
+    if backend == 'local':
+        store = LocalStore(max_bytes=app.config.get('CATALOG_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    elif backend == 'redis':
+        store = RedisStore(app.config['CATALOG_CACHE_URL'])
+    else:
+        raise ValueError(f'Unknown CATALOG_CACHE_BACKEND: {backend}')
+
+    cache = ResponseCache(store, ttl=app.config.get('CATALOG_CACHE_TTL', 60))
+    app.extensions['response_cache'] = cache
+    return cache
+
+
+def get_cache():
+    """Response cache of the current app (None when disabled)"""
+    return current_app.extensions.get('response_cache')
+
+
+def cached_body(tags):
+    """``(key, body)`` of the cached response for the current request
+
+    ``body`` is None on a miss (or with caching disabled); hand the response
+    and the key to ``store_response()`` once it is built.
+    """
+    cache = get_cache()
+    if cache is None:
+        return None, None
+    return cache.get(tags)
+
+
+def store_response(key, response):
+    """Cache ``response`` under ``key`` if it is worth keeping"""
+    cache = get_cache()
+    if cache is None or key is None or response.status_code != 200:
+        return
+    # A replica may not have caught up with a change made moments ago;
+    # caching what it returned would outlive the replication lag
+    if used_replica() and cache.changed_within(current_app.config['REPLICA_STICKY_SECONDS']):
+        return
+    cache.set(key, response.get_data())
+
+
+def cached_json(body):
+    return Response(body, status=200, mimetype='application/json')
+
+
+def cached_response(tags):
+    """Cache successful JSON responses of a GET view
+
+    ``tags`` is a list of tags, or a callable receiving the view arguments
+    and returning one.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if get_cache() is None:
+                return view(*args, **kwargs)
+
+            key, body = cached_body(tags(**kwargs) if callable(tags) else tags)
+            if body is not None:
+                return cached_json(body)
+
+            response = current_app.make_response(view(*args, **kwargs))
+            store_response(key, response)
+            return response
+        return wrapper
+    return decorator
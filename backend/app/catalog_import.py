@@ -0,0 +1,328 @@
+"""Streaming catalog import
+
+Supplier catalogs (CSV with a header row, or JSON Lines) are read row by
+row, validated and upserted into ``products`` by SKU in chunks of
+``chunk_size`` rows. Each chunk costs one ``SELECT`` of the existing rows,
+one multi-row ``INSERT`` for new SKUs and one batched ``UPDATE`` for changed
+ones, then commits, so memory stays bounded by the chunk size. Rows that
+match what is stored are left alone. Invalid rows are skipped and reported
+with their line number.
+
+Search indexes and caches hear about each chunk through a single
+``products_changed`` signal. Progress is reported after every commit as the
+last input line written, so an interrupted import can resume from there
+(``flask catalog import --resume``, or ``start_line`` on the admin endpoint).
+"""
+import csv
+import json
+import os
+import time
+import uuid
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import update
+
+from app import db
+from app.models import Product
+from app.signals import mark_products_changed
+
+FORMATS = ('csv', 'jsonl')
+REQUIRED_FIELDS = ('sku', 'name', 'price', 'category')
+OPTIONAL_FIELDS = ('description', 'image_url', 'stock', 'is_active')
+MAX_REPORTED_ERRORS = 100
+
+_TRUE = {'1', 'true', 'yes', 'y', 't'}
+_FALSE = {'0', 'false', 'no', 'n', 'f'}
+
+
+class InvalidImportFile(ValueError):
+    """The input cannot be imported at all (bad format or header)"""
+
+
+class ImportReport:
+    """Running totals of an import"""
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.duplicates = 0
+        self.invalid = 0
+        self.chunks = 0
+        self.last_line = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+    @property
+    def rows_per_s(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def error(self, line, message):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self):
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'duplicates': self.duplicates,
+            'invalid': self.invalid,
+            'chunks': self.chunks,
+            'last_line': self.last_line,
+            'seconds': round(self.elapsed, 3),
+            'rows_per_s': round(self.rows_per_s, 1),
+            'errors': self.errors,
+        }
+
+
+def detect_format(filename=None, content_type=None):
+    """Guess the input format from a file name or content type"""
+    name = (filename or '').lower()
+    kind = (content_type or '').lower()
+    if name.endswith(('.jsonl', '.ndjson')) or 'ndjson' in kind or 'jsonl' in kind:
+        return 'jsonl'
+    if name.endswith('.csv') or 'csv' in kind:
+        return 'csv'
+    return None
+
+
+def read_rows(stream, fmt):
+    """Yield ``(line_number, raw_row)`` from a text stream"""
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        if not reader.fieldnames or 'sku' not in reader.fieldnames:
+            raise InvalidImportFile('CSV header must include a sku column')
+        for raw in reader:
+            yield reader.line_num, raw
+    elif fmt == 'jsonl':
+        for line_number, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            try:
+                raw = json.loads(line)
+            except ValueError as e:
+                yield line_number, f'Invalid JSON: {e}'
+                continue
+            yield line_number, raw if isinstance(raw, dict) else 'Expected a JSON object'
+    else:
+        raise InvalidImportFile(f'Unsupported format: {fmt}')
+
+
+def parse_integer(value, field):
+    if isinstance(value, bool):
+        raise ValueError(f'{field} must be an integer')
+    if isinstance(value, int):
+        number = value
+    elif isinstance(value, float) and value.is_integer():
+        number = int(value)
+    else:
+        try:
+            number = int(str(value).strip())
+        except ValueError:
+            raise ValueError(f'{field} must be an integer')
+    if number < 0:
+        raise ValueError(f'{field} must not be negative')
+    return number
+
+
+def parse_boolean(value, field):
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in _TRUE:
+        return True
+    if text in _FALSE:
+        return False
+    raise ValueError(f'{field} must be true or false')
+
+
+def validate_row(raw):
+    """Clean product values from a raw row; raises ValueError"""
+    if not isinstance(raw, dict):
+        raise ValueError(raw)
+    values = {key: (value.strip() if isinstance(value, str) else value) for key, value in raw.items()}
+    missing = [field for field in REQUIRED_FIELDS if values.get(field) in (None, '')]
+    if missing:
+        raise ValueError(f'Missing required fields: {", ".join(missing)}')
+
+    row = {
+        'sku': str(values['sku']),
+        'name': str(values['name']),
+        'price': parse_integer(values['price'], 'price'),
+        'category': str(values['category']),
+    }
+    if len(row['sku']) > 64:
+        raise ValueError('sku must be at most 64 characters')
+    if len(row['name']) > 255:
+        raise ValueError('name must be at most 255 characters')
+    if len(row['category']) > 50:
+        raise ValueError('category must be at most 50 characters')
+
+    # Optional columns left out of the input are not touched on update
+    if 'description' in values:
+        row['description'] = values['description'] or ''
+    if 'image_url' in values:
+        row['image_url'] = values['image_url'] or None
+    if values.get('stock') not in (None, ''):
+        row['stock'] = parse_integer(values['stock'], 'stock')
+    if values.get('is_active') not in (None, ''):
+        row['is_active'] = parse_boolean(values['is_active'], 'is_active')
+    return row
+
+
+def _write_chunk(rows, report):
+    """Upsert one chunk (``sku -> row``) and commit"""
+    columns = [getattr(Product, field) for field in REQUIRED_FIELDS + OPTIONAL_FIELDS]
+    existing = {
+        row.sku: row
+        for row in db.session.execute(
+            db.select(Product.id, *columns).where(Product.sku.in_(list(rows)))
+        )
+    }
+
+    now = datetime.utcnow()
+    inserts, updates, changed_fields = [], [], set()
+    for sku, row in rows.items():
+        current = existing.get(sku)
+        if current is None:
+            inserts.append({
+                'id': str(uuid.uuid4()), 'description': '', 'image_url': None,
+                'stock': 0, 'is_active': True, **row,
+                'created_at': now, 'updated_at': now,
+            })
+            continue
+        changes = {key: value for key, value in row.items() if getattr(current, key) != value}
+        if changes:
+            updates.append({'id': current.id, **changes, 'updated_at': now})
+            changed_fields.update(changes)
+        else:
+            report.unchanged += 1
+
+    if inserts:
+        db.session.execute(db.insert(Product), inserts)
+    if updates:
+        db.session.execute(update(Product), updates)
+    if inserts or updates:
+        changed_ids = [row['id'] for row in inserts + updates]
+        fields = None if inserts else changed_fields | {'updated_at'}
+        mark_products_changed(db.session, changed_ids, fields)
+    db.session.commit()
+
+    report.inserted += len(inserts)
+    report.updated += len(updates)
+
+
+def import_products(stream, fmt, chunk_size=1000, start_line=0, report=None, on_chunk=None):
+    """Upsert products from ``stream``; returns an ``ImportReport``
+
+    Rows on lines up to ``start_line`` are skipped (resuming an earlier
+    run). ``on_chunk(report)`` is called after every committed chunk.
+    """
+    report = report or ImportReport()
+    chunk = {}
+    chunk_end = start_line
+
+    def flush():
+        try:
+            _write_chunk(chunk, report)
+        except Exception:
+            db.session.rollback()
+            raise
+        report.chunks += 1
+        report.last_line = chunk_end
+        chunk.clear()
+        if on_chunk:
+            on_chunk(report)
+
+    for line_number, raw in read_rows(stream, fmt):
+        if line_number <= start_line:
+            continue
+        report.rows += 1
+        chunk_end = line_number
+        try:
+            row = validate_row(raw)
+        except ValueError as e:
+            report.error(line_number, str(e))
+            continue
+        # A SKU repeated within a chunk: the later row wins
+        if row['sku'] in chunk:
+            report.duplicates += 1
+        chunk[row['sku']] = row
+        if len(chunk) >= chunk_size:
+            flush()
+
+    if chunk:
+        flush()
+    report.last_line = max(report.last_line, chunk_end)
+    return report
+
+
+catalog_cli = AppGroup('catalog', help='Import and maintain the product catalog.')
+
+
+def _progress_path(path):
+    return f'{path}.progress.json'
+
+
+def _fingerprint(path):
+    stat = os.stat(path)
+    return {'file': os.path.abspath(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+
+
+@catalog_cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults to the file extension.')
+@click.option('--chunk-size', default=1000, show_default=True, help='Rows per transaction.')
+@click.option('--resume/--no-resume', default=True, show_default=True,
+              help='Continue from the progress file of an interrupted run.')
+def import_command(path, fmt, chunk_size, resume):
+    """Upsert products by SKU from a CSV or JSONL file"""
+    fmt = fmt or detect_format(path)
+    if fmt is None:
+        raise click.UsageError('Cannot tell the format from the file name; pass --format')
+
+    progress_path = _progress_path(path)
+    fingerprint = _fingerprint(path)
+    start_line = 0
+    if resume and os.path.exists(progress_path):
+        with open(progress_path) as f:
+            saved = json.load(f)
+        if {key: saved.get(key) for key in fingerprint} == fingerprint:
+            start_line = saved['line']
+            click.echo(f'Resuming after line {start_line}')
+        else:
+            click.echo('Input changed since the last run; starting over')
+
+    def on_chunk(report):
+        with open(progress_path, 'w') as f:
+            json.dump({**fingerprint, 'line': report.last_line}, f)
+        click.echo(
+            f'  line {report.last_line}: {report.inserted} inserted, {report.updated} updated, '
+            f'{report.invalid} invalid ({report.rows_per_s:.0f} rows/s)'
+        )
+
+    try:
+        with open(path, newline='', encoding='utf-8-sig') as stream:
+            report = import_products(stream, fmt, chunk_size, start_line, on_chunk=on_chunk)
+    except InvalidImportFile as e:
+        raise click.ClickException(str(e))
+
+    if os.path.exists(progress_path):
+        os.remove(progress_path)
+    click.echo(
+        f'Imported {report.rows} rows in {report.elapsed:.2f}s ({report.rows_per_s:.0f} rows/s): '
+        f'{report.inserted} inserted, {report.updated} updated, '
+        f'{report.unchanged} unchanged, {report.invalid} invalid'
+    )
+    for error in report.errors:
+        click.echo(f'  line {error["line"]}: {error["error"]}', err=True)
@@ -0,0 +1,251 @@
+"""In-memory catalog index
+
+With ``CATALOG_INDEX_ENABLED`` each worker answers ``GET /api/products``
+without ``search`` from ``CatalogIndex``: filtering by category, price range
+and stock, sorting and paginating happen in memory. Only the rows of the page
+being returned are read from the database, by primary key.
+
+The index keeps compact column arrays (price, rating, stock, created_at and
+a category code) indexed by slot, plus, for every sort column, permutations
+of the slots sorted by ``(value, id)``: one over the whole catalog and one
+per category. A category filter picks a permutation, a price range on the
+price order is a bisected slice, and other filters are one pass over the
+permutation whose result is kept until the next change. Descending orders
+walk the permutations backwards, so pages and keyset cursors match the SQL
+path's ``(value, id)`` order exactly.
+
+As a ``ProductMirror`` the index is loaded once and then refreshed
+incrementally: a changed product is unlinked from its permutations and
+re-inserted at its new position.
+"""
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+
+from app.mirror import ProductMirror
+
+SORT_COLUMNS = ('price', 'rating', 'created_at')
+
+_EPOCH = datetime(1970, 1, 1)
+_MICROSECOND = timedelta(microseconds=1)
+
+
+def _timestamp(value):
+    return (value - _EPOCH) // _MICROSECOND if value else 0
+
+
+class CatalogIndex(ProductMirror):
+    """Column arrays and presorted permutations of the active catalog"""
+
+    columns = ('category', 'price', 'stock', 'rating', 'created_at')
+    fields = frozenset({'category', 'price', 'stock', 'rating', 'created_at', 'is_active'})
+
+    def __init__(self, refresh_interval=5.0, max_results=32):
+        self.max_results = max_results
+        self._results = OrderedDict()  # filters -> matching slots, until the next change
+        super().__init__(refresh_interval)
+
+    def _reset(self):
+        self._slots = {}        # product_id -> slot
+        self._ids = []          # slot -> product_id (None once freed)
+        self._free = []
+        self._price = array('q')
+        self._rating = array('d')
+        self._stock = array('q')
+        self._created = array('q')  # microseconds since the epoch
+        self._category = array('l')
+        self._codes = {}        # category -> code
+        # sort column -> category code (None for all) -> slots by (value, id)
+        self._orders = {column: {None: array('l')} for column in SORT_COLUMNS}
+        self._results.clear()
+
+    def _values(self, column):
+        return {'price': self._price, 'rating': self._rating, 'created_at': self._created}[column]
+
+    def _key(self, column):
+        values, ids = self._values(column), self._ids
+        return lambda slot: (values[slot], ids[slot])
+
+    def _code(self, category):
+        code = self._codes.get(category)
+        if code is None:
+            code = self._codes[category] = len(self._codes)
+            for orders in self._orders.values():
+                orders[code] = array('l')
+        return code
+
+    def _row_values(self, row):
+        return (row.price or 0, float(row.rating or 0), row.stock or 0,
+                _timestamp(row.created_at), self._code(row.category))
+
+    def _slot_values(self, slot):
+        return (self._price[slot], self._rating[slot], self._stock[slot],
+                self._created[slot], self._category[slot])
+
+    def _store(self, slot, values):
+        (self._price[slot], self._rating[slot], self._stock[slot],
+         self._created[slot], self._category[slot]) = values
+
+    def _allocate(self, product_id):
+        if self._free:
+            slot = self._free.pop()
+            self._ids[slot] = product_id
+        else:
+            slot = len(self._ids)
+            self._ids.append(product_id)
+            for column in (self._price, self._rating, self._stock, self._created, self._category):
+                column.append(0)
+        self._slots[product_id] = slot
+        return slot
+
+    def _link(self, slot):
+        for column, orders in self._orders.items():
+            key = self._key(column)
+            insort(orders[None], slot, key=key)
+            insort(orders[self._category[slot]], slot, key=key)
+
+    def _unlink(self, slot):
+        for column, orders in self._orders.items():
+            key = self._key(column)
+            target = key(slot)
+            for order in (orders[None], orders[self._category[slot]]):
+                del order[bisect_left(order, target, key=key)]
+
+    def _apply(self, product_id, row):
+        """Move a product to its current position in every order"""
+        slot = self._slots.get(product_id)
+        values = self._row_values(row) if row is not None else None
+        if slot is not None:
+            if values == self._slot_values(slot):
+                return
+            self._unlink(slot)
+            if values is None:
+                del self._slots[product_id]
+                self._ids[slot] = None
+                self._free.append(slot)
+        if values is not None:
+            if slot is None:
+                slot = self._allocate(product_id)
+            self._store(slot, values)
+            self._link(slot)
+        self._results.clear()
+
+    def _load(self, rows):
+        # Fill the columns first and sort once; inserting row by row is quadratic
+        for row in rows:
+            self._store(self._allocate(row.id), self._row_values(row))
+        by_category = {}
+        for slot in range(len(self._ids)):
+            by_category.setdefault(self._category[slot], []).append(slot)
+        for column, orders in self._orders.items():
+            key = self._key(column)
+            orders[None] = array('l', sorted(range(len(self._ids)), key=key))
+            for code, slots in by_category.items():
+                orders[code] = array('l', sorted(slots, key=key))
+
+    # Querying
+
+    def _matches(self, column, category=None, min_price=None, max_price=None, in_stock=False):
+        """Slots passing the filters, in ascending ``(value, id)`` order"""
+        if category is None:
+            order = self._orders[column][None]
+        elif category in self._codes:
+            order = self._orders[column][self._codes[category]]
+        else:
+            return ()
+        if min_price is None and max_price is None and not in_stock:
+            return order
+
+        filters = (column, category, min_price, max_price, in_stock)
+        matches = self._results.get(filters)
+        if matches is not None:
+            self._results.move_to_end(filters)
+            return matches
+
+        price, stock = self._price, self._stock
+        if column == 'price':
+            # Already ordered by price: the range is a slice
+            start = 0 if min_price is None else bisect_left(order, min_price, key=price.__getitem__)
+            end = len(order) if max_price is None else bisect_right(order, max_price, key=price.__getitem__)
+            matches = order[start:end]
+            if in_stock:
+                matches = array('l', [slot for slot in matches if stock[slot] > 0])
+        else:
+            low = float('-inf') if min_price is None else min_price
+            high = float('inf') if max_price is None else max_price
+            matches = array('l', [
+                slot for slot in order
+                if low <= price[slot] <= high and (not in_stock or stock[slot] > 0)
+            ])
+
+        self._results[filters] = matches
+        while len(self._results) > self.max_results:
+            self._results.popitem(last=False)
+        return matches
+
+    def _sort_value(self, column, slot):
+        value = self._values(column)[slot]
+        return _EPOCH + value * _MICROSECOND if column == 'created_at' else value
+
+    def _product_ids(self, matches, descending, start, end):
+        total = len(matches)
+        if descending:
+            slots = matches[max(total - end, 0):max(total - start, 0)][::-1]
+        else:
+            slots = matches[start:end]
+        return [self._ids[slot] for slot in slots]
+
+    def page(self, column, descending, page, per_page, **filters):
+        """``(product ids, total)`` of a page-numbered listing
+
+        ``filters`` are ``category``, ``min_price``, ``max_price`` and
+        ``in_stock``; rows are ordered by ``(column, id)``.
+        """
+        with self._lock:
+            matches = self._matches(column, **filters)
+            start = (page - 1) * per_page
+            return self._product_ids(matches, descending, start, start + per_page), len(matches)
+
+    def keyset_page(self, column, descending, after, per_page, **filters):
+        """``(product ids, last row's sort values, total)`` of the page after ``after``
+
+        ``after`` is the ``(value, id)`` of the previous page's last row, as
+        decoded from a keyset cursor, or None for the first page. The sort
+        values are None on the last page.
+        """
+        with self._lock:
+            matches = self._matches(column, **filters)
+            total = len(matches)
+            start = 0
+            if after is not None:
+                value, product_id = after
+                if column == 'created_at':
+                    value = _timestamp(value)
+                target = (value if value is not None else 0, product_id)
+                key = self._key(column)
+                if descending:
+                    start = total - bisect_left(matches, target, key=key)
+                else:
+                    start = bisect_right(matches, target, key=key)
+            product_ids = self._product_ids(matches, descending, start, start + per_page)
+            if not product_ids or start + per_page >= total:
+                return product_ids, None, total
+            last = self._sort_value(column, self._slots[product_ids[-1]])
+            return product_ids, [last, product_ids[-1]], total
+
+
+def init_catalog_index(app):
+    """Create the catalog index for ``app`` when ``CATALOG_INDEX_ENABLED``"""
+    index = None
+    if app.config.get('CATALOG_INDEX_ENABLED', False):
+        index = CatalogIndex(refresh_interval=app.config.get('CATALOG_INDEX_REFRESH_INTERVAL', 5.0))
+    app.extensions['catalog_index'] = index
+    return index
+
+
+def get_catalog_index():
+    """Catalog index of the current app, or None when it is disabled"""
+    return current_app.extensions.get('catalog_index')
@@ -0,0 +1,102 @@
+"""Conditional GET (ETag / Last-Modified)
+
+``@conditional(validator)`` gives a GET view strong ETags and
+``Last-Modified`` without building the body. ``validator(**view_args)``
+returns a tuple of cheap facts that change whenever the response would
+(usually ``updated_at`` values fetched by primary key or an indexed
+``MAX``), or None when there is nothing to validate (e.g. the resource does
+not exist). The ETag is a hash of those facts, the request path and query
+string and the JSON encoding in use; ``Last-Modified`` is the newest datetime
+among them.
+
+A request whose ``If-None-Match`` (or, without it, ``If-Modified-Since``)
+still matches gets a 304 straight away, before the view runs its queries.
+The ETag is also available to the view as ``g.etag`` (the response cache
+keys on it, so a cached body always matches the ETag it is sent with).
+
+Public responses are sent with ``Cache-Control: public, max-age=<HTTP_CACHE_MAX_AGE>,
+must-revalidate``; private ones (per-user data) with ``private, no-cache``
+and ``Vary: Authorization`` so shared caches never store them.
+"""
+import hashlib
+from datetime import datetime
+from functools import wraps
+
+from flask import current_app, g, request
+
+
+def _etag(parts):
+    args = '&'.join(f'{name}={value}' for name, value in sorted(request.args.items(multi=True)))
+    representation = (current_app.extensions.get('json_backend'), current_app.debug)
+    raw = repr((request.path, args, representation, parts)).encode()
+    return hashlib.sha1(raw).hexdigest()
+
+
+def _last_modified(parts):
+    stamps = [part for part in parts if isinstance(part, datetime)]
+    return max(stamps) if stamps else None
+
+
+def _not_modified(etag, last_modified):
+    if request.if_none_match:
+        return request.if_none_match.contains(etag)
+    since = request.if_modified_since
+    if since and last_modified:
+        # HTTP dates have whole-second resolution
+        return last_modified.replace(microsecond=0) <= since.replace(tzinfo=None)
+    return False
+
+
+def _set_validators(response, etag, last_modified, private):
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    if private:
+        response.headers['Cache-Control'] = 'private, no-cache'
+        response.vary.add('Authorization')
+    else:
+        max_age = current_app.config.get('HTTP_CACHE_MAX_AGE', 0)
+        response.headers['Cache-Control'] = f'public, max-age={max_age}, must-revalidate'
+    return response
+
+
+def evaluate(parts, private=False):
+    """A 304 response when the client's copy matches ``parts``, else None
+
+    When the view has to run, its ETag is left in ``g.etag`` for the
+    response cache and for ``add_validators()``.
+    """
+    etag = _etag(parts)
+    last_modified = _last_modified(parts)
+    if _not_modified(etag, last_modified):
+        response = current_app.response_class(status=304)
+        return _set_validators(response, etag, last_modified, private)
+
+    g.etag = etag
+    g.last_modified = last_modified
+    return None
+
+
+def add_validators(response, private=False):
+    """Send the validators ``evaluate()`` computed with a successful response"""
+    if response.status_code == 200 and g.get('etag'):
+        _set_validators(response, g.etag, g.last_modified, private)
+    return response
+
+
+def conditional(validator, private=False):
+    """Answer conditional GETs for a view from ``validator(**view_args)``"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            parts = validator(**kwargs)
+            if parts is None:
+                return view(*args, **kwargs)
+
+            not_modified = evaluate(parts, private)
+            if not_modified is not None:
+                return not_modified
+            response = current_app.make_response(view(*args, **kwargs))
+            return add_validators(response, private)
+        return wrapper
+    return decorator
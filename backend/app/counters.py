@@ -0,0 +1,165 @@
+"""Write-behind counters
+
+Hot, blind increments (review "helpful" votes, view counts, ...) are
+buffered in memory per worker and written as aggregated deltas with
+``UPDATE ... SET col = col + :delta`` in one transaction per flush. A
+background thread flushes every ``COUNTER_FLUSH_INTERVAL`` seconds, earlier
+once ``COUNTER_MAX_PENDING`` keys are waiting, and once more at interpreter
+exit. Deltas from a failed flush are put back and retried on the next one.
+Increments are buffered per application, so each flush writes them through
+the engine of the app that recorded them.
+
+Register a counter once with the model column it feeds::
+
+    counters.register('review_helpful', Review.helpful_count)
+    counters.increment('review_helpful', review.id)
+
+A counter write is not an edit: ``updated_at`` of the counted rows is left
+alone. Validators that must see the counter move read a rollup instead:
+``rollup=(Product.helpful_votes, Review.product_id)`` also adds the deltas to
+the parent row each counted row points to, in the same transaction.
+"""
+import atexit
+import os
+import threading
+
+from flask import current_app
+from sqlalchemy import bindparam, select, update
+
+from app import db
+
+
+class CounterBuffer:
+    """Per-worker buffer of counter increments flushed in batches"""
+
+    def __init__(self, app=None):
+        self.flush_interval = 2.0
+        self.max_pending = 1000
+        self._columns = {}
+        self._rollups = {}
+        self._pending = {}  # app -> {counter name: {row id: delta}}
+        self._exit_hook = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.flush_interval = app.config.get('COUNTER_FLUSH_INTERVAL', 2.0)
+        self.max_pending = app.config.get('COUNTER_MAX_PENDING', 1000)
+        app.extensions['counters'] = self
+        if not self._exit_hook:
+            atexit.register(self.flush)
+            self._exit_hook = True
+
+    def register(self, name, attribute, rollup=None):
+        """Declare counter ``name`` as increments of an integer model column
+
+        ``rollup`` is ``(parent column, foreign key)``: the deltas are also
+        added to that column of the row the foreign key points to.
+        """
+        self._columns[name] = attribute.property.columns[0]
+        if rollup is not None:
+            column, foreign_key = rollup
+            self._rollups[name] = (column.property.columns[0], foreign_key.property.columns[0])
+
+    def increment(self, name, key, amount=1):
+        """Buffer ``amount`` for row ``key`` of counter ``name``"""
+        if name not in self._columns:
+            raise KeyError(f'Unknown counter: {name}')
+        self._ensure_flusher()
+        app = current_app._get_current_object()
+        with self._lock:
+            deltas = self._pending.setdefault(app, {}).setdefault(name, {})
+            deltas[key] = deltas.get(key, 0) + amount
+            pending = sum(len(d) for buffered in self._pending.values() for d in buffered.values())
+        if pending >= self.max_pending:
+            self._wakeup.set()
+
+    def pending(self, name, key):
+        """Increments for ``key`` not yet written to the database"""
+        with self._lock:
+            return self._pending.get(current_app._get_current_object(), {}).get(name, {}).get(key, 0)
+
+    def flush(self):
+        """Write all buffered deltas; returns the number of rows updated"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        return sum(self._flush_app(app, buffered) for app, buffered in pending.items())
+
+    def _flush_app(self, app, pending):
+        try:
+            with app.app_context():
+                with db.engine.begin() as conn:
+                    for name, deltas in pending.items():
+                        column = self._columns[name]
+                        # Sorted keys keep row lock order stable across workers
+                        conn.execute(_increment_statement(column), [
+                            {'row_id': key, 'delta': delta}
+                            for key, delta in sorted(deltas.items())
+                        ])
+                        if name in self._rollups:
+                            self._flush_rollup(conn, column.table, self._rollups[name], deltas)
+        except Exception:
+            self._restore(app, pending)
+            app.logger.exception('Counter flush failed; deltas kept for retry')
+            return 0
+        return sum(len(deltas) for deltas in pending.values())
+
+    def _flush_rollup(self, conn, table, rollup, deltas):
+        column, foreign_key = rollup
+        parents = dict(conn.execute(
+            select(table.c.id, foreign_key).where(table.c.id.in_(list(deltas)))
+        ).all())
+        totals = {}
+        for key, delta in deltas.items():
+            if parents.get(key) is not None:
+                totals[parents[key]] = totals.get(parents[key], 0) + delta
+        if totals:
+            conn.execute(_increment_statement(column), [
+                {'row_id': key, 'delta': delta} for key, delta in sorted(totals.items())
+            ])
+
+    def _restore(self, app, pending):
+        with self._lock:
+            buffered = self._pending.setdefault(app, {})
+            for name, deltas in pending.items():
+                current = buffered.setdefault(name, {})
+                for key, delta in deltas.items():
+                    current[key] = current.get(key, 0) + delta
+
+    def _ensure_flusher(self):
+        # Started lazily and per process, so it also runs in forked workers
+        if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None and self._thread.is_alive():
+                return
+            if self._pid is not None and self._pid != os.getpid():
+                # Forked: the parent still owns (and flushes) what it buffered
+                self._pending = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target=self._run, name='counter-flusher', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+
+def _increment_statement(column):
+    table = column.table
+    values = {column.key: column + bindparam('delta')}
+    if 'updated_at' in table.c:
+        # Not an edit: keep the column's onupdate from stamping the row
+        values['updated_at'] = table.c.updated_at
+    return update(table).where(table.c.id == bindparam('row_id')).values(values)
+
+
+counters = CounterBuffer()
@@ -0,0 +1,174 @@
+"""Catalog facets
+
+``GET /api/products/facets`` reports, for the active catalog, product and
+in-stock counts per category and price/rating histograms, honouring the same
+``search`` and ``category`` filters as ``GET /api/products``.
+
+The counts come from ``CatalogSummary``, a per-worker structure that keeps
+each active product's facet values (category, price bucket, rating bucket,
+in stock) and running totals per category. As a ``ProductMirror`` it is
+loaded once and then updated incrementally: a changed product (admin edits,
+batch updates, imports, checkout stock changes, ratings) has its old
+contribution swapped for the new one. Writes made by other workers are
+caught up within ``FACETS_REFRESH_INTERVAL`` seconds, or as soon as the
+catalog validator shows them.
+
+Unfiltered and per-category facets never aggregate the products table; with
+``search`` the facets are counted over the search backend's matches.
+"""
+from bisect import bisect_right
+
+from flask import current_app
+
+from app.mirror import ProductMirror
+
+# Rating histogram: [0, 1), [1, 2), ... [4, 5]
+RATING_EDGES = (0, 1, 2, 3, 4)
+
+
+def parse_price_buckets(value):
+    """Ascending bucket lower bounds from ``"0,1000,2500"``"""
+    edges = sorted({int(edge) for edge in str(value).split(',') if edge.strip()})
+    if not edges:
+        raise ValueError('FACETS_PRICE_BUCKETS needs at least one bound')
+    return tuple(edges)
+
+
+def _bucket(edges, value):
+    # Values below the first bound count in the first bucket
+    return max(bisect_right(edges, value or 0) - 1, 0)
+
+
+class _Counts:
+    """Product, in-stock and histogram counts for one category"""
+
+    __slots__ = ('products', 'in_stock', 'price', 'rating')
+
+    def __init__(self, price_buckets, rating_buckets):
+        self.products = 0
+        self.in_stock = 0
+        self.price = [0] * price_buckets
+        self.rating = [0] * rating_buckets
+
+    def add(self, entry, sign=1):
+        _, price, rating, in_stock = entry
+        self.products += sign
+        self.in_stock += sign if in_stock else 0
+        self.price[price] += sign
+        self.rating[rating] += sign
+
+    def merge(self, other):
+        self.products += other.products
+        self.in_stock += other.in_stock
+        self.price = [a + b for a, b in zip(self.price, other.price)]
+        self.rating = [a + b for a, b in zip(self.rating, other.rating)]
+
+
+class CatalogSummary(ProductMirror):
+    """Incrementally maintained facet counts of the active catalog"""
+
+    columns = ('category', 'price', 'stock', 'rating')
+    fields = frozenset({'category', 'price', 'stock', 'rating', 'is_active'})
+
+    def __init__(self, price_edges=(0,), refresh_interval=5.0):
+        self.price_edges = tuple(price_edges)
+        super().__init__(refresh_interval)
+
+    def _reset(self):
+        self._entries = {}      # product_id -> (category, price bucket, rating bucket, in stock)
+        self._categories = {}   # category -> _Counts
+
+    def _new_counts(self):
+        return _Counts(len(self.price_edges), len(RATING_EDGES))
+
+    def _apply(self, product_id, row):
+        """Swap a product's contribution for its current one"""
+        entry = None
+        if row is not None:
+            entry = (
+                row.category,
+                _bucket(self.price_edges, row.price),
+                _bucket(RATING_EDGES, row.rating),
+                (row.stock or 0) > 0,
+            )
+        old = self._entries.pop(product_id, None)
+        if old == entry:
+            if entry is not None:
+                self._entries[product_id] = entry
+            return
+        if old is not None:
+            counts = self._categories[old[0]]
+            counts.add(old, -1)
+            if not counts.products:
+                del self._categories[old[0]]
+        if entry is not None:
+            self._entries[product_id] = entry
+            counts = self._categories.get(entry[0])
+            if counts is None:
+                counts = self._categories[entry[0]] = self._new_counts()
+            counts.add(entry)
+
+    # Querying
+
+    def _histogram(self, edges, counts):
+        buckets = []
+        for index, lower in enumerate(edges):
+            upper = edges[index + 1] if index + 1 < len(edges) else None
+            buckets.append({'min': lower, 'max': upper, 'count': counts[index]})
+        return buckets
+
+    def _result(self, per_category, category=None):
+        selected = self._new_counts()
+        for name, counts in per_category.items():
+            if category is None or name == category:
+                selected.merge(counts)
+
+        rating = self._histogram(RATING_EDGES, selected.rating)
+        rating[-1]['max'] = 5  # the top bucket includes 5
+        return {
+            'total': selected.products,
+            'in_stock': selected.in_stock,
+            # Counted before the category filter, so the other categories stay selectable
+            'categories': [
+                {'category': name, 'count': counts.products, 'in_stock': counts.in_stock}
+                for name, counts in sorted(per_category.items(), key=lambda item: (-item[1].products, item[0]))
+            ],
+            'price': self._histogram(self.price_edges, selected.price),
+            'rating': rating,
+        }
+
+    def facets(self, category=None, product_ids=None):
+        """Facet counts for the active catalog, or for ``product_ids`` only
+
+        ``category`` narrows the totals and histograms but not the
+        per-category counts.
+        """
+        with self._lock:
+            if product_ids is None:
+                return self._result(self._categories, category)
+
+            per_category = {}
+            for product_id in product_ids:
+                entry = self._entries.get(product_id)
+                if entry is None:
+                    continue
+                counts = per_category.get(entry[0])
+                if counts is None:
+                    counts = per_category[entry[0]] = self._new_counts()
+                counts.add(entry)
+            return self._result(per_category, category)
+
+
+def init_facets(app):
+    """Create the catalog summary for ``app``"""
+    summary = CatalogSummary(
+        price_edges=parse_price_buckets(app.config.get('FACETS_PRICE_BUCKETS', '0')),
+        refresh_interval=app.config.get('FACETS_REFRESH_INTERVAL', 5.0)
+    )
+    app.extensions['facets'] = summary
+    return summary
+
+
+def get_catalog_summary():
+    """Catalog summary of the current app"""
+    return current_app.extensions['facets']
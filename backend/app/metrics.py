@@ -0,0 +1,399 @@
+"""Request metrics
+
+Every request is recorded per endpoint, method and status code: a latency
+histogram, the SQL statements it issued and the time spent in them (counted
+with SQLAlchemy engine events), request and response body sizes, plus the
+number of requests in flight. ``GET /metrics`` renders them in the
+Prometheus text format for scrapers presenting ``METRICS_TOKEN`` as a bearer
+token, or, without a token configured, for loopback clients only.
+
+Recording is a few dictionary updates under a lock, cheap enough to leave on
+in production. With ``METRICS_DIR`` set, each worker also writes a snapshot
+of its own numbers to ``<METRICS_DIR>/metrics-<pid>.json`` every
+``METRICS_SYNC_INTERVAL`` seconds and ``/metrics`` sums the snapshots of all
+workers, so any gunicorn worker answers for the whole pod. A worker that
+exits folds its counters into ``metrics-retired.json`` and removes its
+snapshot; the snapshot of a worker that died without exiting cleanly
+(SIGKILL, OOM) is folded in by the next reader. Totals therefore never go
+backwards and the directory does not grow with worker restarts. A worker
+whose snapshot was not refreshed for ``STALE_INTERVALS`` sync intervals
+(hung) keeps its counters in the sum; only its in-flight gauge is dropped.
+"""
+import atexit
+import contextlib
+import contextvars
+import hmac
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+
+from flask import Response, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Upper bounds of the latency buckets, in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Positions in a series entry
+COUNT, SECONDS, STATEMENTS, DB_SECONDS, REQUEST_BYTES, RESPONSE_BYTES, HISTOGRAM = range(7)
+
+# Snapshots older than this many sync intervals belong to no live worker
+STALE_INTERVALS = 10
+
+RETIRED_SNAPSHOT = 'metrics-retired.json'
+
+# Per request; a context variable so concurrent asyncio requests stay apart
+_current = contextvars.ContextVar('metrics_request', default=None)
+_listening = False
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _current.get()
+    if state is not None:
+        state['statement_started'] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    state = _current.get()
+    if state is not None:
+        state['statements'] += 1
+        state['db_seconds'] += time.perf_counter() - state['statement_started']
+
+
+def _listen_to_engines():
+    # Class-level listeners cover every engine (and replica) once per process
+    global _listening
+    if not _listening:
+        event.listen(Engine, 'before_cursor_execute', _before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', _after_cursor_execute)
+        _listening = True
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _new_series():
+    return [0, 0.0, 0, 0.0, 0, 0, [0] * (len(BUCKETS) + 1)]
+
+
+class RequestMetrics:
+    """Per-worker request metrics with optional cross-worker aggregation"""
+
+    def __init__(self, app=None):
+        self.directory = None
+        self.sync_interval = 1.0
+        self.token = None
+        self._series = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._thread = None
+        self._pid = None
+        self._retired = False
+        self._published = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['metrics'] = self
+        if not app.config.get('METRICS_ENABLED', True):
+            return
+        self.directory = app.config.get('METRICS_DIR') or None
+        self.sync_interval = app.config.get('METRICS_SYNC_INTERVAL', 1.0)
+        self.token = app.config.get('METRICS_TOKEN') or None
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+            atexit.register(self.retire)
+
+        _listen_to_engines()
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._record)
+        app.add_url_rule('/metrics', 'metrics', self._render_response, methods=['GET'])
+
+    def _start(self):
+        if self._pid != os.getpid():
+            self._forked()
+        _current.set({
+            'started': time.perf_counter(),
+            'statements': 0,
+            'db_seconds': 0.0,
+            'statement_started': 0.0,
+            'status': 500,
+            'response_bytes': 0,
+        })
+        with self._lock:
+            self._in_flight += 1
+
+    def _finish(self, response):
+        state = _current.get()
+        if state is not None:
+            state['status'] = response.status_code
+            state['response_bytes'] = response.content_length or 0
+        return response
+
+    def _record(self, exc=None):
+        state = _current.get()
+        if state is None:
+            return
+        _current.set(None)
+        duration = time.perf_counter() - state['started']
+        key = (request.endpoint or 'unmatched', request.method, state['status'])
+
+        with self._lock:
+            self._in_flight -= 1
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = _new_series()
+            series[COUNT] += 1
+            series[SECONDS] += duration
+            series[STATEMENTS] += state['statements']
+            series[DB_SECONDS] += state['db_seconds']
+            series[REQUEST_BYTES] += request.content_length or 0
+            series[RESPONSE_BYTES] += state['response_bytes']
+            series[HISTOGRAM][bisect_left(BUCKETS, duration)] += 1
+            self._dirty = True
+
+        if self.directory:
+            self._ensure_writer()
+
+    def snapshot(self):
+        """This worker's series and in-flight count"""
+        with self._lock:
+            return {
+                'series': {key: [*values[:HISTOGRAM], list(values[HISTOGRAM])]
+                           for key, values in self._series.items()},
+                'in_flight': self._in_flight,
+            }
+
+    def collect(self):
+        """Series and in-flight count summed over every worker"""
+        own = self.snapshot()
+        if not self.directory:
+            return own
+
+        series, in_flight = own['series'], own['in_flight']
+        with self._directory_lock():
+            snapshots = list(self._read_snapshots())
+        for pid, worker, fresh in snapshots:
+            if pid == os.getpid():
+                continue
+            if fresh:
+                in_flight += worker['in_flight']
+            _add_series(series, worker['series'])
+        return {'series': series, 'in_flight': in_flight}
+
+    def render(self):
+        """Prometheus text exposition of ``collect()``"""
+        collected = self.collect()
+        series = sorted(collected['series'].items())
+        lines = [
+            '# HELP http_requests_in_flight Requests currently being served',
+            '# TYPE http_requests_in_flight gauge',
+            f"http_requests_in_flight {collected['in_flight']}",
+            '# HELP http_request_duration_seconds Request latency',
+            '# TYPE http_request_duration_seconds histogram',
+        ]
+        for (endpoint, method, status), values in series:
+            labels = f'endpoint="{_label(endpoint)}",method="{method}",status="{status}"'
+            cumulative = 0
+            for bound, count in zip((*BUCKETS, '+Inf'), values[HISTOGRAM]):
+                cumulative += count
+                lines.append(f'http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'http_request_duration_seconds_sum{{{labels}}} {values[SECONDS]:.6f}')
+            lines.append(f'http_request_duration_seconds_count{{{labels}}} {values[COUNT]}')
+
+        for name, position, help_text in (
+            ('http_request_db_statements_total', STATEMENTS, 'SQL statements issued by requests'),
+            ('http_request_db_seconds_total', DB_SECONDS, 'Time requests spent executing SQL'),
+            ('http_request_size_bytes_total', REQUEST_BYTES, 'Request body bytes received'),
+            ('http_response_size_bytes_total', RESPONSE_BYTES, 'Response body bytes sent'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} counter')
+            for (endpoint, method, status), values in series:
+                labels = f'endpoint="{_label(endpoint)}",method="{method}",status="{status}"'
+                value = values[position]
+                lines.append(f'{name}{{{labels}}} {value:.6f}' if isinstance(value, float)
+                             else f'{name}{{{labels}}} {value}')
+        return '\n'.join(lines) + '\n'
+
+    def _render_response(self):
+        if not self._scrape_allowed():
+            return jsonify({'error': 'Metrics access denied'}), 403
+        return Response(self.render(), mimetype='text/plain; version=0.0.4')
+
+    def _scrape_allowed(self):
+        # Endpoint names, traffic and error rates are not for the public API
+        if self.token:
+            supplied = request.headers.get('Authorization', '')
+            return hmac.compare_digest(supplied.encode(), f'Bearer {self.token}'.encode())
+        return request.remote_addr in ('127.0.0.1', '::1')
+
+    def write_snapshot(self):
+        """Publish this worker's numbers to ``METRICS_DIR``"""
+        path = self._snapshot_path()
+        with self._lock:
+            if self._retired:
+                return
+            dirty, self._dirty = self._dirty, False
+            first, self._published = not self._published, True
+        if first and os.path.exists(path):
+            # Left by an earlier process with the same pid; keep its counts
+            with self._directory_lock():
+                self._retire_snapshot(path)
+        if not dirty:
+            # Unchanged; refresh it so readers can tell an idle worker from a hung one
+            os.utime(path)
+            return
+        snapshot = self.snapshot()
+        _write_json(path, {
+            'in_flight': snapshot['in_flight'],
+            'series': [[*key, *values] for key, values in snapshot['series'].items()],
+        })
+
+    def retire(self):
+        """Fold this worker's counters into the retired totals (at exit)"""
+        # Only a process that served requests has numbers (and a snapshot) of its own
+        if not self.directory or self._pid != os.getpid():
+            return
+        with self._lock:
+            self._retired = True
+        snapshot = self.snapshot()
+        with self._directory_lock():
+            self._add_retired([[*key, *values] for key, values in snapshot['series'].items()])
+            with contextlib.suppress(OSError):
+                os.remove(self._snapshot_path())
+
+    def _snapshot_path(self):
+        return os.path.join(self.directory, f'metrics-{os.getpid()}.json')
+
+    def _add_retired(self, rows):
+        # Under _directory_lock()
+        path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+        try:
+            with open(path) as f:
+                retired = json.load(f)
+        except (ValueError, OSError):
+            retired = {'series': []}
+        series = {}
+        _add_series(series, retired['series'])
+        _add_series(series, rows)
+        _write_json(path, {
+            'in_flight': 0,
+            'series': [[*key, *values] for key, values in series.items()],
+        })
+
+    def _retire_snapshot(self, path):
+        # Under _directory_lock(): fold another process's snapshot and drop it
+        try:
+            with open(path) as f:
+                rows = json.load(f)['series']
+        except (ValueError, OSError):
+            rows = []
+        self._add_retired(rows)
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+    @contextlib.contextmanager
+    def _directory_lock(self):
+        # Keeps readers from seeing a retiring worker both folded and not
+        import fcntl  # POSIX only, like the gunicorn deployments that set METRICS_DIR
+
+        with open(os.path.join(self.directory, 'metrics.lock'), 'a') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def _worker_snapshots(self):
+        for name in os.listdir(self.directory):
+            if name.startswith('metrics-') and name.endswith('.json') and name != RETIRED_SNAPSHOT:
+                try:
+                    yield int(name[len('metrics-'):-len('.json')]), os.path.join(self.directory, name)
+                except ValueError:
+                    continue
+
+    def _read_snapshots(self):
+        """``(pid, snapshot, fresh)`` of each worker, pid None for the retired totals
+
+        Call under ``_directory_lock()``. Snapshots of workers that died without
+        retiring (SIGKILL, OOM, gunicorn's timeout) are folded into the retired
+        totals first. A live worker whose snapshot is stale (hung) still counts;
+        only its in-flight gauge is out of date.
+        """
+        for pid, path in list(self._worker_snapshots()):
+            if pid != os.getpid() and not _alive(pid):
+                self._retire_snapshot(path)
+
+        stale_before = time.time() - STALE_INTERVALS * self.sync_interval
+        retired = (None, os.path.join(self.directory, RETIRED_SNAPSHOT))
+        for pid, path in [retired, *self._worker_snapshots()]:
+            try:
+                fresh = pid is not None and os.stat(path).st_mtime >= stale_before
+                with open(path) as f:
+                    yield pid, json.load(f), fresh
+            except (ValueError, OSError):
+                continue
+
+    def _forked(self):
+        # A forked worker starts empty: the parent reports its own requests
+        with self._lock:
+            if self._pid != os.getpid():
+                if self._pid is not None:
+                    self._series = {}
+                    self._in_flight = 0
+                    self._thread = None
+                    self._published = False
+                self._pid = os.getpid()
+
+    def _ensure_writer(self):
+        # One writer thread per process
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(
+                target=self._run, name='metrics-writer', daemon=True
+            )
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.write_snapshot()
+            except OSError:
+                pass
+
+
+def _add_series(totals, rows):
+    """Add snapshot ``rows`` (``[endpoint, method, status, *values]``) to ``totals``"""
+    for endpoint, method, status, *values in rows:
+        total = totals.setdefault((endpoint, method, status), _new_series())
+        for position in range(HISTOGRAM):
+            total[position] += values[position]
+        for bucket, count in enumerate(values[HISTOGRAM]):
+            total[HISTOGRAM][bucket] += count
+
+
+def _write_json(path, payload):
+    temporary = f'{path}.tmp'
+    with open(temporary, 'w') as f:
+        json.dump(payload, f)
+    os.replace(temporary, path)
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+metrics = RequestMetrics()
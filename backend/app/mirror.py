@@ -0,0 +1,138 @@
+"""Per-worker mirrors of the products table
+
+``ProductMirror`` is the base of in-memory structures derived from product
+rows (catalog facets, the catalog index). A mirror loads every active
+product once and then keeps up incrementally, like the in-memory search
+index: products announced by the ``products_changed`` signal are re-read by
+id, and rows with a newer ``updated_at`` are picked up so writes made by
+other workers show. That catch-up runs when the caller knows the catalog has
+changed since the mirror last looked (the ``catalog_version`` counter behind
+the catalog validator), and at least every ``refresh_interval`` seconds.
+
+Mirrors always read from the primary; a lagging replica would freeze stale
+rows into them. Subclasses name the columns and fields they depend on and
+implement ``_reset()`` and ``_apply()``.
+"""
+import threading
+import time
+from datetime import timedelta
+
+from sqlalchemy import func, select
+
+from app import db
+from app.signals import products_changed
+
+# Writes by other workers stamped slightly behind the watermark (clock skew)
+# are still picked up by the next catch-up
+CATCH_UP_OVERLAP = timedelta(seconds=5)
+
+
+class ProductMirror:
+    """Base class for in-memory structures kept in step with products"""
+
+    # Product columns loaded for every row (besides id, is_active, updated_at)
+    columns = ()
+    # Changes to other fields are ignored until the next catch-up
+    fields = frozenset()
+
+    def __init__(self, refresh_interval=5.0):
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._built = False
+        self._watermark = None
+        self._catalog_version = None
+        self._last_refresh = 0.0
+        self._dirty = set()
+        self._reset()
+        products_changed.connect(self._on_products_changed)
+
+    def _on_products_changed(self, sender, product_ids=(), fields=None, **kwargs):
+        if fields is not None and not fields & self.fields:
+            return
+        with self._lock:
+            self._dirty.update(product_ids)
+
+    def _reset(self):
+        """Drop every mirrored product"""
+        raise NotImplementedError
+
+    def _apply(self, product_id, row):
+        """Mirror one product's current ``row``; None removes it"""
+        raise NotImplementedError
+
+    def _load(self, rows):
+        """Mirror every active product after ``_reset()``"""
+        for row in rows:
+            self._apply(row.id, row)
+
+    def _statement(self):
+        from app.models import Product
+
+        return select(
+            Product.id, Product.is_active, Product.updated_at,
+            *[getattr(Product, column) for column in self.columns]
+        )
+
+    def _apply_rows(self, rows):
+        for row in rows:
+            self._apply(row.id, row if row.is_active else None)
+            if row.updated_at and (self._watermark is None or row.updated_at > self._watermark):
+                self._watermark = row.updated_at
+
+    def rebuild(self, batch_size=1000):
+        """Reload every active product"""
+        from app.models import Product
+
+        with self._lock:
+            self._reset()
+            self._dirty.clear()
+            with db.engine.connect() as conn:
+                self._watermark = conn.scalar(select(func.max(Product.updated_at)))
+                rows = conn.execution_options(yield_per=batch_size).execute(
+                    self._statement().where(Product.is_active.is_(True))
+                )
+                self._load(rows)
+            self._built = True
+            self._last_refresh = time.monotonic()
+
+    def sync(self, catalog_version=None):
+        """Bring the mirror up to date with committed product changes
+
+        ``catalog_version`` is the catalog version when the caller already
+        knows it; a different value than the mirror last caught up with
+        forces a catch-up.
+        """
+        from app.models import Product
+
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+                self._catalog_version = catalog_version
+                return
+
+            behind = catalog_version is not None and catalog_version != self._catalog_version
+            stale = behind or time.monotonic() - self._last_refresh >= self.refresh_interval
+            if not self._dirty and not stale:
+                return
+
+            with db.engine.connect() as conn:
+                if self._dirty:
+                    ids = list(self._dirty)
+                    self._dirty.clear()
+                    found = set()
+                    for start in range(0, len(ids), 500):
+                        rows = conn.execute(self._statement().where(Product.id.in_(ids[start:start + 500]))).all()
+                        found.update(row.id for row in rows)
+                        self._apply_rows(rows)
+                    for product_id in ids:
+                        if product_id not in found:
+                            self._apply(product_id, None)
+                if stale:
+                    # Pick up writes committed by other workers
+                    statement = self._statement()
+                    if self._watermark is not None:
+                        statement = statement.where(Product.updated_at >= self._watermark - CATCH_UP_OVERLAP)
+                    self._apply_rows(conn.execute(statement))
+                    self._last_refresh = time.monotonic()
+                    if catalog_version is not None:
+                        self._catalog_version = catalog_version
@@ -1,9 +1,13 @@
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
+from sqlalchemy import text
 import uuid
 
 from app import db
+from app.passwords import hasher
+
+# Partial index predicate: catalog listings only ever read active products
+ACTIVE_PRODUCTS = {'sqlite_where': text('is_active = 1'), 'postgresql_where': text('is_active')}
 
 class User(db.Model):
     """User model for authentication"""
@@ -21,21 +25,30 @@ class User(db.Model):
     country = db.Column(db.String(100), default='India')
     is_admin = db.Column(db.Boolean, default=False)
     is_active = db.Column(db.Boolean, default=True)
+    token_version = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # bumped to revoke tokens
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_users_created_at', 'created_at', 'id'),  # admin user list
+    )
+    
     # Relationships
     orders = db.relationship('Order', back_populates='user', cascade='all, delete-orphan')
     reviews = db.relationship('Review', back_populates='user', cascade='all, delete-orphan')
     cart_items = db.relationship('CartItem', back_populates='user', cascade='all, delete-orphan')
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (may raise HashingBusy)"""
+        self.password_hash = hasher.hash(password)
     
     def check_password(self, password):
-        """Check if password matches hash"""
-        return check_password_hash(self.password_hash, password)
+        """Check if password matches hash (may raise HashingBusy)"""
+        return hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """Check if the hash was made with an outdated method or cost"""
+        return hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -58,17 +71,39 @@ class Product(db.Model):
     __tablename__ = 'products'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
+    sku = db.Column(db.String(64), unique=True, index=True)  # supplier SKU, natural key for imports
     name = db.Column(db.String(255), nullable=False, index=True)
     description = db.Column(db.Text)
     price = db.Column(db.Integer, nullable=False)  # Price in paisa (INR)
-    category = db.Column(db.String(50), nullable=False, index=True)
+    category = db.Column(db.String(50), nullable=False)
     image_url = db.Column(db.String(500))
     stock = db.Column(db.Integer, default=0)
     rating = db.Column(db.Float, default=0.0)
     review_count = db.Column(db.Integer, default=0)
+    # Running rating aggregates, maintained with deltas by app.ratings
+    rating_sum = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    rating_1_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    rating_2_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    rating_3_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    rating_4_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    rating_5_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')
+    # Helpful votes over the product's reviews, rolled up by the counter flush
+    helpful_votes = db.Column(db.Integer, default=0, nullable=False, server_default='0')
     is_active = db.Column(db.Boolean, default=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Indexed: per-worker mirrors catch up on rows changed since their watermark
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    
+    # One index per listing order, with and without a category; the id
+    # tie-breaker lets keyset pages read the index in order
+    __table_args__ = (
+        db.Index('ix_products_active_created_at', 'created_at', 'id', **ACTIVE_PRODUCTS),
+        db.Index('ix_products_active_price', 'price', 'id', **ACTIVE_PRODUCTS),
+        db.Index('ix_products_active_rating', 'rating', 'id', **ACTIVE_PRODUCTS),
+        db.Index('ix_products_active_category_created_at', 'category', 'created_at', 'id', **ACTIVE_PRODUCTS),
+        db.Index('ix_products_active_category_price', 'category', 'price', 'id', **ACTIVE_PRODUCTS),
+        db.Index('ix_products_active_category_rating', 'category', 'rating', 'id', **ACTIVE_PRODUCTS),
+    )
     
     # Relationships
     reviews = db.relationship('Review', back_populates='product', cascade='all, delete-orphan')
@@ -79,6 +114,7 @@ class Product(db.Model):
         """Convert to dictionary"""
         return {
             'id': self.id,
+            'sku': self.sku,
             'name': self.name,
             'description': self.description,
             'price': self.price,
@@ -90,6 +126,18 @@ class Product(db.Model):
             'created_at': self.created_at.isoformat()
         }
 
+class CatalogVersion(db.Model):
+    """Single-row counter bumped by every transaction that changes products
+
+    The catalog's HTTP validator. Unlike ``MAX(updated_at)`` it moves on every
+    commit: ``updated_at`` is stamped before commit, so a transaction that
+    commits late can leave the maximum unchanged.
+    """
+    __tablename__ = 'catalog_version'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.BigInteger, nullable=False, default=0, server_default='0')
+
 class CartItem(db.Model):
     """Shopping cart items"""
     __tablename__ = 'cart_items'
@@ -100,6 +148,11 @@ class CartItem(db.Model):
     quantity = db.Column(db.Integer, default=1)
     added_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # One row per product in a cart; also serves the per-user lookups
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'product_id', name='uq_cart_items_user_product'),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='cart_items')
     product = db.relationship('Product', back_populates='cart_items')
@@ -127,9 +180,16 @@ class Order(db.Model):
     transaction_id = db.Column(db.String(255))
     order_date = db.Column(db.DateTime, default=datetime.utcnow)
     delivery_date = db.Column(db.DateTime)
+    # Summary of the line items, written at checkout (items never change afterwards)
+    item_count = db.Column(db.Integer, default=0, nullable=False, server_default='0')  # units ordered
+    thumbnail_url = db.Column(db.String(500))  # first item's image that has one
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        db.Index('ix_orders_user_created_at', 'user_id', 'created_at', 'id'),
+    )
+    
     # Relationships
     user = db.relationship('User', back_populates='orders')
     items = db.relationship('OrderItem', back_populates='order', cascade='all, delete-orphan')
@@ -145,6 +205,8 @@ class Order(db.Model):
             'shipping_address': self.shipping_address,
             'payment_method': self.payment_method,
             'items': [item.to_dict() for item in self.items],
+            'item_count': self.item_count,
+            'thumbnail_url': self.thumbnail_url,
             'order_date': self.order_date.isoformat(),
             'delivery_date': self.delivery_date.isoformat() if self.delivery_date else None,
             'created_at': self.created_at.isoformat()
@@ -155,10 +217,13 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
-    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False)
+    order_id = db.Column(db.String(36), db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.String(36), db.ForeignKey('products.id'), nullable=False, index=True)  # verified-purchase check
     quantity = db.Column(db.Integer, nullable=False)
     price_at_purchase = db.Column(db.Integer, nullable=False)  # Price in paisa when ordered
+    # Product as it was when ordered; later renames do not rewrite order history
+    product_name = db.Column(db.String(255), nullable=False)
+    product_image_url = db.Column(db.String(500))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
@@ -170,7 +235,8 @@ class OrderItem(db.Model):
         return {
             'id': self.id,
             'product_id': self.product_id,
-            'product_name': self.product.name,
+            'product_name': self.product_name,
+            'product_image_url': self.product_image_url,
             'quantity': self.quantity,
             'price_at_purchase': self.price_at_purchase,
             'subtotal': self.price_at_purchase * self.quantity
@@ -190,6 +256,16 @@ class Review(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    __table_args__ = (
+        # One per review list sort; ties are broken by (created_at, id)
+        db.Index('ix_reviews_product_created_at', 'product_id', 'created_at', 'id'),
+        db.Index('ix_reviews_product_helpful', 'product_id', 'helpful_count', 'created_at', 'id'),
+        db.Index('ix_reviews_product_rating', 'product_id', 'rating', 'created_at', 'id'),  # also rating=
+        db.Index('ix_reviews_product_verified', 'product_id', 'is_verified', 'created_at', 'id'),
+        db.Index('ix_reviews_product_user', 'product_id', 'user_id'),  # one review per user check
+        db.Index('ix_reviews_product_updated_at', 'product_id', 'updated_at'),  # review page validator
+    )
+    
     # Relationships
     product = db.relationship('Product', back_populates='reviews')
     user = db.relationship('User', back_populates='reviews')
@@ -0,0 +1,180 @@
+"""Keyset (cursor) pagination helpers
+
+List endpoints accept an opaque ``cursor`` parameter as an alternative to
+``page``. Passing ``cursor`` (empty for the first page) switches the endpoint
+to keyset mode: rows are fetched with ``WHERE (sort_key, id) < (:last_key,
+:last_id)`` instead of ``OFFSET`` and no ``COUNT(*)`` is issued, so every
+page costs the same. ``include_total=1`` adds a ``total`` that is cached for
+``PAGINATION_COUNT_TTL`` seconds.
+"""
+import base64
+import binascii
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from flask import current_app, request
+
+from app import db
+
+
+class InvalidCursor(ValueError):
+    """Raised when a cursor is malformed or belongs to another sort order"""
+
+
+def cursor_requested():
+    """True when the request asks for keyset pagination"""
+    return 'cursor' in request.args
+
+
+def encode_cursor(sort_key, values):
+    """Serialize the last row's sort values into an opaque cursor"""
+    payload = [sort_key] + [
+        value.isoformat() if isinstance(value, datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def _load_cursor(cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError) as e:
+        raise InvalidCursor('Invalid cursor') from e
+    if not isinstance(payload, list) or not payload:
+        raise InvalidCursor('Invalid cursor')
+    return payload
+
+
+def decode_cursor(cursor, sort_key, columns):
+    """Turn a cursor back into typed sort values for ``columns``"""
+    payload = _load_cursor(cursor)
+    if len(payload) != len(columns) + 1 or payload[0] != sort_key:
+        raise InvalidCursor('Cursor does not match this sort order')
+
+    values = []
+    for column, value in zip(columns, payload[1:]):
+        if value is not None and column.type.python_type is datetime:
+            try:
+                value = datetime.fromisoformat(value)
+            except (TypeError, ValueError) as e:
+                raise InvalidCursor('Invalid cursor') from e
+        values.append(value)
+    return values
+
+
+def keyset_query(query, columns, sort_key, cursor, per_page, descending=True):
+    """``query`` (a Query or a select) narrowed to the page after ``cursor``
+
+    One row more than ``per_page`` is fetched to tell whether there is a
+    next page; pass the rows to ``keyset_result()``.
+    """
+    if cursor:
+        values = decode_cursor(cursor, sort_key, columns)
+        row_key = db.tuple_(*columns)
+        last_key = db.tuple_(*values)
+        query = query.filter(row_key < last_key if descending else row_key > last_key)
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    return query.order_by(*order).limit(max(per_page, 1) + 1)
+
+
+def keyset_result(rows, columns, sort_key, per_page):
+    """``(rows, next_cursor)`` for rows fetched with ``keyset_query()``"""
+    per_page = max(per_page, 1)
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(sort_key, [getattr(last, c.key) for c in columns])
+    return rows, next_cursor
+
+
+def keyset_page(query, columns, sort_key, cursor, per_page, descending=True):
+    """Fetch one page of ``query`` ordered by ``columns`` after ``cursor``
+
+    ``columns`` must end with a unique tie-breaker (the primary key). Returns
+    ``(rows, next_cursor)``; ``next_cursor`` is None on the last page.
+    """
+    rows = keyset_query(query, columns, sort_key, cursor, per_page, descending).all()
+    return keyset_result(rows, columns, sort_key, per_page)
+
+
+def offset_cursor_page(items, cursor, per_page):
+    """Cursor paging over an already ordered in-memory list (e.g. search hits)"""
+    per_page = max(per_page, 1)
+    start = 0
+    if cursor:
+        payload = _load_cursor(cursor)
+        if len(payload) != 2 or payload[0] != 'offset' or not isinstance(payload[1], int):
+            raise InvalidCursor('Cursor does not match this sort order')
+        start = payload[1]
+
+    end = start + per_page
+    next_cursor = encode_cursor('offset', [end]) if end < len(items) else None
+    return items[start:end], next_cursor
+
+
+class _CountCache:
+    """Small TTL + LRU cache for list totals"""
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                return entry[1]
+        return None
+
+    def set(self, key, ttl, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_compute(self, key, ttl, compute):
+        value = self.get(key)
+        if value is None:
+            value = compute()
+            self.set(key, ttl, value)
+        return value
+
+    async def get_or_compute_async(self, key, ttl, compute):
+        value = self.get(key)
+        if value is None:
+            value = await compute()
+            self.set(key, ttl, value)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_count_cache = _CountCache()
+
+
+def cached_total(key, query):
+    """``COUNT(*)`` of ``query``, cached per ``key`` for a short TTL"""
+    ttl = current_app.config.get('PAGINATION_COUNT_TTL', 30)
+    return _count_cache.get_or_compute(key, ttl, lambda: query.order_by(None).count())
+
+
+async def cached_total_async(key, count):
+    """``cached_total()`` for async callers; ``count()`` returns an awaitable"""
+    ttl = current_app.config.get('PAGINATION_COUNT_TTL', 30)
+    return await _count_cache.get_or_compute_async(key, ttl, count)
+
+
+def include_total():
+    """True when a keyset request also wants the (cached) total"""
+    return request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
@@ -0,0 +1,135 @@
+"""Password hashing off the request thread
+
+Hashing and verifying passwords is deliberately slow CPU work. Running it
+inline lets a burst of logins occupy every worker and stall the rest of the
+API, so ``User.set_password()`` / ``check_password()`` hand it to a small
+process pool of ``PASSWORD_HASH_WORKERS`` processes per app worker instead.
+The request thread waits without holding the GIL, so other threads keep
+serving (run gunicorn with ``--threads``).
+
+At most ``PASSWORD_HASH_MAX_QUEUE`` hashes may be waiting or running per
+worker; beyond that, or when a hash takes longer than
+``PASSWORD_HASH_TIMEOUT`` seconds, ``HashingBusy`` is raised and routes
+answer 503 immediately rather than queueing more CPU work.
+
+The cost is ``PASSWORD_HASH_METHOD`` (any werkzeug method, e.g.
+``pbkdf2:sha256:600000`` or ``scrypt:32768:8:1``). Hashes made with another
+method still verify; ``needs_rehash()`` tells login to store a fresh one.
+With ``PASSWORD_HASH_WORKERS=0`` hashing runs inline (CLI, seed, tests).
+
+Pool processes are started with ``forkserver`` (``spawn`` where that is
+unavailable) rather than forked from a threaded worker, so like any
+multiprocessing program a script that hashes must keep its work under
+``if __name__ == '__main__'``.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+# Parameters werkzeug fills in when a method is given without them
+_METHOD_DEFAULTS = {
+    'pbkdf2': ['sha256', str(DEFAULT_PBKDF2_ITERATIONS)],
+    'scrypt': ['32768', '8', '1'],
+}
+
+
+class HashingBusy(Exception):
+    """Too many password hashes queued or in progress on this worker"""
+
+
+def canonical_method(method):
+    """``method`` with werkzeug's default parameters spelled out"""
+    name, *params = method.split(':')
+    defaults = _METHOD_DEFAULTS.get(name, [])
+    return ':'.join([name, *params, *defaults[len(params):]])
+
+
+class PasswordHasher:
+    """Bounded per-worker process pool for password hashing"""
+
+    def __init__(self, app=None):
+        self.method = canonical_method(f'pbkdf2:sha256:{DEFAULT_PBKDF2_ITERATIONS}')
+        self.workers = 0
+        self.max_queue = 4
+        self.timeout = 5.0
+        self._pool = None
+        self._pid = None
+        self._pending = 0
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = canonical_method(app.config.get('PASSWORD_HASH_METHOD', self.method))
+        self.workers = app.config.get('PASSWORD_HASH_WORKERS', 0)
+        self.max_queue = app.config.get('PASSWORD_HASH_MAX_QUEUE', 4)
+        self.timeout = app.config.get('PASSWORD_HASH_TIMEOUT', 5.0)
+        app.extensions['password_hasher'] = self
+
+    def hash(self, password):
+        """Hash ``password`` with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Whether ``password`` matches ``password_hash``"""
+        return self._run(check_password_hash, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """Whether ``password_hash`` was made with a different method"""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def _run(self, fn, *args):
+        if not self.workers:
+            return fn(*args)
+
+        with self._lock:
+            if self._pending >= self.max_queue:
+                raise HashingBusy()
+            self._pending += 1
+        try:
+            future = self._executor().submit(fn, *args)
+        except BrokenProcessPool:
+            # A pool process died; start a fresh pool on the next call
+            self._pool = None
+            self._release()
+            raise HashingBusy()
+        # The slot is held until the pool is done with the work, even if the
+        # caller gave up waiting, so abandoned hashes still count
+        future.add_done_callback(self._release)
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise HashingBusy()
+        except BrokenProcessPool:
+            self._pool = None
+            raise HashingBusy()
+
+    def _release(self, future=None):
+        with self._lock:
+            self._pending -= 1
+
+    def _executor(self):
+        # Created lazily so each forked gunicorn worker owns its pool
+        if self._pool is None or self._pid != os.getpid():
+            with self._lock:
+                if self._pool is None or self._pid != os.getpid():
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context(
+                        'forkserver' if 'forkserver' in methods else 'spawn'
+                    )
+                    self._pool = ProcessPoolExecutor(self.workers, mp_context=context)
+                    self._pid = os.getpid()
+        return self._pool
+
+    def shutdown(self):
+        if self._pool is not None and self._pid == os.getpid():
+            self._pool.shutdown(wait=False, cancel_futures=True)
+        self._pool = None
+
+
+hasher = PasswordHasher()
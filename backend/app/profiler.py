@@ -0,0 +1,247 @@
+"""Slow-query log and per-request SQL profiler
+
+A production-safe alternative to ``SQLALCHEMY_ECHO``. When
+``PROFILER_ENABLED`` is set, every SQL statement and request is timed and the
+ones slower than ``PROFILER_STATEMENT_THRESHOLD_MS`` /
+``PROFILER_REQUEST_THRESHOLD_MS`` are captured, sampled at
+``PROFILER_SAMPLE_RATE``, into a ring buffer of ``PROFILER_BUFFER_SIZE``
+entries per worker.
+
+A statement capture holds the normalized SQL (literals and ``IN`` lists
+folded), the shape of its parameters (names and types, never values), the
+duration, the route that issued it and the first application frame on the
+call stack. A request capture holds the route, status, statement count, DB
+time and its slowest statements. With ``PROFILER_EXPLAIN`` the plan of slow
+``SELECT`` statements is captured too, once per normalized statement, on a
+separate pooled connection, and flagged when it scans a whole table.
+
+Captures are served to admins by ``GET /api/admin/profiler`` (JSON, or JSONL
+with ``format=jsonl``) and appended to ``PROFILER_LOG_PATH`` when set.
+"""
+import contextvars
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+_APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\bIN\s*\(\s*(?:\?|%\(\w+\)s|:\w+)(?:\s*,\s*(?:\?|%\(\w+\)s|:\w+))*\s*\)', re.IGNORECASE)
+_SPACES = re.compile(r'\s+')
+_FULL_SCAN = re.compile(r'^\s*(?:SCAN (?!.*USING (?:COVERING )?INDEX)|.*Seq Scan)', re.IGNORECASE)
+
+# Per request; context variables so concurrent asyncio requests stay apart
+_current = contextvars.ContextVar('profiler_request', default=None)
+_explaining = contextvars.ContextVar('profiler_explaining', default=False)
+
+
+def normalize_sql(statement):
+    """Statement text with literals replaced and whitespace collapsed"""
+    text = _STRING.sub('?', statement)
+    text = _NUMBER.sub('?', text)
+    text = _IN_LIST.sub('IN (...)', text)
+    return _SPACES.sub(' ', text).strip()
+
+
+def parameter_shape(parameters, executemany=False):
+    """Names and types of bound parameters, without their values"""
+    if executemany:
+        rows = list(parameters)
+        return {'rows': len(rows), 'row': parameter_shape(rows[0]) if rows else None}
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _call_site():
+    # First frame inside the application that is not this module
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(_APP_ROOT) and filename != __file__ \
+                and f'{os.sep}site-packages{os.sep}' not in filename:
+            return f'{os.path.relpath(filename, _APP_ROOT)}:{frame.f_lineno} in {frame.f_code.co_name}'
+        frame = frame.f_back
+    return None
+
+
+def _route():
+    if not has_request_context():
+        return None
+    return f'{request.method} {request.url_rule.rule if request.url_rule else request.path}'
+
+
+class SQLProfiler:
+    """Captures slow statements and requests into a per-worker ring buffer"""
+
+    def __init__(self, app=None):
+        self.enabled = False
+        self.statement_threshold = 0.1
+        self.request_threshold = 0.5
+        self.sample_rate = 1.0
+        self.explain = False
+        self.log_path = None
+        self._captures = deque(maxlen=500)
+        self._plans = {}
+        self._lock = threading.Lock()
+        self._listening = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['profiler'] = self
+        self.enabled = app.config.get('PROFILER_ENABLED', False)
+        if not self.enabled:
+            return
+        self.statement_threshold = app.config.get('PROFILER_STATEMENT_THRESHOLD_MS', 100) / 1000
+        self.request_threshold = app.config.get('PROFILER_REQUEST_THRESHOLD_MS', 500) / 1000
+        self.sample_rate = app.config.get('PROFILER_SAMPLE_RATE', 1.0)
+        self.explain = app.config.get('PROFILER_EXPLAIN', False)
+        self.log_path = app.config.get('PROFILER_LOG_PATH') or None
+        self._captures = deque(self._captures, maxlen=app.config.get('PROFILER_BUFFER_SIZE', 500))
+
+        if not self._listening:
+            event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+            event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+            self._listening = True
+        app.before_request(self._start_request)
+        app.after_request(self._response_status)
+        app.teardown_request(self._finish_request)
+
+    def captures(self, kind=None, limit=None):
+        """Captured entries, newest first"""
+        with self._lock:
+            entries = list(self._captures)
+        entries.reverse()
+        if kind:
+            entries = [entry for entry in entries if entry['type'] == kind]
+        return entries[:limit] if limit else entries
+
+    def clear(self):
+        with self._lock:
+            self._captures.clear()
+            self._plans.clear()
+
+    def _sampled(self):
+        return self.sample_rate >= 1 or random.random() < self.sample_rate
+
+    def _store(self, entry):
+        with self._lock:
+            self._captures.append(entry)
+        if self.log_path:
+            line = json.dumps(entry, default=str) + '\n'
+            with self._lock, open(self.log_path, 'a') as f:
+                f.write(line)
+
+    def _start_request(self):
+        _current.set({'started': time.perf_counter(), 'statements': [], 'status': None})
+
+    def _response_status(self, response):
+        state = _current.get()
+        if state is not None:
+            state['status'] = response.status_code
+        return response
+
+    def _finish_request(self, exc=None):
+        state = _current.get()
+        _current.set(None)
+        if state is None:
+            return
+        duration = time.perf_counter() - state['started']
+        if duration < self.request_threshold or not self._sampled():
+            return
+
+        statements = state['statements']
+        slowest = sorted(statements, key=lambda s: s[1], reverse=True)[:5]
+        self._store({
+            'type': 'request',
+            'at': datetime.utcnow().isoformat(),
+            'route': _route(),
+            'endpoint': request.endpoint,
+            'status': state['status'] or 500,
+            'error': repr(exc) if exc else None,
+            'duration_ms': round(duration * 1000, 3),
+            'statements': len(statements),
+            'db_ms': round(sum(s[1] for s in statements) * 1000, 3),
+            'slowest': [
+                {'sql': normalize_sql(sql), 'duration_ms': round(seconds * 1000, 3)}
+                for sql, seconds in slowest
+            ],
+        })
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('profiler_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('profiler_started')
+        if not started:
+            return
+        duration = time.perf_counter() - started.pop()
+        if _explaining.get():
+            return
+
+        state = _current.get()
+        if state is not None:
+            state['statements'].append((statement, duration))
+
+        if duration < self.statement_threshold or not self._sampled():
+            return
+        normalized = normalize_sql(statement)
+        entry = {
+            'type': 'statement',
+            'at': datetime.utcnow().isoformat(),
+            'sql': normalized,
+            'params': parameter_shape(parameters, executemany),
+            'duration_ms': round(duration * 1000, 3),
+            'route': _route(),
+            'call_site': _call_site(),
+        }
+        if self.explain and not executemany and statement.lstrip()[:6].upper() == 'SELECT':
+            entry.update(self._plan(conn, statement, parameters, normalized))
+        self._store(entry)
+
+    def _plan(self, conn, statement, parameters, normalized):
+        # One EXPLAIN per distinct statement; repeats reuse the first plan
+        with self._lock:
+            cached = self._plans.get(normalized)
+        if cached is not None:
+            return cached
+
+        # On a connection of its own: the request's connection is mid-statement
+        # and possibly mid-transaction, where a failing EXPLAIN would abort it
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        _explaining.set(True)
+        try:
+            with conn.engine.connect() as explain_conn:
+                rows = explain_conn.exec_driver_sql(prefix + statement, parameters).fetchall()
+            if conn.dialect.name == 'sqlite':
+                plan = [row[-1] for row in rows]
+            else:
+                plan = [' '.join(str(value) for value in row) for row in rows]
+            result = {'plan': plan, 'full_scan': any(_FULL_SCAN.match(line) for line in plan)}
+        except Exception as e:
+            result = {'plan_error': str(e)}
+        finally:
+            _explaining.set(False)
+
+        with self._lock:
+            if len(self._plans) >= 1000:
+                self._plans.clear()
+            self._plans[normalized] = result
+        return result
+
+
+profiler = SQLProfiler()
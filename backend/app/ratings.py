@@ -0,0 +1,133 @@
+"""Product rating aggregates
+
+``Product`` keeps ``rating_sum``, ``review_count`` and a per-star histogram
+(``rating_1_count`` .. ``rating_5_count``) up to date with atomic deltas in
+the same transaction as the review write, so no ``AVG()`` over the reviews
+table is needed. ``flask ratings reconcile`` recomputes the aggregates from
+the reviews table in chunks to repair drift.
+"""
+import time
+from datetime import datetime
+
+import click
+from flask.cli import AppGroup
+from sqlalchemy import func, update
+
+from app import db
+from app.models import Product, Review
+from app.signals import mark_products_changed
+
+STARS = range(1, 6)
+RATING_FIELDS = ['rating', 'rating_sum', 'review_count'] + [f'rating_{s}_count' for s in STARS]
+
+
+def _average(rating_sum, review_count):
+    return db.case(
+        (review_count > 0, db.cast(rating_sum, db.Float) / review_count),
+        else_=0.0
+    )
+
+
+def apply_rating_change(product_id, old_rating=None, new_rating=None):
+    """Apply a review insert/update/delete to the product's aggregates
+
+    Pass only ``new_rating`` for a new review, only ``old_rating`` for a
+    deleted one and both for an edit. Issues one ``UPDATE`` with relative
+    deltas, so concurrent review writes never lose each other's changes.
+    """
+    count_delta = (new_rating is not None) - (old_rating is not None)
+    sum_delta = (new_rating or 0) - (old_rating or 0)
+    if not count_delta and not sum_delta:
+        return
+
+    new_sum = Product.rating_sum + sum_delta
+    new_count = Product.review_count + count_delta
+    values = {
+        'rating_sum': new_sum,
+        'review_count': new_count,
+        'rating': _average(new_sum, new_count),
+        'updated_at': datetime.utcnow(),
+    }
+    for star in STARS:
+        delta = (new_rating == star) - (old_rating == star)
+        if delta:
+            column = getattr(Product, f'rating_{star}_count')
+            values[column.key] = column + delta
+
+    db.session.execute(
+        update(Product).where(Product.id == product_id).values(**values)
+        .execution_options(synchronize_session=False)
+    )
+
+    # Loaded instances hold the old values; reload them on next access
+    product = db.session.identity_map.get(db.session.identity_key(Product, product_id))
+    if product is not None:
+        db.session.expire(product, list(values))
+    mark_products_changed(db.session, [product_id], RATING_FIELDS)
+
+
+def reconcile_ratings(chunk_size=500):
+    """Recompute rating aggregates from reviews; returns (checked, repaired)"""
+    checked = repaired = 0
+    last_id = ''
+    while True:
+        products = db.session.query(
+            Product.id, Product.rating_sum, Product.review_count,
+            *[getattr(Product, f'rating_{s}_count') for s in STARS]
+        ).filter(Product.id > last_id).order_by(Product.id).limit(chunk_size).all()
+        if not products:
+            break
+        last_id = products[-1].id
+        ids = [p.id for p in products]
+
+        actual = {
+            row.product_id: row for row in db.session.query(
+                Review.product_id,
+                func.count(Review.id).label('review_count'),
+                func.coalesce(func.sum(Review.rating), 0).label('rating_sum'),
+                *[
+                    func.sum(db.case((Review.rating == s, 1), else_=0)).label(f'rating_{s}_count')
+                    for s in STARS
+                ]
+            ).filter(Review.product_id.in_(ids)).group_by(Review.product_id)
+        }
+
+        fixes = []
+        for product in products:
+            row = actual.get(product.id)
+            expected = {
+                'review_count': row.review_count if row else 0,
+                'rating_sum': int(row.rating_sum) if row else 0,
+            }
+            for star in STARS:
+                expected[f'rating_{star}_count'] = int(getattr(row, f'rating_{star}_count') or 0) if row else 0
+            if any(getattr(product, key) != value for key, value in expected.items()):
+                count = expected['review_count']
+                expected['rating'] = expected['rating_sum'] / count if count else 0.0
+                expected['id'] = product.id
+                expected['updated_at'] = datetime.utcnow()
+                fixes.append(expected)
+
+        if fixes:
+            db.session.execute(update(Product), fixes)
+            mark_products_changed(db.session, [fix['id'] for fix in fixes], RATING_FIELDS)
+        db.session.commit()
+
+        checked += len(products)
+        repaired += len(fixes)
+    return checked, repaired
+
+
+ratings_cli = AppGroup('ratings', help='Maintain product rating aggregates.')
+
+
+@ratings_cli.command('reconcile')
+@click.option('--chunk-size', default=500, show_default=True, help='Products per transaction.')
+def reconcile_command(chunk_size):
+    """Recompute product rating aggregates from the reviews table"""
+    started = time.perf_counter()
+    checked, repaired = reconcile_ratings(chunk_size)
+    click.echo(
+        f'Checked {checked} products, repaired {repaired} '
+        f'in {time.perf_counter() - started:.2f}s'
+    )
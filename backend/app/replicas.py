@@ -0,0 +1,232 @@
+"""Connection pooling and read-replica routing
+
+``configure_engines()`` turns the ``DB_*`` settings into engine options for
+the primary database and, when ``DATABASE_REPLICA_URL`` is set, for a second
+``replica`` bind: pool size and overflow, recycle, pre-ping, checkout timeout
+and a server-side statement timeout (PostgreSQL and MySQL). Options given
+explicitly in ``SQLALCHEMY_ENGINE_OPTIONS`` win.
+
+Views decorated with ``@reads_from_replica`` run their ``SELECT`` statements
+on the replica; everything else, and anything flushed or written inside
+those views, stays on the primary. Routing happens in ``RoutingSession``,
+which ``db.session`` uses.
+
+Read-your-writes: a successful ``POST``/``PUT``/``PATCH``/``DELETE`` pins the
+client to the primary for ``REPLICA_STICKY_SECONDS``, through a cookie and,
+for clients that send a JWT instead, by user id on the worker that took the
+write. That window should cover the replica's usual lag.
+
+When the replica cannot be reached it is skipped for
+``REPLICA_RETRY_SECONDS`` and reads go to the primary.
+
+Engines registered with ``dispose_engines_after_fork()`` drop their pooled
+connections in forked children, so an app created before forking (gunicorn
+``--preload``) never shares a database connection between workers.
+"""
+import os
+import threading
+import time
+import weakref
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import decode_token, get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+REPLICA_BIND = 'replica'
+STICKY_COOKIE = 'read_primary_until'
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def engine_options(url, config):
+    """Pool and timeout options for an engine connecting to ``url``"""
+    url = make_url(url)
+    if url.get_backend_name() == 'sqlite':
+        # SQLite has no server to pool connections to or time out on
+        return {}
+
+    options = {
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': config['DB_POOL_PRE_PING'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+    }
+    timeout_ms = config['DB_STATEMENT_TIMEOUT_MS']
+    connect_args = {}
+    if url.get_backend_name() == 'postgresql':
+        connect_args['connect_timeout'] = config['DB_CONNECT_TIMEOUT']
+        if timeout_ms:
+            connect_args['options'] = f'-c statement_timeout={timeout_ms}'
+    elif url.get_backend_name() == 'mysql':
+        connect_args['connect_timeout'] = config['DB_CONNECT_TIMEOUT']
+        if timeout_ms:
+            connect_args['init_command'] = f'SET SESSION max_execution_time={timeout_ms}'
+    if connect_args:
+        options['connect_args'] = connect_args
+    return options
+
+
+def configure_engines(app):
+    """Fill in engine options and the replica bind; call before ``db.init_app``"""
+    config = app.config
+    options = config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', {})
+    for key, value in engine_options(config['SQLALCHEMY_DATABASE_URI'], config).items():
+        options.setdefault(key, value)
+
+    replica_url = config.get('DATABASE_REPLICA_URL')
+    if replica_url:
+        binds = config.setdefault('SQLALCHEMY_BINDS', {})
+        binds.setdefault(REPLICA_BIND, {'url': replica_url, **engine_options(replica_url, config)})
+
+
+# Engines whose pools a forked child must not reuse
+_fork_engines = weakref.WeakSet()
+
+
+def _dispose_after_fork():
+    for engine in list(_fork_engines):
+        # Forget the parent's connections without closing them under it
+        engine.dispose(close=False)
+
+
+os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def dispose_engines_after_fork(app):
+    """Give workers forked after ``create_app()`` fresh connection pools"""
+    from app import db
+
+    with app.app_context():
+        _fork_engines.update(db.engines.values())
+
+
+class ReplicaRouter:
+    """Tracks replica health and which clients must read from the primary"""
+
+    def __init__(self, app=None):
+        self.sticky_seconds = 5.0
+        self.retry_seconds = 30.0
+        self._down_until = 0.0
+        self._sticky_users = {}  # user id -> monotonic time the pin ends
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import db
+
+        app.extensions['replica_router'] = self
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS', 5.0)
+        self.retry_seconds = app.config.get('REPLICA_RETRY_SECONDS', 30.0)
+        app.after_request(self._pin_writer)
+
+        with app.app_context():
+            engine = db.engines.get(REPLICA_BIND)
+        if engine is not None:
+            event.listen(engine, 'handle_error', self._on_replica_error)
+
+    @property
+    def available(self):
+        return time.monotonic() >= self._down_until
+
+    def mark_down(self):
+        self._down_until = time.monotonic() + self.retry_seconds
+        current_app.logger.warning('Read replica unavailable; reading from the primary for %ss',
+                                   self.retry_seconds)
+
+    def _on_replica_error(self, context):
+        if context.is_disconnect and self.available and has_request_context():
+            self.mark_down()
+
+    def _pin_writer(self, response):
+        if request.method not in WRITE_METHODS or response.status_code >= 400 or not self.sticky_seconds:
+            return response
+        response.set_cookie(
+            STICKY_COOKIE, str(int(time.time() + self.sticky_seconds)),
+            max_age=int(self.sticky_seconds) + 1, httponly=True, samesite='Lax'
+        )
+        try:
+            user_id = get_jwt_identity()
+        except RuntimeError:
+            user_id = None
+        if user_id is not None:
+            now = time.monotonic()
+            with self._lock:
+                if len(self._sticky_users) >= 10000:
+                    self._sticky_users = {
+                        uid: until for uid, until in self._sticky_users.items() if until > now
+                    }
+                self._sticky_users[user_id] = now + self.sticky_seconds
+        return response
+
+    def _pinned(self):
+        """Whether the current client wrote recently"""
+        until = request.cookies.get(STICKY_COOKIE)
+        if until and until.isdigit() and int(until) >= time.time():
+            return True
+        if not self._sticky_users:
+            return False
+        header = request.headers.get('Authorization', '')
+        if not header.startswith('Bearer '):
+            return False
+        try:
+            user_id = decode_token(header[7:])['sub']
+        except Exception:
+            return False
+        with self._lock:
+            until = self._sticky_users.get(user_id)
+        return until is not None and until > time.monotonic()
+
+    def should_read_replica(self):
+        from app import db
+
+        return REPLICA_BIND in db.engines and self.available and not self._pinned()
+
+
+router = ReplicaRouter()
+
+
+def reads_from_replica(view):
+    """Run the view's ``SELECT`` statements on the read replica"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        g.replica_reads = router.should_read_replica()
+        return view(*args, **kwargs)
+    return wrapper
+
+
+def used_replica():
+    """Whether the current request has read from the replica"""
+    return has_request_context() and g.get('replica_used', False)
+
+
+class RoutingSession(Session):
+    """``db.session`` class sending replica-safe reads to the replica bind"""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and getattr(clause, 'is_select', False) \
+                and has_request_context() and g.get('replica_reads'):
+            replica = self._replica()
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _replica(self):
+        engine = self._db.engines.get(REPLICA_BIND)
+        if engine is None or not router.available:
+            g.replica_reads = False
+            return None
+        if not g.get('replica_used'):
+            # Check out the connection up front so an unreachable replica
+            # falls back to the primary instead of failing the request
+            try:
+                self.connection(bind_arguments={'bind': engine})
+            except Exception:
+                router.mark_down()
+                g.replica_reads = False
+                return None
+            g.replica_used = True
+        return engine
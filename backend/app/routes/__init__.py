@@ -1,7 +1,9 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
+from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
+from app.authz import create_user_token, revoke_user_tokens
 from app.models import User
+from app.passwords import HashingBusy
 import re
 
 auth_bp = Blueprint('auth', __name__, url_prefix='/api/auth')
@@ -11,6 +13,12 @@ def validate_email(email):
     pattern = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
     return re.match(pattern, email) is not None
 
+def hashing_busy_response():
+    """503 returned when password hashing is saturated"""
+    response = jsonify({'error': 'Too many authentication requests, please retry shortly'})
+    response.headers['Retry-After'] = '1'
+    return response, 503
+
 @auth_bp.route('/register', methods=['POST'])
 def register():
     """Register a new user"""
@@ -54,6 +62,9 @@ def register():
             'user': user.to_dict()
         }), 201
     
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -79,8 +90,13 @@ def login():
         if not user.is_active:
             return jsonify({'error': 'Account is inactive'}), 403
         
+        # Upgrade hashes made with an older method or cost
+        if user.password_needs_rehash():
+            user.set_password(password)
+            db.session.commit()
+        
         # Create access token
-        access_token = create_access_token(identity=user.id)
+        access_token = create_user_token(user)
         
         return jsonify({
             'message': 'Login successful',
@@ -88,6 +104,9 @@ def login():
             'user': user.to_dict()
         }), 200
     
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -172,12 +191,18 @@ def change_password():
             return jsonify({'error': 'New password must be at least 6 characters'}), 400
         
         user.set_password(data['new_password'])
+        # Log out every other session; the caller gets a fresh token
+        revoke_user_tokens(user)
         db.session.commit()
         
         return jsonify({
-            'message': 'Password changed successfully'
+            'message': 'Password changed successfully',
+            'access_token': create_user_token(user)
         }), 200
     
+    except HashingBusy:
+        db.session.rollback()
+        return hashing_busy_response()
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
@@ -189,5 +214,6 @@ from app.routes.cart import cart_bp
 from app.routes.orders import orders_bp
 from app.routes.reviews import reviews_bp
 from app.routes.users import users_bp
+from app.routes.admin import admin_bp
 
-__all__ = ['auth_bp', 'products_bp', 'cart_bp', 'orders_bp', 'reviews_bp', 'users_bp']
+__all__ = ['auth_bp', 'products_bp', 'cart_bp', 'orders_bp', 'reviews_bp', 'users_bp', 'admin_bp']
@@ -0,0 +1,75 @@
+from flask import Blueprint, Response, request, jsonify
+from app.authz import admin_required
+from app.catalog_import import InvalidImportFile, detect_format, import_products
+from app.profiler import profiler
+import io
+import json
+
+admin_bp = Blueprint('admin', __name__, url_prefix='/api/admin')
+
+@admin_bp.route('/profiler', methods=['GET'])
+@admin_required
+def get_profiler_captures():
+    """Get slow statements and requests captured by this worker (admin only)"""
+    try:
+        kind = request.args.get('type')
+        limit = request.args.get('limit', type=int)
+        captures = profiler.captures(kind, limit)
+        
+        if request.args.get('format') == 'jsonl':
+            body = ''.join(json.dumps(entry, default=str) + '\n' for entry in captures)
+            return Response(body, mimetype='application/x-ndjson', headers={
+                'Content-Disposition': 'attachment; filename=profiler.jsonl'
+            })
+        
+        return jsonify({
+            'enabled': profiler.enabled,
+            'captures': captures,
+            'total': len(captures)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/profiler', methods=['DELETE'])
+@admin_required
+def clear_profiler_captures():
+    """Clear this worker's profiler captures (admin only)"""
+    try:
+        profiler.clear()
+        return jsonify({'message': 'Profiler captures cleared'}), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@admin_bp.route('/products/import', methods=['POST'])
+@admin_required
+def import_catalog():
+    """Upsert products by SKU from an uploaded CSV or JSONL file (admin only)"""
+    try:
+        upload = request.files.get('file')
+        if upload:
+            raw = upload.stream
+            fmt = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+        else:
+            raw = request.stream
+            fmt = request.args.get('format') or detect_format(content_type=request.content_type)
+        
+        if fmt is None:
+            return jsonify({'error': 'Unknown format; pass format=csv or format=jsonl'}), 400
+        
+        chunk_size = min(max(request.args.get('chunk_size', 1000, type=int), 1), 10000)
+        start_line = request.args.get('start_line', 0, type=int)
+        
+        stream = io.TextIOWrapper(raw, encoding='utf-8-sig', newline='')
+        report = import_products(stream, fmt, chunk_size, start_line)
+        
+        return jsonify({
+            'message': 'Import finished',
+            'report': report.to_dict()
+        }), 200
+    
+    except InvalidImportFile as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
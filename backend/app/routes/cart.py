@@ -1,18 +1,25 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
 from app import db
-from app.models import CartItem, Product, User
+from app.models import CartItem, Product
 
 cart_bp = Blueprint('cart', __name__, url_prefix='/api/cart')
 
+def cart_items_with_products():
+    """Cart item query that joins each item's product in the same SELECT"""
+    return CartItem.query.options(joinedload(CartItem.product, innerjoin=True))
+
 @cart_bp.route('', methods=['GET'])
 @jwt_required()
 def get_cart():
     """Get user's shopping cart"""
     try:
         user_id = get_jwt_identity()
-        cart_items = CartItem.query.filter_by(user_id=user_id).all()
+        cart_items = cart_items_with_products().filter_by(user_id=user_id).all()
         
+        # Totals come from the already-loaded rows, no extra queries
         total_price = sum(item.product.price * item.quantity for item in cart_items)
         total_items = sum(item.quantity for item in cart_items)
         
@@ -64,7 +71,18 @@ def add_to_cart():
             cart_item = CartItem(user_id=user_id, product_id=product_id, quantity=quantity)
             db.session.add(cart_item)
         
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # A concurrent request added the same product first (unique per cart)
+            db.session.rollback()
+            cart_item = CartItem.query.filter_by(user_id=user_id, product_id=product_id).one()
+            cart_item.quantity += quantity
+            if cart_item.quantity > product.stock:
+                return jsonify({'error': f'Only {product.stock} items available'}), 400
+            db.session.commit()
+        
+        cart_item = cart_items_with_products().filter_by(id=cart_item.id).one()
         
         return jsonify({
             'message': 'Item added to cart',
@@ -81,7 +99,8 @@ def update_cart_item(item_id):
     """Update cart item quantity"""
     try:
         user_id = get_jwt_identity()
-        cart_item = CartItem.query.filter_by(id=item_id, user_id=user_id).first()
+        cart_item = cart_items_with_products()\
+            .filter_by(id=item_id, user_id=user_id).first()
         
         if not cart_item:
             return jsonify({'error': 'Cart item not found'}), 404
@@ -103,6 +122,8 @@ def update_cart_item(item_id):
         cart_item.quantity = quantity
         db.session.commit()
         
+        cart_item = cart_items_with_products().filter_by(id=cart_item.id).one()
+        
         return jsonify({
             'message': 'Cart item updated',
             'cart_item': cart_item.to_dict()
@@ -1,11 +1,93 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
+from sqlalchemy import bindparam, update
+from sqlalchemy.orm import selectinload, joinedload
 from app import db
-from app.models import Order, OrderItem, CartItem, Product, User
+from app.authz import admin_required
+from app.conditional import conditional
+from app.signals import mark_products_changed
+from app.models import Order, OrderItem, CartItem, Product
+from app.serializers import ORDER_SUMMARY_FIELDS, InvalidFields, order_serializer
+from app.pagination import InvalidCursor, cursor_requested, keyset_page, cached_total, include_total
 
 orders_bp = Blueprint('orders', __name__, url_prefix='/api/orders')
 
+def orders_with_items():
+    """Order query that eager-loads line items"""
+    return Order.query.options(selectinload(Order.items))
+
+def order_version_statement(order_id, user_id):
+    # Line items are snapshots written with the order, so the order row alone
+    # versions the response
+    return db.select(Order.updated_at).where(Order.id == order_id, Order.user_id == user_id)
+
+def requested_order_fields():
+    """Order list fields: ``fields``, else the summary with ``summary=1``"""
+    fields = order_serializer.requested_fields()
+    if fields is None and request.args.get('summary', '').lower() in ('1', 'true', 'yes'):
+        return ORDER_SUMMARY_FIELDS
+    return fields
+
+def order_version(order_id):
+    """HTTP validator for one of the current user's orders"""
+    row = db.session.execute(order_version_statement(order_id, get_jwt_identity())).first()
+    return tuple(row) if row else None
+
+def reserve_stock(quantities):
+    """Atomically take ``quantities`` (product_id -> qty) out of stock
+    
+    Rows are decremented with a conditional UPDATE in product id order, so
+    concurrent checkouts lock rows in the same order and cannot deadlock.
+    Returns False if any product lacked stock; the caller must roll back.
+    """
+    product_table = Product.__table__
+    statement = update(product_table)\
+        .where(product_table.c.id == bindparam('product_id'))\
+        .where(product_table.c.stock >= bindparam('quantity'))\
+        .values(
+            stock=product_table.c.stock - bindparam('quantity'),
+            updated_at=datetime.utcnow()
+        )
+    params = [
+        {'product_id': product_id, 'quantity': quantity}
+        for product_id, quantity in sorted(quantities.items())
+    ]
+    
+    if db.engine.dialect.supports_sane_multi_rowcount:
+        # One batched statement for the whole cart
+        reserved = db.session.execute(statement, params).rowcount == len(params)
+    else:
+        reserved = all(
+            db.session.execute(statement, param).rowcount == 1 for param in params
+        )
+    if reserved:
+        mark_products_changed(db.session, quantities, ['stock', 'updated_at'])
+    return reserved
+
+def stock_shortages(quantities, products=None):
+    """Per-item details for products that cannot cover ``quantities``"""
+    if products is None:
+        products = Product.query.filter(Product.id.in_(quantities))
+    return [
+        {
+            'product_id': product.id,
+            'product_name': product.name,
+            'requested': quantities[product.id],
+            'available': product.stock
+        }
+        for product in sorted(products, key=lambda p: p.id)
+        if product.stock < quantities[product.id]
+    ]
+
+def insufficient_stock_response(shortages):
+    """400 response listing every cart item that is short on stock"""
+    if shortages:
+        error = 'Insufficient stock for ' + ', '.join(s['product_name'] for s in shortages)
+    else:
+        error = 'Stock changed during checkout, please try again'
+    return jsonify({'error': error, 'items': shortages}), 400
+
 @orders_bp.route('', methods=['GET'])
 @jwt_required()
 def get_orders():
@@ -14,28 +96,51 @@ def get_orders():
         user_id = get_jwt_identity()
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        fields = requested_order_fields()
+        
+        query = Order.query.filter_by(user_id=user_id)
+        
+        if cursor_requested():
+            columns = [Order.created_at, Order.id]
+            orders, next_cursor = keyset_page(
+                query.options(*order_serializer.load_options(fields, columns)), columns, 'created_at',
+                request.args.get('cursor'), per_page
+            )
+            result = {
+                'orders': order_serializer.many(orders, fields),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+            if include_total():
+                result['total'] = cached_total(
+                    ('orders', user_id), Order.query.filter_by(user_id=user_id)
+                )
+            return jsonify(result), 200
         
-        pagination = Order.query.filter_by(user_id=user_id)\
+        pagination = query.options(*order_serializer.load_options(fields))\
             .order_by(Order.created_at.desc())\
             .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
-            'orders': [order.to_dict() for order in pagination.items],
+            'orders': order_serializer.many(pagination.items, fields),
             'total': pagination.total,
             'pages': pagination.pages,
             'current_page': page
         }), 200
     
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<order_id>', methods=['GET'])
 @jwt_required()
+@conditional(order_version, private=True)
 def get_order(order_id):
     """Get order details"""
     try:
         user_id = get_jwt_identity()
-        order = Order.query.filter_by(id=order_id, user_id=user_id).first()
+        order = orders_with_items().filter_by(id=order_id, user_id=user_id).first()
         
         if not order:
             return jsonify({'error': 'Order not found'}), 404
@@ -52,12 +157,8 @@ def get_order(order_id):
 def create_order():
     """Create a new order from cart"""
     try:
+        # The token check already proved the user exists and is active
         user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user:
-            return jsonify({'error': 'User not found'}), 404
-        
         data = request.get_json()
         
         # Validate shipping address
@@ -65,30 +166,29 @@ def create_order():
             return jsonify({'error': 'Shipping address is required'}), 400
         
         # Get cart items
-        cart_items = CartItem.query.filter_by(user_id=user_id).all()
+        cart_items = CartItem.query.options(joinedload(CartItem.product))\
+            .filter_by(user_id=user_id).order_by(CartItem.added_at, CartItem.id).all()
         
         if not cart_items:
             return jsonify({'error': 'Cart is empty'}), 400
         
         # Calculate total
         total_price = 0
-        order_items_data = []
+        quantities = {}
         
         for cart_item in cart_items:
-            # Check stock
-            if cart_item.product.stock < cart_item.quantity:
-                return jsonify({
-                    'error': f'Insufficient stock for {cart_item.product.name}'
-                }), 400
-            
-            subtotal = cart_item.product.price * cart_item.quantity
-            total_price += subtotal
-            
-            order_items_data.append({
-                'product_id': cart_item.product_id,
-                'quantity': cart_item.quantity,
-                'price': cart_item.product.price
-            })
+            total_price += cart_item.product.price * cart_item.quantity
+            quantities[cart_item.product_id] = \
+                quantities.get(cart_item.product_id, 0) + cart_item.quantity
+        
+        # Fail fast on what we already loaded; the UPDATE below is authoritative
+        shortages = stock_shortages(quantities, {item.product for item in cart_items})
+        if shortages:
+            return insufficient_stock_response(shortages)
+        
+        if not reserve_stock(quantities):
+            db.session.rollback()
+            return insufficient_stock_response(stock_shortages(quantities))
         
         # Calculate tax (8% for India)
         tax = int(total_price * 0.08)
@@ -104,28 +204,30 @@ def create_order():
             status='pending'
         )
         
+        # Create order items, snapshotting what the customer saw
+        for cart_item in cart_items:
+            order.items.append(OrderItem(
+                product_id=cart_item.product_id,
+                product_name=cart_item.product.name,
+                product_image_url=cart_item.product.image_url,
+                quantity=cart_item.quantity,
+                price_at_purchase=cart_item.product.price
+            ))
+        order.item_count = sum(item.quantity for item in order.items)
+        order.thumbnail_url = next(
+            (item.product_image_url for item in order.items if item.product_image_url), None
+        )
+        
         db.session.add(order)
-        db.session.flush()  # Get order ID
-        
-        # Create order items
-        for item_data in order_items_data:
-            order_item = OrderItem(
-                order_id=order.id,
-                product_id=item_data['product_id'],
-                quantity=item_data['quantity'],
-                price_at_purchase=item_data['price']
-            )
-            db.session.add(order_item)
-            
-            # Reduce product stock
-            product = Product.query.get(item_data['product_id'])
-            product.stock -= item_data['quantity']
         
         # Clear cart
         CartItem.query.filter_by(user_id=user_id).delete()
         
         db.session.commit()
         
+        # Reload with items and products in a fixed number of queries
+        order = orders_with_items().filter_by(id=order.id).one()
+        
         return jsonify({
             'message': 'Order created successfully',
             'order': order.to_dict()
@@ -136,16 +238,10 @@ def create_order():
         return jsonify({'error': str(e)}), 500
 
 @orders_bp.route('/<order_id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_order(order_id):
     """Update order status (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         order = Order.query.get(order_id)
         
         if not order:
@@ -166,6 +262,8 @@ def update_order(order_id):
         
         db.session.commit()
         
+        order = orders_with_items().filter_by(id=order.id).one()
+        
         return jsonify({
             'message': 'Order updated successfully',
             'order': order.to_dict()
@@ -197,6 +295,8 @@ def confirm_payment(order_id):
         
         db.session.commit()
         
+        order = orders_with_items().filter_by(id=order.id).one()
+        
         return jsonify({
             'message': 'Payment confirmed',
             'order': order.to_dict()
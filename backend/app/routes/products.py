@@ -1,62 +1,326 @@
-from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
+import math
+from datetime import datetime
+from flask import Blueprint, request, jsonify, current_app, g
+from functools import lru_cache
+from sqlalchemy import or_, text
 from app import db
-from app.models import Product, Review, User
+from app.authz import admin_required
+from app.catalog_import import parse_boolean, parse_integer
+from app.models import CatalogVersion, Product, Review
+from app.replicas import reads_from_replica
+from app.serializers import InvalidFields, product_serializer
+from app.signals import mark_products_changed
+from app.search import get_search_backend
+from app.conditional import add_validators, conditional, evaluate
+from app.facets import get_catalog_summary
+from app.catalog_index import get_catalog_index
+from app.cache import cached_response, product_tag, LIST_TAG, CATEGORIES_TAG
+from app.pagination import (
+    InvalidCursor, cursor_requested, decode_cursor, encode_cursor, keyset_page,
+    offset_cursor_page, cached_total, include_total
+)
 
 products_bp = Blueprint('products', __name__, url_prefix='/api/products')
 
+# sort_by -> (keyset columns ending with the id tie-breaker, descending)
+SORT_KEYS = {
+    'price_asc': ([Product.price, Product.id], False),
+    'price_desc': ([Product.price, Product.id], True),
+    'rating': ([Product.rating, Product.id], True),
+    'created_at': ([Product.created_at, Product.id], True),
+}
+
+# Fields PATCH /batch may change, with their SQL types
+BATCH_FIELDS = ('price', 'stock', 'category', 'is_active')
+BATCH_FIELD_TYPES = {'price': 'INTEGER', 'stock': 'INTEGER', 'category': 'VARCHAR(50)', 'is_active': 'BOOLEAN'}
+
+def catalog_version_statement():
+    return db.select(CatalogVersion.version).filter_by(id=1)
+
+def product_version_statement(product_id):
+    return db.select(Product.updated_at).filter_by(id=product_id)
+
+def categories_statement():
+    return db.select(Product.category).distinct().filter_by(is_active=True)
+
+def listing_filters():
+    """category, min_price, max_price and in_stock from the query string"""
+    category = request.args.get('category')
+    return {
+        'category': category if category and category != 'all' else None,
+        'min_price': request.args.get('min_price', type=int),
+        'max_price': request.args.get('max_price', type=int),
+        'in_stock': request.args.get('in_stock', '').lower() in ('1', 'true', 'yes'),
+    }
+
+def filter_products(query, category=None, min_price=None, max_price=None, in_stock=False):
+    """Narrow a product query (or select) to the listing filters"""
+    if category:
+        query = query.filter(Product.category == category)
+    if min_price is not None:
+        query = query.filter(Product.price >= min_price)
+    if max_price is not None:
+        query = query.filter(Product.price <= max_price)
+    if in_stock:
+        query = query.filter(Product.stock > 0)
+    return query
+
+def offset_order(sort_by):
+    """ORDER BY clauses for page-numbered product lists
+
+    The id tie-breaker, in the same direction as the sort column, keeps pages
+    stable across equal values and identical to the catalog index's pages.
+    """
+    columns, descending = SORT_KEYS[sort_by if sort_by in SORT_KEYS else 'created_at']
+    return [column.desc() if descending else column.asc() for column in columns]
+
+def catalog_version(**kwargs):
+    """HTTP validator for catalog pages: the count of committed product changes"""
+    g.catalog_version = db.session.scalar(catalog_version_statement())
+    return (g.catalog_version,)
+
+def product_version(product_id):
+    """HTTP validator for one product (None if it does not exist)"""
+    updated_at = db.session.scalar(product_version_statement(product_id))
+    return (updated_at,) if updated_at else None
+
+def load_products_in_order(product_ids, fields=None):
+    """Load products by id, preserving the order of ``product_ids``"""
+    query = Product.query.options(*product_serializer.load_options(fields))\
+        .filter(Product.id.in_(product_ids))
+    products = {p.id: p for p in query}
+    return [products[pid] for pid in product_ids if pid in products]
+
+def ranked_page(product_ids, page, per_page, fields=None):
+    """Build a products page from an ordered list of product ids"""
+    if cursor_requested():
+        page_ids, next_cursor = offset_cursor_page(
+            product_ids, request.args.get('cursor'), per_page
+        )
+        return {
+            'products': product_serializer.many(load_products_in_order(page_ids, fields), fields),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None,
+            'total': len(product_ids)
+        }
+    
+    page = max(page, 1)
+    page_ids = product_ids[(page - 1) * per_page:page * per_page]
+    
+    return {
+        'products': product_serializer.many(load_products_in_order(page_ids, fields), fields),
+        'total': len(product_ids),
+        'pages': math.ceil(len(product_ids) / per_page) if per_page > 0 else 0,
+        'current_page': page
+    }
+
+def parse_batch_item(item):
+    """Validate one batch update; returns (key column, key value, changes)"""
+    if not isinstance(item, dict):
+        raise ValueError('Each item must be an object')
+    if item.get('id'):
+        key = ('id', str(item['id']))
+    elif item.get('sku'):
+        key = ('sku', str(item['sku']))
+    else:
+        raise ValueError('Each item needs an id or sku')
+    
+    unknown = set(item) - {'id', 'sku', *BATCH_FIELDS}
+    if unknown:
+        raise ValueError(f'Unsupported fields: {", ".join(sorted(unknown))}')
+    
+    changes = {}
+    if 'price' in item:
+        changes['price'] = parse_integer(item['price'], 'price')
+    if 'stock' in item:
+        changes['stock'] = parse_integer(item['stock'], 'stock')
+    if 'category' in item:
+        category = str(item['category'] or '').strip()
+        if not category or len(category) > 50:
+            raise ValueError('category must be 1-50 characters')
+        changes['category'] = category
+    if 'is_active' in item:
+        changes['is_active'] = parse_boolean(item['is_active'], 'is_active')
+    if not changes:
+        raise ValueError('Nothing to update')
+    return key[0], key[1], changes
+
+@lru_cache(maxsize=16)
+def batch_update_statement(count):
+    """UPDATE joined to a VALUES list of ``count`` (id, field...) rows
+    
+    NULL leaves a field as it is. Works on PostgreSQL and SQLite 3.33+.
+    """
+    rows = ', '.join(
+        '(:id_%d, %s)' % (i, ', '.join(
+            f'CAST(:{field}_{i} AS {BATCH_FIELD_TYPES[field]})' for field in BATCH_FIELDS
+        ))
+        for i in range(count)
+    )
+    assignments = ', '.join(
+        f'{field} = COALESCE(v.column{n}, {Product.__tablename__}.{field})'
+        for n, field in enumerate(BATCH_FIELDS, start=2)
+    )
+    return text(
+        f'UPDATE {Product.__tablename__} SET {assignments}, updated_at = :updated_at '
+        f'FROM (VALUES {rows}) AS v WHERE {Product.__tablename__}.id = v.column1'
+    )
+
+def apply_batch_updates(entries):
+    """Apply validated (index, key column, key value, changes) entries set-based
+    
+    Returns {index: (product id or None, status)}; does not commit.
+    """
+    ids = [value for _, column, value, _ in entries if column == 'id']
+    skus = [value for _, column, value, _ in entries if column == 'sku']
+    rows = db.session.execute(
+        db.select(Product.id, Product.sku, *[getattr(Product, f) for f in BATCH_FIELDS])
+        .where(or_(Product.id.in_(ids), Product.sku.in_(skus)))
+    ).all()
+    by_key = {('id', row.id): row for row in rows}
+    by_key.update({('sku', row.sku): row for row in rows if row.sku})
+    
+    results = {}
+    new_values = {}
+    for index, column, value, changes in entries:
+        row = by_key.get((column, value))
+        if row is None:
+            results[index] = (None, 'not_found')
+            continue
+        # Later items for the same product win
+        target = new_values.setdefault(row.id, {})
+        for field, new_value in changes.items():
+            if getattr(row, field) != new_value:
+                target[field] = new_value
+            else:
+                target.pop(field, None)
+        results[index] = (row.id, 'updated' if target else 'unchanged')
+    
+    new_values = {pid: values for pid, values in new_values.items() if values}
+    if not new_values:
+        return results
+    
+    params = {'updated_at': datetime.utcnow()}
+    for i, (product_id, values) in enumerate(new_values.items()):
+        params[f'id_{i}'] = product_id
+        for field in BATCH_FIELDS:
+            params[f'{field}_{i}'] = values.get(field)
+    db.session.execute(batch_update_statement(len(new_values)), params)
+    fields = {field for values in new_values.values() for field in values}
+    mark_products_changed(db.session, list(new_values), fields | {'updated_at'})
+    return results
+
+def indexed_page(index, sort_by, filters, page, per_page, fields=None):
+    """Build a products page from the in-memory catalog index"""
+    sort_key = sort_by if sort_by in SORT_KEYS else 'created_at'
+    columns, descending = SORT_KEYS[sort_key]
+    column = columns[0].key
+    # Catch up with the writes the catalog validator has already seen
+    index.sync(g.get('catalog_version'))
+    
+    if cursor_requested():
+        cursor = request.args.get('cursor')
+        after = decode_cursor(cursor, sort_key, columns) if cursor else None
+        product_ids, last, total = index.keyset_page(column, descending, after, max(per_page, 1), **filters)
+        next_cursor = encode_cursor(sort_key, last) if last else None
+        result = {
+            'products': product_serializer.many(load_products_in_order(product_ids, fields), fields),
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
+        }
+        if include_total():
+            result['total'] = total
+        return result
+    
+    # Same defaults as Query.paginate(error_out=False)
+    if per_page < 1:
+        per_page = 20
+    product_ids, total = index.page(column, descending, max(page, 1), per_page, **filters)
+    return {
+        'products': product_serializer.many(load_products_in_order(product_ids, fields), fields),
+        'total': total,
+        'pages': math.ceil(total / per_page),
+        'current_page': page
+    }
+
 @products_bp.route('', methods=['GET'])
+@reads_from_replica
+@conditional(catalog_version)
+@cached_response([LIST_TAG])
 def get_products():
     """Get all products with filtering and pagination"""
     try:
         # Query parameters
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
-        category = request.args.get('category')
         search = request.args.get('search')
-        sort_by = request.args.get('sort_by', 'created_at')  # price, rating, created_at
+        sort_by = request.args.get('sort_by', 'created_at')  # price, rating, created_at, relevance
+        filters = listing_filters()  # category, min_price, max_price, in_stock
+        fields = product_serializer.requested_fields()  # sparse fieldset, e.g. fields=id,name,price
         
-        # Build query
-        query = Product.query.filter_by(is_active=True)
+        # Listing without search: answered in memory when the catalog index is on
+        index = get_catalog_index()
+        if index is not None and not search:
+            return jsonify(indexed_page(index, sort_by, filters, page, per_page, fields)), 200
         
-        # Filter by category
-        if category and category != 'all':
-            query = query.filter_by(category=category)
+        # Build query
+        query = filter_products(Product.query.filter_by(is_active=True), **filters)
         
-        # Search by name or description
+        # Full-text search, ranked by relevance unless another sort is asked for
         if search:
-            search_term = f"%{search}%"
-            query = query.filter(
-                db.or_(
-                    Product.name.ilike(search_term),
-                    Product.description.ilike(search_term)
-                )
+            product_ids = get_search_backend().search(
+                search,
+                category=filters['category'],
+                limit=current_app.config['SEARCH_MAX_RESULTS']
             )
+            if sort_by == 'relevance' or 'sort_by' not in request.args:
+                if filters['min_price'] is not None or filters['max_price'] is not None or filters['in_stock']:
+                    allowed = set(db.session.scalars(
+                        query.with_entities(Product.id).filter(Product.id.in_(product_ids))
+                    ))
+                    product_ids = [pid for pid in product_ids if pid in allowed]
+                return jsonify(ranked_page(product_ids, page, per_page, fields)), 200
+            query = query.filter(Product.id.in_(product_ids))
+        
+        # Keyset pagination: constant cost per page, total only on request
+        if cursor_requested():
+            columns, descending = SORT_KEYS.get(sort_by, SORT_KEYS['created_at'])
+            products, next_cursor = keyset_page(
+                query.options(*product_serializer.load_options(fields, columns)), columns, sort_by if sort_by in SORT_KEYS else 'created_at',
+                request.args.get('cursor'), per_page, descending=descending
+            )
+            result = {
+                'products': product_serializer.many(products, fields),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+            if include_total():
+                result['total'] = cached_total(('products', search, *filters.values()), query)
+            return jsonify(result), 200
         
         # Sort
-        if sort_by == 'price_asc':
-            query = query.order_by(Product.price.asc())
-        elif sort_by == 'price_desc':
-            query = query.order_by(Product.price.desc())
-        elif sort_by == 'rating':
-            query = query.order_by(Product.rating.desc())
-        else:
-            query = query.order_by(Product.created_at.desc())
+        query = query.order_by(*offset_order(sort_by))
         
         # Paginate
-        pagination = query.paginate(page=page, per_page=per_page, error_out=False)
+        pagination = query.options(*product_serializer.load_options(fields))\
+            .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
-            'products': [p.to_dict() for p in pagination.items],
+            'products': product_serializer.many(pagination.items, fields),
             'total': pagination.total,
             'pages': pagination.pages,
             'current_page': page
         }), 200
     
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<product_id>', methods=['GET'])
+@reads_from_replica
+@conditional(product_version)
+@cached_response(lambda product_id: [product_tag(product_id)])
 def get_product(product_id):
     """Get product details"""
     try:
@@ -73,16 +337,10 @@ def get_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('', methods=['POST'])
-@jwt_required()
+@admin_required
 def create_product():
     """Create a new product (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         data = request.get_json()
         
         # Validate
@@ -91,6 +349,7 @@ def create_product():
             return jsonify({'error': 'Missing required fields'}), 400
         
         product = Product(
+            sku=data.get('sku'),
             name=data['name'],
             description=data.get('description', ''),
             price=int(data['price']),
@@ -113,16 +372,10 @@ def create_product():
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<product_id>', methods=['PUT'])
-@jwt_required()
+@admin_required
 def update_product(product_id):
     """Update product (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         product = Product.query.get(product_id)
         
         if not product:
@@ -131,6 +384,8 @@ def update_product(product_id):
         data = request.get_json()
         
         # Update fields
+        if 'sku' in data:
+            product.sku = data['sku']
         if 'name' in data:
             product.name = data['name']
         if 'description' in data:
@@ -156,16 +411,10 @@ def update_product(product_id):
         return jsonify({'error': str(e)}), 500
 
 @products_bp.route('/<product_id>', methods=['DELETE'])
-@jwt_required()
+@admin_required
 def delete_product(product_id):
     """Delete product (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         product = Product.query.get(product_id)
         
         if not product:
@@ -182,12 +431,81 @@ def delete_product(product_id):
         db.session.rollback()
         return jsonify({'error': str(e)}), 500
 
+@products_bp.route('/batch', methods=['PATCH'])
+@admin_required
+def batch_update_products():
+    """Update price, stock, category or active flag of many products (admin only)"""
+    try:
+        data = request.get_json()
+        items = data.get('items') if isinstance(data, dict) else None
+        
+        if not isinstance(items, list) or not items:
+            return jsonify({'error': 'items must be a non-empty list'}), 400
+        
+        max_items = current_app.config.get('PRODUCT_BATCH_MAX_ITEMS', 100000)
+        if len(items) > max_items:
+            return jsonify({'error': f'At most {max_items} items per request'}), 400
+        
+        atomic = bool(data.get('atomic', False))
+        try:
+            chunk_size = min(max(parse_integer(data.get('chunk_size', 500), 'chunk_size'), 1), 2000)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        results = [None] * len(items)
+        valid = []
+        for index, item in enumerate(items):
+            try:
+                valid.append((index, *parse_batch_item(item)))
+            except (ValueError, TypeError) as e:
+                results[index] = {'index': index, 'status': 'invalid', 'error': str(e)}
+        
+        # Atomic batches are all-or-nothing: reject before writing anything
+        if atomic and len(valid) < len(items):
+            return jsonify({
+                'error': 'Batch rejected: some items are invalid',
+                'results': [r for r in results if r is not None]
+            }), 400
+        
+        for start in range(0, len(valid), chunk_size):
+            chunk = valid[start:start + chunk_size]
+            for index, (product_id, status) in apply_batch_updates(chunk).items():
+                results[index] = {'index': index, 'id': product_id, 'status': status}
+            
+            if atomic:
+                if any(results[index]['status'] == 'not_found' for index, *_ in chunk):
+                    db.session.rollback()
+                    return jsonify({
+                        'error': 'Batch rejected: some products were not found',
+                        'results': [r for r in results if r and r['status'] in ('invalid', 'not_found')]
+                    }), 404
+            else:
+                db.session.commit()
+        
+        db.session.commit()
+        
+        summary = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+        
+        return jsonify({
+            'message': 'Batch processed',
+            'summary': summary,
+            'results': results
+        }), 200
+    
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
 @products_bp.route('/categories', methods=['GET'])
+@reads_from_replica
+@conditional(catalog_version)
+@cached_response([CATEGORIES_TAG])
 def get_categories():
     """Get all product categories"""
     try:
-        categories = db.session.query(Product.category).distinct().filter_by(is_active=True).all()
-        category_list = [cat[0] for cat in categories]
+        category_list = db.session.scalars(categories_statement()).all()
         
         return jsonify({
             'categories': category_list
@@ -195,3 +513,32 @@ def get_categories():
     
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@products_bp.route('/facets', methods=['GET'])
+@reads_from_replica
+def get_facets():
+    """Category counts and price/rating histograms for the current filters"""
+    try:
+        category = request.args.get('category')
+        search = request.args.get('search')
+        if not category or category == 'all':
+            category = None
+        
+        version = db.session.scalar(catalog_version_statement())
+        not_modified = evaluate((version,))
+        if not_modified is not None:
+            return not_modified
+        
+        summary = get_catalog_summary()
+        summary.sync(version)
+        product_ids = None
+        if search:
+            # Every match: facets over a ranked top-N would undercount broad queries
+            product_ids = get_search_backend().search(search, limit=None)
+        
+        response = jsonify(summary.facets(category, product_ids))
+        return add_validators(response), 200
+    
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
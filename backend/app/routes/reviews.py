@@ -1,28 +1,128 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy import func
 from app import db
 from app.models import Review, Product, User, Order, OrderItem
+from app.ratings import STARS, apply_rating_change
+from app.pagination import InvalidCursor, cursor_requested, keyset_page, cached_total, include_total
+from app.counters import counters
+from app.replicas import reads_from_replica
+from app.conditional import conditional
+from app.serializers import InvalidFields, review_serializer
 
 reviews_bp = Blueprint('reviews', __name__, url_prefix='/api/reviews')
 
+counters.register('review_helpful', Review.helpful_count, rollup=(Product.helpful_votes, Review.product_id))
+
+# sort= -> (keyset columns, descending); one direction for every column, so
+# ties go to the newest review, except under rating_asc (oldest first)
+REVIEW_SORT_KEYS = {
+    'recent': ([Review.created_at, Review.id], True),
+    'helpful': ([Review.helpful_count, Review.created_at, Review.id], True),
+    'rating_desc': ([Review.rating, Review.created_at, Review.id], True),
+    'rating_asc': ([Review.rating, Review.created_at, Review.id], False),
+}
+
+def review_sort():
+    """``(sort key, columns, descending)`` for ``sort=``, ``recent`` by default"""
+    sort = request.args.get('sort', 'recent')
+    if sort not in REVIEW_SORT_KEYS:
+        sort = 'recent'
+    return (sort, *REVIEW_SORT_KEYS[sort])
+
+def review_filters():
+    """rating and verified from the query string"""
+    return {
+        'rating': request.args.get('rating', type=int),
+        'verified': request.args.get('verified', '').lower() in ('1', 'true', 'yes'),
+    }
+
+def filter_reviews(query, rating=None, verified=False):
+    """Narrow a review query (or select) to the list filters"""
+    if rating is not None:
+        query = query.filter(Review.rating == rating)
+    if verified:
+        query = query.filter(Review.is_verified.is_(True))
+    return query
+
+def rating_summary_statement(product_id):
+    return db.select(
+        Product.rating, Product.review_count,
+        *[getattr(Product, f'rating_{star}_count') for star in STARS]
+    ).where(Product.id == product_id)
+
+def rating_summary(row):
+    """Average, count and star distribution from a product's rating aggregates"""
+    return {
+        'average': row.rating,
+        'count': row.review_count,
+        'distribution': {str(star): getattr(row, f'rating_{star}_count') for star in STARS}
+    }
+
+def reviews_version_statement(product_id):
+    # The product's rating aggregates change with every review insert, delete
+    # and rating edit, helpful_votes with every counter flush; the newest
+    # updated_at (an index seek) catches comment edits
+    latest = db.select(func.max(Review.updated_at))\
+        .where(Review.product_id == product_id).scalar_subquery()
+    return db.select(
+        latest, Product.review_count, Product.rating_sum, Product.helpful_votes,
+        *[getattr(Product, f'rating_{star}_count') for star in STARS]
+    ).where(Product.id == product_id)
+
+def reviews_version(product_id):
+    """HTTP validator for a product's review pages, None for an unknown product"""
+    row = db.session.execute(reviews_version_statement(product_id)).first()
+    return tuple(row) if row else None
+
 @reviews_bp.route('/product/<product_id>', methods=['GET'])
+@reads_from_replica
+@conditional(reviews_version)
 def get_product_reviews(product_id):
-    """Get all reviews for a product"""
+    """Get reviews for a product, with its star distribution"""
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        sort, columns, descending = review_sort()  # recent, helpful, rating_desc, rating_asc
+        filters = review_filters()  # rating, verified
+        fields = review_serializer.requested_fields()
+        
+        # Kept up to date by every review write; no aggregate over reviews
+        summary = db.session.execute(rating_summary_statement(product_id)).first()
+        if not summary:
+            return jsonify({'error': 'Product not found'}), 404
         
-        pagination = Review.query.filter_by(product_id=product_id)\
-            .order_by(Review.created_at.desc())\
+        query = filter_reviews(Review.query.filter_by(product_id=product_id), **filters)
+        
+        if cursor_requested():
+            reviews, next_cursor = keyset_page(
+                query.options(*review_serializer.load_options(fields, columns)), columns, sort,
+                request.args.get('cursor'), per_page, descending=descending
+            )
+            result = {
+                'reviews': review_serializer.many(reviews, fields),
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None,
+                'rating_summary': rating_summary(summary)
+            }
+            if include_total():
+                result['total'] = cached_total(('reviews', product_id, *filters.values()), query)
+            return jsonify(result), 200
+        
+        pagination = query.options(*review_serializer.load_options(fields))\
+            .order_by(*[column.desc() if descending else column.asc() for column in columns])\
             .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
-            'reviews': [review.to_dict() for review in pagination.items],
+            'reviews': review_serializer.many(pagination.items, fields),
             'total': pagination.total,
             'pages': pagination.pages,
-            'current_page': page
+            'current_page': page,
+            'rating_summary': rating_summary(summary)
         }), 200
     
+    except (InvalidCursor, InvalidFields) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -62,14 +162,16 @@ def create_review(product_id):
         
         is_verified = order_item is not None
         
-        # Check if user already reviewed
+        # Check if user already reviewed; the row lock keeps a concurrent edit
+        # from applying its rating delta against the same old rating
         existing_review = Review.query.filter_by(
             product_id=product_id,
             user_id=user_id
-        ).first()
+        ).with_for_update().first()
         
         if existing_review:
             # Update review
+            apply_rating_change(product_id, old_rating=existing_review.rating, new_rating=rating)
             existing_review.rating = rating
             existing_review.comment = data.get('comment', '')
             existing_review.is_verified = is_verified
@@ -84,12 +186,7 @@ def create_review(product_id):
                 is_verified=is_verified
             )
             db.session.add(review)
-            product.review_count += 1
-        
-        # Update product rating
-        avg_rating = db.session.query(db.func.avg(Review.rating))\
-            .filter_by(product_id=product_id).scalar()
-        product.rating = float(avg_rating) if avg_rating else 0
+            apply_rating_change(product_id, new_rating=rating)
         
         db.session.commit()
         
@@ -108,7 +205,7 @@ def update_review(review_id):
     """Update a review"""
     try:
         user_id = get_jwt_identity()
-        review = Review.query.get(review_id)
+        review = Review.query.filter_by(id=review_id).with_for_update().first()
         
         if not review:
             return jsonify({'error': 'Review not found'}), 404
@@ -122,17 +219,12 @@ def update_review(review_id):
             rating = int(data['rating'])
             if rating < 1 or rating > 5:
                 return jsonify({'error': 'Rating must be between 1 and 5'}), 400
+            apply_rating_change(review.product_id, old_rating=review.rating, new_rating=rating)
             review.rating = rating
         
         if 'comment' in data:
             review.comment = data['comment']
         
-        # Update product rating
-        product = review.product
-        avg_rating = db.session.query(db.func.avg(Review.rating))\
-            .filter_by(product_id=product.id).scalar()
-        product.rating = float(avg_rating) if avg_rating else 0
-        
         db.session.commit()
         
         return jsonify({
@@ -150,7 +242,7 @@ def delete_review(review_id):
     """Delete a review"""
     try:
         user_id = get_jwt_identity()
-        review = Review.query.get(review_id)
+        review = Review.query.filter_by(id=review_id).with_for_update().first()
         
         if not review:
             return jsonify({'error': 'Review not found'}), 404
@@ -158,16 +250,9 @@ def delete_review(review_id):
         if review.user_id != user_id:
             return jsonify({'error': 'You can only delete your own reviews'}), 403
         
-        product = review.product
-        product.review_count = max(0, product.review_count - 1)
-        
+        apply_rating_change(review.product_id, old_rating=review.rating)
         db.session.delete(review)
         
-        # Update product rating
-        avg_rating = db.session.query(db.func.avg(Review.rating))\
-            .filter_by(product_id=product.id).scalar()
-        product.rating = float(avg_rating) if avg_rating else 0
-        
         db.session.commit()
         
         return jsonify({
@@ -187,14 +272,13 @@ def mark_helpful(review_id):
         if not review:
             return jsonify({'error': 'Review not found'}), 404
         
-        review.helpful_count += 1
-        db.session.commit()
+        # Buffered and written in batches, no row lock on the request path
+        counters.increment('review_helpful', review.id)
         
         return jsonify({
             'message': 'Marked as helpful',
-            'helpful_count': review.helpful_count
+            'helpful_count': review.helpful_count + counters.pending('review_helpful', review.id)
         }), 200
     
     except Exception as e:
-        db.session.rollback()
         return jsonify({'error': str(e)}), 500
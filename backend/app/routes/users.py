@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify
-from flask_jwt_extended import jwt_required, get_jwt_identity
 from app import db
+from app.authz import admin_required, revoke_user_tokens
 from app.models import User
+from app.replicas import reads_from_replica
+from app.pagination import InvalidCursor, cursor_requested, keyset_page, cached_total, include_total
 
 users_bp = Blueprint('users', __name__, url_prefix='/api/users')
 
 @users_bp.route('/<user_id>', methods=['GET'])
+@reads_from_replica
 def get_user(user_id):
     """Get public user information"""
     try:
@@ -27,20 +30,29 @@ def get_user(user_id):
         return jsonify({'error': str(e)}), 500
 
 @users_bp.route('/admin/list', methods=['GET'])
-@jwt_required()
+@admin_required
 def list_users():
     """Get all users (admin only)"""
     try:
-        user_id = get_jwt_identity()
-        user = User.query.get(user_id)
-        
-        if not user or not user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
         
-        pagination = User.query.paginate(page=page, per_page=per_page, error_out=False)
+        if cursor_requested():
+            users, next_cursor = keyset_page(
+                User.query, [User.created_at, User.id], 'created_at',
+                request.args.get('cursor'), per_page, descending=False
+            )
+            result = {
+                'users': [u.to_dict() for u in users],
+                'next_cursor': next_cursor,
+                'has_more': next_cursor is not None
+            }
+            if include_total():
+                result['total'] = cached_total(('users',), User.query)
+            return jsonify(result), 200
+        
+        pagination = User.query.order_by(User.created_at, User.id)\
+            .paginate(page=page, per_page=per_page, error_out=False)
         
         return jsonify({
             'users': [u.to_dict() for u in pagination.items],
@@ -49,26 +61,24 @@ def list_users():
             'current_page': page
         }), 200
     
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @users_bp.route('/admin/<user_id>/toggle-admin', methods=['PUT'])
-@jwt_required()
+@admin_required
 def toggle_admin(user_id):
     """Toggle admin status for user (admin only)"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if not current_user or not current_user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         user = User.query.get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         user.is_admin = not user.is_admin
+        # Tokens carry the old role claim
+        revoke_user_tokens(user)
         db.session.commit()
         
         return jsonify({
@@ -81,22 +91,17 @@ def toggle_admin(user_id):
         return jsonify({'error': str(e)}), 500
 
 @users_bp.route('/admin/<user_id>/toggle-active', methods=['PUT'])
-@jwt_required()
+@admin_required
 def toggle_active(user_id):
     """Toggle active status for user (admin only)"""
     try:
-        current_user_id = get_jwt_identity()
-        current_user = User.query.get(current_user_id)
-        
-        if not current_user or not current_user.is_admin:
-            return jsonify({'error': 'Admin access required'}), 403
-        
         user = User.query.get(user_id)
         
         if not user:
             return jsonify({'error': 'User not found'}), 404
         
         user.is_active = not user.is_active
+        revoke_user_tokens(user)
         db.session.commit()
         
         return jsonify({
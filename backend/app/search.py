@@ -0,0 +1,479 @@
+"""Product full-text search
+
+The ``search`` parameter of ``GET /api/products`` is answered by a pluggable
+backend selected with the ``SEARCH_BACKEND`` setting:
+
+- ``memory``: per-worker inverted index with BM25 ranking over product name
+  and description. Built on first use and kept current from the
+  ``products_changed`` signal, plus a periodic catch-up on ``updated_at`` so
+  writes made by other workers become visible.
+- ``sql``: the database's own full-text engine (SQLite FTS5 or PostgreSQL
+  ``tsvector``), for catalogs too big to hold in every worker.
+- ``like``: the original ``ILIKE`` scan, kept for databases without either.
+
+Every backend returns ranked product ids; filtering by category and
+pagination are applied on top by the route.
+"""
+import heapq
+import math
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import text
+
+from app import db
+from app.signals import products_changed
+
+_TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+# Name matches count more than description matches
+NAME_WEIGHT = 3
+DESCRIPTION_WEIGHT = 1
+
+# Upper bound on terms a trailing prefix expands to
+MAX_PREFIX_EXPANSION = 50
+
+
+def tokenize(value):
+    """Split text into lower-case terms with naive plural folding"""
+    terms = []
+    for term in _TOKEN_RE.findall((value or '').lower()):
+        if len(term) > 3 and term.endswith('s') and not term.endswith('ss'):
+            term = term[:-1]
+        terms.append(term)
+    return terms
+
+
+class InMemorySearchBackend:
+    """Inverted index over active products with BM25 scoring"""
+
+    name = 'memory'
+
+    def __init__(self, k1=1.2, b=0.75, refresh_interval=5.0):
+        self.k1 = k1
+        self.b = b
+        self.refresh_interval = refresh_interval
+        self._lock = threading.RLock()
+        self._postings = {}     # term -> {product_id: weighted term frequency}
+        self._docs = {}         # product_id -> (terms Counter, length, category)
+        self._total_length = 0
+        self._vocabulary = None
+        self._built = False
+        self._watermark = None
+        self._last_refresh = 0.0
+        self._dirty = set()
+        products_changed.connect(self._on_products_changed)
+
+    def _on_products_changed(self, sender, product_ids=(), **kwargs):
+        with self._lock:
+            self._dirty.update(product_ids)
+
+    # Index maintenance
+
+    def index_product(self, product):
+        """Add or replace a product in the index"""
+        with self._lock:
+            self._remove(product.id)
+            if not product.is_active:
+                return
+            terms = Counter()
+            for term in tokenize(product.name):
+                terms[term] += NAME_WEIGHT
+            for term in tokenize(product.description):
+                terms[term] += DESCRIPTION_WEIGHT
+            length = sum(terms.values())
+            self._docs[product.id] = (terms, length, product.category)
+            self._total_length += length
+            for term, tf in terms.items():
+                postings = self._postings.get(term)
+                if postings is None:
+                    postings = self._postings[term] = {}
+                    self._vocabulary = None
+                postings[product.id] = tf
+
+    def remove_product(self, product_id):
+        """Drop a product from the index"""
+        with self._lock:
+            self._remove(product_id)
+
+    def _remove(self, product_id):
+        doc = self._docs.pop(product_id, None)
+        if doc is None:
+            return
+        terms, length, _ = doc
+        self._total_length -= length
+        for term in terms:
+            postings = self._postings[term]
+            postings.pop(product_id, None)
+            if not postings:
+                del self._postings[term]
+                self._vocabulary = None
+
+    def rebuild(self, batch_size=1000):
+        """Rebuild the whole index from the products table"""
+        from app.models import Product
+
+        with self._lock:
+            self._postings = {}
+            self._docs = {}
+            self._total_length = 0
+            self._vocabulary = None
+            self._dirty.clear()
+            watermark = None
+            products = db.session.execute(
+                db.select(Product).filter_by(is_active=True)
+                .execution_options(yield_per=batch_size)
+            ).scalars()
+            for product in products:
+                self.index_product(product)
+                if watermark is None or product.updated_at > watermark:
+                    watermark = product.updated_at
+            self._watermark = watermark
+            self._built = True
+            self._last_refresh = time.monotonic()
+
+    def sync(self):
+        """Bring the index up to date with committed product changes"""
+        from app.models import Product
+
+        with self._lock:
+            if not self._built:
+                self.rebuild()
+                return
+
+            stale = time.monotonic() - self._last_refresh >= self.refresh_interval
+            if not self._dirty and not stale:
+                return
+
+            changed = {}
+            if self._dirty:
+                ids = list(self._dirty)
+                self._dirty.clear()
+                for product in Product.query.filter(Product.id.in_(ids)):
+                    changed[product.id] = product
+                for product_id in ids:
+                    if product_id not in changed:
+                        self._remove(product_id)
+            if stale and self._watermark is not None:
+                # Pick up writes committed by other workers
+                query = Product.query.filter(Product.updated_at >= self._watermark)
+                for product in query:
+                    changed[product.id] = product
+
+            for product in changed.values():
+                self.index_product(product)
+                if self._watermark is None or product.updated_at > self._watermark:
+                    self._watermark = product.updated_at
+            self._last_refresh = time.monotonic()
+
+    # Querying
+
+    def _expand_prefix(self, prefix):
+        if self._vocabulary is None:
+            self._vocabulary = sorted(self._postings)
+        start = bisect_left(self._vocabulary, prefix)
+        matches = []
+        for term in self._vocabulary[start:start + MAX_PREFIX_EXPANSION]:
+            if not term.startswith(prefix):
+                break
+            matches.append(term)
+        return matches
+
+    def search(self, query, category=None, limit=1000):
+        """Return up to ``limit`` (None: all) active product ids ranked by relevance"""
+        self.sync()
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            doc_count = len(self._docs)
+            if not doc_count:
+                return []
+            avg_length = self._total_length / doc_count
+
+            # Every term must match; the last one may be a partial word
+            term_groups = [[term] for term in terms[:-1]]
+            last = terms[-1]
+            expanded = self._expand_prefix(last) if len(last) >= 2 else []
+            term_groups.append(expanded or [last])
+            # Rarest terms first so the candidate set shrinks quickly
+            term_groups.sort(key=lambda group: sum(
+                len(self._postings.get(term, ())) for term in group
+            ))
+
+            scores = None
+            for group in term_groups:
+                group_scores = {}
+                for term in group:
+                    postings = self._postings.get(term)
+                    if not postings:
+                        continue
+                    df = len(postings)
+                    idf = math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+                    for product_id, tf in postings.items():
+                        if scores is not None and product_id not in scores:
+                            continue
+                        length = self._docs[product_id][1]
+                        norm = self.k1 * (1 - self.b + self.b * length / avg_length)
+                        score = idf * tf * (self.k1 + 1) / (tf + norm)
+                        if score > group_scores.get(product_id, 0.0):
+                            group_scores[product_id] = score
+                if scores is None:
+                    scores = group_scores
+                else:
+                    scores = {pid: scores[pid] + s for pid, s in group_scores.items()}
+                if not scores:
+                    return []
+
+            if category:
+                scores = {
+                    pid: s for pid, s in scores.items()
+                    if self._docs[pid][2] == category
+                }
+            key = lambda item: (-item[1], item[0])
+            if limit is None:
+                ranked = sorted(scores.items(), key=key)
+            else:
+                ranked = heapq.nsmallest(limit, scores.items(), key=key)
+            return [product_id for product_id, _ in ranked]
+
+
+SQLITE_FTS_TRIGGERS = ('products_fts_ai', 'products_fts_ad', 'products_fts_au')
+PG_SEARCH_INDEX = 'ix_products_search'
+PG_SEARCH_DOCUMENT = (
+    "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, ''))"
+)
+
+
+def missing_search_schema(conn):
+    """Names of the ``sql`` backend's full-text structures that do not exist"""
+    dialect = conn.dialect.name
+    if dialect == 'sqlite':
+        names = ('products_fts',) + SQLITE_FTS_TRIGGERS
+        found = set(conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE name IN "
+            "('products_fts', 'products_fts_ai', 'products_fts_ad', 'products_fts_au')"
+        )).scalars())
+        # A batch migration of products rebuilds the table without the triggers
+        return [name for name in names if name not in found]
+    if dialect == 'postgresql':
+        found = conn.execute(text('SELECT to_regclass(:name)'), {'name': PG_SEARCH_INDEX}).scalar()
+        return [] if found else [PG_SEARCH_INDEX]
+    raise RuntimeError(f'No full-text search support for {dialect}')
+
+
+def create_search_schema(conn):
+    """Create the missing full-text structures
+
+    Migrations create them; this serves ``flask search rebuild`` and
+    databases made with ``create_all()`` (``DB_AUTO_CREATE``, benchmarks).
+    """
+    missing = missing_search_schema(conn)
+    if not missing:
+        return
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(
+            f'CREATE INDEX IF NOT EXISTS {PG_SEARCH_INDEX} ON products USING GIN ({PG_SEARCH_DOCUMENT})'
+        ))
+        return
+    # External-content FTS5 table kept in sync by triggers, so writes from
+    # any process or bulk statement are reflected
+    conn.execute(text(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5("
+        "name, description, content='products', content_rowid='rowid', "
+        "tokenize='porter unicode61')"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ai AFTER INSERT ON products BEGIN "
+        "INSERT INTO products_fts(rowid, name, description) "
+        "VALUES (new.rowid, new.name, new.description); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_ad AFTER DELETE ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, description) "
+        "VALUES ('delete', old.rowid, old.name, old.description); END"
+    ))
+    conn.execute(text(
+        "CREATE TRIGGER IF NOT EXISTS products_fts_au AFTER UPDATE OF name, description "
+        "ON products BEGIN "
+        "INSERT INTO products_fts(products_fts, rowid, name, description) "
+        "VALUES ('delete', old.rowid, old.name, old.description); "
+        "INSERT INTO products_fts(rowid, name, description) "
+        "VALUES (new.rowid, new.name, new.description); END"
+    ))
+    # Missing triggers mean the index may have missed writes
+    conn.execute(text("INSERT INTO products_fts(products_fts) VALUES ('rebuild')"))
+
+
+def drop_search_schema(conn):
+    """Drop the full-text structures (``flask search rebuild``)"""
+    if conn.dialect.name == 'sqlite':
+        for trigger in SQLITE_FTS_TRIGGERS:
+            conn.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+        conn.execute(text('DROP TABLE IF EXISTS products_fts'))
+    elif conn.dialect.name == 'postgresql':
+        conn.execute(text(f'DROP INDEX IF EXISTS {PG_SEARCH_INDEX}'))
+
+
+class SQLSearchBackend:
+    """Full-text search using SQLite FTS5 or PostgreSQL tsvector"""
+
+    name = 'sql'
+
+    _PG_RANKED_DOCUMENT = (
+        "setweight(to_tsvector('english', coalesce(name, '')), 'A') || "
+        "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+    )
+
+    def __init__(self):
+        self._ready = False
+
+    @property
+    def dialect(self):
+        return db.engine.dialect.name
+
+    def ensure_schema(self):
+        """Check that the full-text structures exist
+
+        They are created by the migrations (``flask db upgrade``), never on
+        the request path.
+        """
+        if self._ready:
+            return
+        with db.engine.connect() as conn:
+            missing = missing_search_schema(conn)
+        if missing:
+            raise RuntimeError(
+                f'Full-text search structures are missing ({", ".join(missing)}); '
+                'run `flask db upgrade` or `flask search rebuild`'
+            )
+        self._ready = True
+
+    def rebuild(self):
+        """Recreate the full-text structures from the products table"""
+        self._ready = False
+        with db.engine.begin() as conn:
+            drop_search_schema(conn)
+            create_search_schema(conn)
+        self.ensure_schema()
+
+    def sync(self):
+        """Database-side structures are maintained by the database itself"""
+        self.ensure_schema()
+
+    def search(self, query, category=None, limit=1000):
+        """Return up to ``limit`` (None: all) active product ids ranked by relevance"""
+        terms = tokenize(query)
+        if not terms:
+            return []
+        self.ensure_schema()
+
+        params = {}
+        category_clause = ''
+        if category:
+            category_clause = 'AND p.category = :category'
+            params['category'] = category
+
+        limit_clause = ''
+        if limit is not None:
+            limit_clause = 'LIMIT :limit'
+            params['limit'] = limit
+
+        if self.dialect == 'sqlite':
+            # Quoted terms, trailing one as a prefix: "cat" "toy"*
+            params['match'] = ' '.join(f'"{term}"' for term in terms) + '*'
+            sql = (
+                'SELECT p.id FROM products_fts '
+                'JOIN products p ON p.rowid = products_fts.rowid '
+                'WHERE products_fts MATCH :match AND p.is_active = 1 '
+                f'{category_clause} '
+                f'ORDER BY bm25(products_fts, {NAME_WEIGHT}.0, {DESCRIPTION_WEIGHT}.0) '
+                f'{limit_clause}'
+            )
+        else:
+            params['match'] = ' & '.join(terms) + ':*'
+            sql = (
+                "SELECT p.id FROM products p, to_tsquery('english', :match) q "
+                f'WHERE {PG_SEARCH_DOCUMENT} @@ q AND p.is_active '
+                f'{category_clause} '
+                f'ORDER BY ts_rank({self._PG_RANKED_DOCUMENT}, q) DESC, p.id '
+                f'{limit_clause}'
+            )
+        return [row[0] for row in db.session.execute(text(sql), params)]
+
+
+class LikeSearchBackend:
+    """Substring match on name/description (no ranking, full scan)"""
+
+    name = 'like'
+
+    def sync(self):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search(self, query, category=None, limit=1000):
+        """Return up to ``limit`` (None: all) matching active product ids, newest first"""
+        from app.models import Product
+
+        search_term = f'%{query}%'
+        ids = db.session.query(Product.id).filter(
+            Product.is_active.is_(True),
+            db.or_(
+                Product.name.ilike(search_term),
+                Product.description.ilike(search_term)
+            )
+        )
+        if category:
+            ids = ids.filter(Product.category == category)
+        ids = ids.order_by(Product.created_at.desc())
+        if limit is not None:
+            ids = ids.limit(limit)
+        return [row[0] for row in ids]
+
+
+BACKENDS = {
+    InMemorySearchBackend.name: InMemorySearchBackend,
+    SQLSearchBackend.name: SQLSearchBackend,
+    LikeSearchBackend.name: LikeSearchBackend,
+}
+
+search_cli = AppGroup('search', help='Manage the product search index.')
+
+
+@search_cli.command('rebuild')
+def rebuild_command():
+    """Rebuild the configured product search index"""
+    backend = get_search_backend()
+    started = time.perf_counter()
+    backend.rebuild()
+    click.echo(f'Rebuilt {backend.name} search index in {time.perf_counter() - started:.2f}s')
+
+
+def init_search(app):
+    """Create the configured search backend for ``app``"""
+    name = app.config.get('SEARCH_BACKEND', 'memory')
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown SEARCH_BACKEND: {name}')
+    if name == 'memory':
+        backend = InMemorySearchBackend(
+            refresh_interval=app.config.get('SEARCH_REFRESH_INTERVAL', 5.0)
+        )
+    else:
+        backend = BACKENDS[name]()
+    app.extensions['search'] = backend
+    app.cli.add_command(search_cli)
+    return backend
+
+
+def get_search_backend():
+    """Search backend of the current app"""
+    return current_app.extensions['search']
@@ -0,0 +1,220 @@
+"""Response serialization
+
+``Serializer`` builds, once per model and set of fields, a plain Python
+function turning an object into a dict (``{'id': obj.id, 'name': obj.name,
+...}``) instead of calling ``to_dict()`` field by field. List endpoints accept
+a ``fields`` query parameter (``?fields=id,name,price``): the payload only
+carries those fields and ``load_options()`` restricts the ``SELECT`` to the
+columns and relationships they need. ``id`` is always included.
+
+Datetimes are left as they are and encoded as ISO 8601 by the JSON provider,
+the same format ``to_dict()`` produces. ``JSON_BACKEND`` picks the encoder
+for every ``jsonify`` response:
+
+- ``orjson``: fast native encoder (needs the ``orjson`` package)
+- ``stdlib``: Flask's ``json`` based provider
+- ``auto``: ``orjson`` when it is installed (default)
+"""
+from datetime import date
+from decimal import Decimal
+from uuid import UUID
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.orm import joinedload, load_only, selectinload
+
+from app.models import Order, OrderItem, Product, Review, User
+
+
+class InvalidFields(ValueError):
+    """Raised when ``fields`` names a field the endpoint does not have"""
+
+
+def _default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    return DefaultJSONProvider.default(value)
+
+
+class StdlibJSONProvider(DefaultJSONProvider):
+    """Flask's provider, encoding dates as ISO 8601"""
+
+    default = staticmethod(_default)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backed by orjson"""
+
+    def __init__(self, app):
+        import orjson  # optional dependency, only needed for this provider
+
+        super().__init__(app)
+        self._orjson = orjson
+
+    def _options(self, **kwargs):
+        options = self._orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            options |= self._orjson.OPT_SORT_KEYS
+        if kwargs.get('indent') or (self.compact is None and self._app.debug) or self.compact is False:
+            options |= self._orjson.OPT_INDENT_2
+        return options
+
+    def dumps(self, obj, **kwargs):
+        return self._orjson.dumps(obj, default=_default, option=self._options(**kwargs)).decode()
+
+    def loads(self, s, **kwargs):
+        return self._orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        body = self._orjson.dumps(obj, default=_default, option=self._options())
+        return self._app.response_class(body, mimetype=self.mimetype)
+
+
+def init_json(app):
+    """Install the ``JSON_BACKEND`` provider on ``app``"""
+    backend = app.config.get('JSON_BACKEND', 'auto')
+    if backend == 'auto':
+        try:
+            import orjson  # noqa: F401
+            backend = 'orjson'
+        except ImportError:
+            backend = 'stdlib'
+    if backend == 'orjson':
+        app.json = OrjsonProvider(app)
+    elif backend == 'stdlib':
+        app.json = StdlibJSONProvider(app)
+    else:
+        raise ValueError(f'Unknown JSON_BACKEND: {backend}')
+    # Serializers produce fields in a meaningful order; keep it
+    app.json.sort_keys = False
+    app.extensions['json_backend'] = backend
+
+
+class Field:
+    """A serialized value that is not a plain column
+
+    ``expression`` is Python source over ``obj``; ``columns`` are the model
+    columns it reads and ``load`` the loader options it needs.
+    """
+
+    def __init__(self, expression, columns=(), load=(), env=None):
+        self.expression = expression
+        self.columns = tuple(columns)
+        self.load = tuple(load)
+        self.env = env or {}
+
+
+class Serializer:
+    """Precompiled ``obj -> dict`` for a model, with sparse fieldsets"""
+
+    def __init__(self, model, fields, computed=None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.computed = computed or {}
+        self._compiled = {}
+
+    def parse_fields(self, value):
+        """Requested field names in declaration order; None means all"""
+        if not value:
+            return None
+        names = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = names.difference(self.fields)
+        if unknown:
+            raise InvalidFields(
+                f'Unknown fields: {", ".join(sorted(unknown))}. '
+                f'Available: {", ".join(self.fields)}'
+            )
+        names.add('id')
+        return tuple(name for name in self.fields if name in names)
+
+    def requested_fields(self):
+        """Fields asked for with the ``fields`` query parameter"""
+        return self.parse_fields(request.args.get('fields'))
+
+    def compile(self, fields=None):
+        """The serializer function for ``fields`` (all when None)"""
+        fields = fields or self.fields
+        function = self._compiled.get(fields)
+        if function is None:
+            function = self._compiled[fields] = self._build(fields)
+        return function
+
+    def __call__(self, obj, fields=None):
+        return self.compile(fields)(obj)
+
+    def many(self, objs, fields=None):
+        function = self.compile(fields)
+        return [function(obj) for obj in objs]
+
+    def load_options(self, fields=None, extra_columns=()):
+        """Loader options selecting only what ``fields`` needs
+
+        ``extra_columns`` are loaded too (e.g. keyset sort columns read back
+        for the next cursor).
+        """
+        columns, load = {}, []
+        for name in fields or self.fields:
+            spec = self.computed.get(name)
+            if spec is None:
+                columns[name] = getattr(self.model, name)
+            else:
+                columns.update((column.key, column) for column in spec.columns)
+                load.extend(spec.load)
+        for column in extra_columns:
+            columns[column.key] = column
+        return [load_only(*columns.values()), *load]
+
+    def _build(self, fields):
+        env, items = {}, []
+        for name in fields:
+            spec = self.computed.get(name)
+            if spec is None:
+                expression = f'obj.{name}'
+            else:
+                expression = spec.expression
+                env.update(spec.env)
+            items.append(f'{name!r}: {expression}')
+        source = f'def serialize(obj):\n    return {{{", ".join(items)}}}\n'
+        code = compile(source, f'<serializer {self.model.__name__}>', 'exec')
+        exec(code, env)
+        return env['serialize']
+
+
+product_serializer = Serializer(Product, (
+    'id', 'sku', 'name', 'description', 'price', 'category', 'image_url',
+    'stock', 'rating', 'review_count', 'created_at',
+))
+
+review_serializer = Serializer(Review, (
+    'id', 'product_id', 'user_id', 'username', 'rating', 'comment',
+    'is_verified', 'helpful_count', 'created_at',
+), computed={
+    'username': Field(
+        'obj.user.username', columns=[Review.user_id],
+        load=[joinedload(Review.user).load_only(User.username)],
+    ),
+})
+
+order_item_serializer = Serializer(OrderItem, (
+    'id', 'product_id', 'product_name', 'product_image_url', 'quantity', 'price_at_purchase', 'subtotal',
+), computed={
+    'subtotal': Field('obj.price_at_purchase * obj.quantity'),
+})
+
+order_serializer = Serializer(Order, (
+    'id', 'user_id', 'total_price', 'tax', 'status', 'shipping_address',
+    'payment_method', 'items', 'item_count', 'thumbnail_url', 'order_date', 'delivery_date',
+    'created_at',
+), computed={
+    'items': Field(
+        '[_item(item) for item in obj.items]',
+        load=[selectinload(Order.items)],
+        env={'_item': order_item_serializer.compile()},
+    ),
+})
+
+# ``GET /api/orders?summary=1``: order history without line items
+ORDER_SUMMARY_FIELDS = tuple(name for name in order_serializer.fields if name != 'items')
@@ -0,0 +1,92 @@
+"""Catalog change signals
+
+Any committed change to a ``Product`` row is announced through the
+``products_changed`` signal so that derived, per-worker structures (search
+index, caches, ...) can update themselves. ORM changes are picked up
+automatically; code that updates products with bulk SQL statements must call
+``mark_products_changed()`` before committing.
+
+The same transaction also bumps the ``catalog_version`` counter, the
+catalog's HTTP validator, so the counter moves exactly when a product change
+commits, whatever the order in which concurrent transactions commit.
+"""
+from blinker import Namespace
+from sqlalchemy import event, insert, inspect, update
+from sqlalchemy.orm import Session
+
+_signals = Namespace()
+
+# Sent after commit with ``product_ids`` (frozenset of changed product ids)
+# and ``fields`` (frozenset of changed column names, or None when rows were
+# inserted/deleted or the columns are unknown)
+products_changed = _signals.signal('products-changed')
+
+_PENDING_IDS = 'changed_product_ids'
+_PENDING_FIELDS = 'changed_product_fields'
+_ALL_FIELDS = '*'
+
+
+def mark_products_changed(session, product_ids, fields=None):
+    """Record product ids changed outside the ORM unit of work"""
+    session.info.setdefault(_PENDING_IDS, set()).update(product_ids)
+    session.info.setdefault(_PENDING_FIELDS, set()).update(fields or [_ALL_FIELDS])
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_product_changes(session, flush_context):
+    from app.models import Product
+
+    created_or_deleted = [
+        obj.id for obj in (*session.new, *session.deleted)
+        if isinstance(obj, Product)
+    ]
+    if created_or_deleted:
+        mark_products_changed(session, created_or_deleted)
+
+    for obj in session.dirty:
+        if not isinstance(obj, Product):
+            continue
+        # Ignore products that are only dirty through a relationship backref
+        state = inspect(obj)
+        fields = [
+            attr.key for attr in state.mapper.column_attrs
+            if state.attrs[attr.key].history.has_changes()
+        ]
+        if fields:
+            mark_products_changed(session, [obj.id], fields)
+
+
+@event.listens_for(Session, 'before_commit')
+def _bump_catalog_version(session):
+    from app.models import CatalogVersion
+
+    # Flush first: pending ORM changes are only collected by after_flush
+    session.flush()
+    if not session.info.get(_PENDING_IDS):
+        return
+    bumped = session.execute(
+        update(CatalogVersion).where(CatalogVersion.id == 1)
+        .values(version=CatalogVersion.version + 1)
+        .execution_options(synchronize_session=False)
+    ).rowcount
+    if not bumped:
+        # Databases created without the migration that seeds the row
+        session.execute(insert(CatalogVersion).values(id=1, version=1))
+
+
+@event.listens_for(Session, 'after_commit')
+def _send_product_changes(session):
+    product_ids = session.info.pop(_PENDING_IDS, None)
+    fields = session.info.pop(_PENDING_FIELDS, None)
+    if product_ids:
+        products_changed.send(
+            session,
+            product_ids=frozenset(product_ids),
+            fields=None if _ALL_FIELDS in fields else frozenset(fields)
+        )
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop(_PENDING_IDS, None)
+    session.info.pop(_PENDING_FIELDS, None)
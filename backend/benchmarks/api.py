@@ -0,0 +1,338 @@
+"""Per-endpoint API benchmark
+
+Builds the app with ``create_app()``, generates data at one or more scales
+and measures throughput, p50/p95/p99 latency and SQL statements per call for
+every endpoint in ``app/routes/`` plus the model serializers. Results are
+written as JSON; with ``--baseline`` the run fails when a scenario's p95 grows
+by more than ``--threshold`` or it issues more queries than before.
+
+    python -m benchmarks.api --scales small,medium --output bench.json
+    python -m benchmarks.api --baseline bench.json --threshold 0.25
+"""
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from app import db
+from app.authz import create_user_token
+from app.models import CartItem, Order, OrderItem, Product, Review, User
+
+from benchmarks.common import QueryCounter, benchmark_app, summarize
+from benchmarks.data import PASSWORD, generate
+
+
+class Context:
+    """Ids, tokens and a client shared by the scenarios of one scale"""
+
+    def __init__(self, app, data, seed=7):
+        self.app = app
+        self.client = app.test_client()
+        self.rng = random.Random(seed)
+        self.product_ids = data['product_ids']
+        self.order_ids = data['order_ids']
+        self.review_ids = data['review_ids']
+        user_ids = data['user_ids']
+        self.admin_id = data['admin_id']
+        # Users toggled by admin scenarios are kept apart from the rest
+        self.victim_ids = user_ids[-5:]
+        self.user_ids = user_ids[1:-5]
+        self.counter = 0
+
+    def auth(self, user_id):
+        user = db.session.get(User, user_id)
+        return {'Authorization': f'Bearer {create_user_token(user)}'}
+
+    def pick(self, values):
+        return self.rng.choice(values)
+
+    def next_id(self):
+        self.counter += 1
+        return self.counter
+
+
+def _fill_cart(ctx, user_id, items):
+    CartItem.query.filter_by(user_id=user_id).delete()
+    for product_id in ctx.rng.sample(ctx.product_ids, items):
+        db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=1))
+    Product.query.filter(Product.id.in_(
+        db.session.query(CartItem.product_id).filter_by(user_id=user_id)
+    )).update({'stock': 1000}, synchronize_session=False)
+    db.session.commit()
+
+
+def scenarios(ctx):
+    """(blueprint, name, prepare) where prepare returns (method, url, kwargs)"""
+    admin = ctx.auth(ctx.admin_id)
+    shopper = ctx.user_ids[0]
+    shopper_headers = ctx.auth(shopper)
+    _fill_cart(ctx, shopper, 10)
+    order_of_shopper = Order.query.filter_by(user_id=shopper).first().id
+
+    def user_headers():
+        return ctx.auth(ctx.pick(ctx.user_ids))
+
+    def order_owner():
+        order_id = ctx.pick(ctx.order_ids)
+        user_id = db.session.get(Order, order_id).user_id
+        return order_id, ctx.auth(user_id)
+
+    def create_order():
+        user_id = ctx.pick(ctx.user_ids[1:])
+        _fill_cart(ctx, user_id, 3)
+        return 'POST', '/api/orders', {
+            'json': {'shipping_address': '1 Benchmark Road'}, 'headers': ctx.auth(user_id)
+        }
+
+    def change_password():
+        user_id = ctx.pick(ctx.user_ids)
+        return 'POST', '/api/auth/change-password', {
+            'json': {'old_password': PASSWORD, 'new_password': PASSWORD},
+            'headers': ctx.auth(user_id)
+        }
+
+    def cart_add():
+        user_id = ctx.pick(ctx.user_ids)
+        return 'POST', '/api/cart', {
+            'json': {'product_id': ctx.pick(ctx.product_ids), 'quantity': 1},
+            'headers': ctx.auth(user_id)
+        }
+
+    def cart_item(method, json=None):
+        def prepare():
+            user_id = ctx.pick(ctx.user_ids[1:])
+            _fill_cart(ctx, user_id, 2)
+            item = CartItem.query.filter_by(user_id=user_id).first()
+            return method, f'/api/cart/{item.id}', {'json': json, 'headers': ctx.auth(user_id)}
+        return prepare
+
+    def review_owner():
+        review = db.session.get(Review, ctx.pick(ctx.review_ids))
+        return review, ctx.auth(review.user_id)
+
+    def delete_review():
+        user_id = ctx.pick(ctx.user_ids)
+        review = Review(product_id=ctx.pick(ctx.product_ids), user_id=user_id, rating=3)
+        db.session.add(review)
+        db.session.commit()
+        return 'DELETE', f'/api/reviews/{review.id}', {'headers': ctx.auth(user_id)}
+
+    def paged(url):
+        return lambda: ('GET', url, {})
+
+    return [
+        ('auth', 'register', lambda: ('POST', '/api/auth/register', {'json': {
+            'username': f'bench{ctx.next_id()}', 'email': f'bench{ctx.counter}@example.com',
+            'password': PASSWORD}})),
+        ('auth', 'login', lambda: ('POST', '/api/auth/login', {'json': {
+            'email': db.session.get(User, ctx.pick(ctx.user_ids)).email, 'password': PASSWORD}})),
+        ('auth', 'get_profile', lambda: ('GET', '/api/auth/profile', {'headers': user_headers()})),
+        ('auth', 'update_profile', lambda: ('PUT', '/api/auth/profile', {
+            'json': {'city': 'Pune'}, 'headers': user_headers()})),
+        ('auth', 'change_password', change_password),
+
+        ('products', 'list', paged('/api/products')),
+        ('products', 'list_deep_page', paged('/api/products?page=50')),
+        ('products', 'list_category_price', paged('/api/products?category=toys&sort_by=price_asc')),
+        ('products', 'list_rating', paged('/api/products?sort_by=rating')),
+        ('products', 'list_cursor', paged('/api/products?cursor=')),
+        ('products', 'list_price_range', paged('/api/products?min_price=1000&max_price=5000&in_stock=1&sort_by=price_asc')),
+        ('products', 'list_category_created_cursor', paged('/api/products?category=food&cursor=&include_total=1')),
+        ('products', 'search', lambda: ('GET', f'/api/products?search={ctx.pick(["cat toy", "salmon", "scratching post", "lit"])}', {})),
+        ('products', 'detail', lambda: ('GET', f'/api/products/{ctx.pick(ctx.product_ids)}', {})),
+        ('products', 'categories', paged('/api/products/categories')),
+        ('products', 'facets', paged('/api/products/facets?category=toys')),
+        ('products', 'create', lambda: ('POST', '/api/products', {'json': {
+            'name': f'Bench Product {ctx.next_id()}', 'price': 999, 'category': 'toys',
+            'stock': 10}, 'headers': admin})),
+        ('products', 'update', lambda: ('PUT', f'/api/products/{ctx.pick(ctx.product_ids)}', {
+            'json': {'price': ctx.rng.randint(100, 20000)}, 'headers': admin})),
+        ('products', 'delete', lambda: ('DELETE', f'/api/products/{ctx.pick(ctx.product_ids)}', {
+            'headers': admin})),
+
+        ('cart', 'get', lambda: ('GET', '/api/cart', {'headers': shopper_headers})),
+        ('cart', 'add', cart_add),
+        ('cart', 'update', cart_item('PUT', {'quantity': 2})),
+        ('cart', 'remove', cart_item('DELETE')),
+        ('cart', 'clear', lambda: ('DELETE', '/api/cart', {'headers': user_headers()})),
+
+        ('orders', 'list', lambda: ('GET', '/api/orders', {'headers': shopper_headers})),
+        ('orders', 'list_cursor', lambda: ('GET', '/api/orders?cursor=', {'headers': shopper_headers})),
+        ('orders', 'list_summary', lambda: ('GET', '/api/orders?summary=1&cursor=', {'headers': shopper_headers})),
+        ('orders', 'detail', lambda: ('GET', f'/api/orders/{order_of_shopper}', {
+            'headers': shopper_headers})),
+        ('orders', 'create', create_order),
+        ('orders', 'update', lambda: ('PUT', f'/api/orders/{ctx.pick(ctx.order_ids)}', {
+            'json': {'status': 'shipped'}, 'headers': admin})),
+        ('orders', 'confirm_payment', lambda: (lambda o: ('POST', f'/api/orders/{o[0]}/confirm-payment', {
+            'json': {'transaction_id': 'txn'}, 'headers': o[1]}))(order_owner())),
+
+        ('reviews', 'list', lambda: ('GET', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}', {})),
+        ('reviews', 'list_cursor', lambda: ('GET', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}?cursor=', {})),
+        ('reviews', 'list_helpful', lambda: ('GET', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}?sort=helpful&cursor=', {})),
+        ('reviews', 'list_rating_asc', lambda: ('GET', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}?sort=rating_asc', {})),
+        ('reviews', 'list_five_star', lambda: ('GET', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}?rating=5&cursor=', {})),
+        ('reviews', 'list_verified', lambda: ('GET', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}?verified=1&cursor=', {})),
+        ('reviews', 'create', lambda: ('POST', f'/api/reviews/product/{ctx.pick(ctx.product_ids)}', {
+            'json': {'rating': ctx.rng.randint(1, 5), 'comment': 'Bench'}, 'headers': user_headers()})),
+        ('reviews', 'update', lambda: (lambda r: ('PUT', f'/api/reviews/{r[0].id}', {
+            'json': {'rating': ctx.rng.randint(1, 5)}, 'headers': r[1]}))(review_owner())),
+        ('reviews', 'delete', delete_review),
+        ('reviews', 'helpful', lambda: ('POST', f'/api/reviews/{ctx.pick(ctx.review_ids)}/helpful', {})),
+
+        ('users', 'get', lambda: ('GET', f'/api/users/{ctx.pick(ctx.user_ids)}', {})),
+        ('users', 'admin_list', lambda: ('GET', '/api/users/admin/list', {'headers': admin})),
+        ('users', 'admin_list_cursor', lambda: ('GET', '/api/users/admin/list?cursor=', {'headers': admin})),
+        ('users', 'toggle_admin', lambda: ('PUT', f'/api/users/admin/{ctx.pick(ctx.victim_ids)}/toggle-admin', {
+            'headers': admin})),
+        ('users', 'toggle_active', lambda: ('PUT', f'/api/users/admin/{ctx.pick(ctx.victim_ids)}/toggle-active', {
+            'headers': admin})),
+    ]
+
+
+def run_scenario(ctx, prepare, iterations, warmup):
+    timings = []
+    queries = 0
+    errors = 0
+    with QueryCounter() as counter:
+        for i in range(warmup + iterations):
+            method, url, kwargs = prepare()
+            db.session.remove()
+            before = counter.count
+            started = time.perf_counter()
+            response = ctx.client.open(url, method=method, **kwargs)
+            elapsed = time.perf_counter() - started
+            if i < warmup:
+                continue
+            timings.append(elapsed)
+            queries += counter.count - before
+            if response.status_code >= 400:
+                errors += 1
+    result = summarize(timings, queries)
+    result['errors'] = errors
+    return result
+
+
+def run_serializers(iterations):
+    results = {}
+    for model in (User, Product, CartItem, Order, OrderItem, Review):
+        objects = model.query.limit(200).all()
+        if not objects:
+            continue
+        # Load whatever the serializer touches up front, then time only to_dict
+        for obj in objects:
+            obj.to_dict()
+        timings = []
+        for _ in range(iterations):
+            started = time.perf_counter()
+            for obj in objects:
+                obj.to_dict()
+            timings.append((time.perf_counter() - started) / len(objects))
+        results[model.__name__] = summarize(timings)
+    return results
+
+
+def compare(results, baseline, threshold, min_delta_ms):
+    """Regressions of ``results`` against ``baseline``"""
+    regressions = []
+    for scale, scenarios_ in results['results'].items():
+        for name, stats in scenarios_.items():
+            before = baseline.get('results', {}).get(scale, {}).get(name)
+            if not before:
+                continue
+            # Sub-millisecond jitter is not a regression
+            if stats['p95_ms'] > before['p95_ms'] * (1 + threshold) \
+                    and stats['p95_ms'] - before['p95_ms'] >= min_delta_ms:
+                regressions.append(
+                    f"{scale}/{name}: p95 {before['p95_ms']}ms -> {stats['p95_ms']}ms"
+                )
+            if stats['queries_per_call'] > before['queries_per_call'] * 1.1 + 0.5:
+                regressions.append(
+                    f"{scale}/{name}: queries {before['queries_per_call']} -> {stats['queries_per_call']}"
+                )
+    return regressions
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='small')
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--only', help='Comma-separated blueprints or blueprint.scenario names')
+    parser.add_argument('--database-url', help='Empty database to use instead of a temporary SQLite file')
+    parser.add_argument('--no-cache', action='store_true', help='Disable the catalog response cache')
+    parser.add_argument('--output', help='Write results as JSON to this path')
+    parser.add_argument('--baseline', help='Results JSON to compare against')
+    parser.add_argument('--threshold', type=float, default=0.25, help='Allowed relative p95 growth')
+    parser.add_argument('--min-delta-ms', type=float, default=1.0, help='Ignore p95 growth below this')
+    args = parser.parse_args()
+
+    only = set(args.only.split(',')) if args.only else None
+    settings = {'CATALOG_CACHE_BACKEND': 'none'} if args.no_cache else {}
+    output = {
+        'meta': {
+            'revision': git_revision(),
+            'timestamp': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'iterations': args.iterations,
+            'cache': not args.no_cache,
+        },
+        'results': {},
+    }
+
+    for scale in args.scales.split(','):
+        with benchmark_app(args.database_url, **settings) as app:
+            started = time.perf_counter()
+            data = generate(scale)
+            print(f'[{scale}] data generated in {time.perf_counter() - started:.1f}s')
+            ctx = Context(app, data)
+            results = output['results'][scale] = {}
+
+            for blueprint, name, prepare in scenarios(ctx):
+                key = f'{blueprint}.{name}'
+                if only and blueprint not in only and key not in only:
+                    continue
+                stats = results[key] = run_scenario(ctx, prepare, args.iterations, args.warmup)
+                print(
+                    f"[{scale}] {key:<32} {stats['throughput_per_s']:>9} req/s  "
+                    f"p50 {stats['p50_ms']:>8}ms  p95 {stats['p95_ms']:>8}ms  "
+                    f"p99 {stats['p99_ms']:>8}ms  {stats['queries_per_call']:>6} q/req"
+                    + (f"  {stats['errors']} errors" if stats['errors'] else '')
+                )
+
+            if not only or 'serializers' in only:
+                for model, stats in run_serializers(args.iterations).items():
+                    key = f'serializers.{model}'
+                    results[key] = stats
+                    print(f"[{scale}] {key:<32} p50 {stats['p50_ms'] * 1000:>8.2f}us per object")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(output, f, indent=2, sort_keys=True)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(output, baseline, args.threshold, args.min_delta_ms)
+        for regression in regressions:
+            print(f'REGRESSION {regression}')
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,232 @@
+"""Sync vs async serving benchmark
+
+Serves the same database with gunicorn (one ``gthread`` worker, the
+Dockerfile's WSGI setup) and with uvicorn running ``AsyncCatalog`` (one
+worker), both pinned to the same CPUs, and measures throughput and latency of
+the read endpoints (product list and detail, reviews, the user's orders) at
+increasing numbers of concurrent keep-alive connections.
+
+Each SQL statement is delayed by ``--latency-ms`` on the thread that runs it,
+standing in for the network round trip to a database server; with
+``--latency-ms 0`` the numbers show the CPU cost of each mode. Uses a
+throwaway SQLite file unless ``--database-url`` points elsewhere.
+
+    python -m benchmarks.async_serving --concurrency 1,8,32,128 --latency-ms 5
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+from sqlalchemy import event
+from sqlalchemy.pool import Pool
+
+from app import create_app, db
+from app.authz import create_user_token
+from app.models import User
+from config import TestingConfig
+
+from benchmarks.common import benchmark_app, percentile
+from benchmarks.data import generate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _delay_statements(seconds):
+    """Sleep ``seconds`` before each SQLite statement, on the thread running it"""
+    def delay(statement):
+        time.sleep(seconds)
+
+    @event.listens_for(Pool, 'connect')
+    def install(dbapi_connection, connection_record):
+        driver = getattr(dbapi_connection, 'driver_connection', dbapi_connection)
+        if hasattr(dbapi_connection, 'await_'):
+            # aiosqlite: the callback runs on the connection's own thread
+            dbapi_connection.await_(driver.set_trace_callback(delay))
+        else:
+            driver.set_trace_callback(delay)
+
+
+def _serving_app():
+    class ServingConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = os.environ['BENCHMARK_DATABASE_URL']
+        # Every request reaches the database
+        CATALOG_CACHE_BACKEND = 'none'
+        ASGI_WSGI_THREADS = int(os.environ.get('BENCHMARK_THREADS', 4))
+
+    latency = float(os.environ.get('BENCHMARK_LATENCY_MS', 0)) / 1000
+    if latency and ServingConfig.SQLALCHEMY_DATABASE_URI.startswith('sqlite'):
+        _delay_statements(latency)
+    return create_app(ServingConfig)
+
+
+def sync_app():
+    """WSGI app for ``gunicorn 'benchmarks.async_serving:sync_app()'``"""
+    return _serving_app()
+
+
+def async_app():
+    """ASGI app for ``uvicorn --factory benchmarks.async_serving:async_app``"""
+    from app.asgi import AsyncCatalog
+    return AsyncCatalog(_serving_app())
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _server_command(mode, port, threads):
+    if mode == 'sync':
+        return [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', '--workers', '1',
+                '--worker-class', 'gthread', '--threads', str(threads), '--log-level', 'warning',
+                'benchmarks.async_serving:sync_app()']
+    return [sys.executable, '-m', 'uvicorn', '--factory', 'benchmarks.async_serving:async_app',
+            '--host', '127.0.0.1', '--port', str(port), '--workers', '1',
+            '--no-access-log', '--log-level', 'warning']
+
+
+def _start_server(mode, url, args):
+    port = _free_port()
+    command = _server_command(mode, port, args.threads)
+    if args.cpus and shutil.which('taskset'):
+        command = ['taskset', '-c', args.cpus, *command]
+    env = dict(os.environ, BENCHMARK_DATABASE_URL=url, BENCHMARK_LATENCY_MS=str(args.latency_ms),
+               BENCHMARK_THREADS=str(args.threads))
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1)
+            return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'{mode} server did not start')
+
+
+async def _connection(port, requests, deadline, latencies, failures):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        index = 0
+        while time.perf_counter() < deadline:
+            path, headers = requests[index % len(requests)]
+            index += 1
+            started = time.perf_counter()
+            writer.write(f'GET {path} HTTP/1.1\r\nHost: localhost\r\n{headers}\r\n'.encode())
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b''):
+                    break
+                name, _, value = line.decode('latin1').partition(':')
+                if name.lower() == 'content-length':
+                    length = int(value)
+            await reader.readexactly(length)
+            if status == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                failures.append(status)
+    finally:
+        writer.close()
+
+
+async def _load(port, requests, concurrency, duration):
+    latencies, failures = [], []
+    deadline = time.perf_counter() + duration
+    # Stagger the start so connections do not all ask for the same URL
+    await asyncio.gather(*(
+        _connection(port, requests[i % len(requests):] + requests[:i % len(requests)],
+                    deadline, latencies, failures)
+        for i in range(concurrency)
+    ))
+    return latencies, failures
+
+
+def _requests(ids, token):
+    auth = f'Authorization: Bearer {token}\r\n'
+    product_ids = ids['product_ids']
+    requests = []
+    for i in range(20):
+        product_id = product_ids[(i * 37) % len(product_ids)]
+        requests.append((f'/api/products?page={i % 5 + 1}&per_page=20', ''))
+        requests.append((f'/api/products/{product_id}', ''))
+        requests.append((f'/api/reviews/product/{product_id}', ''))
+        requests.append(('/api/orders?per_page=10', auth))
+    return requests
+
+
+def run(args):
+    path = None
+    url = args.database_url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+
+    results = []
+    try:
+        with benchmark_app(database_url=url) as app:
+            ids = generate(args.scale)
+            token = create_user_token(db.session.get(User, ids['user_ids'][1]))
+        requests = _requests(ids, token)
+
+        for mode in ('sync', 'async'):
+            process, port = _start_server(mode, url, args)
+            try:
+                asyncio.run(_load(port, requests, 1, 1))  # warm up
+                for concurrency in args.concurrency:
+                    latencies, failures = asyncio.run(_load(port, requests, concurrency, args.duration))
+                    results.append({
+                        'mode': mode,
+                        'concurrency': concurrency,
+                        'requests': len(latencies),
+                        'failures': len(failures),
+                        'throughput_per_s': round(len(latencies) / args.duration, 1),
+                        'p50_ms': round(percentile(latencies, 50) * 1000, 1) if latencies else None,
+                        'p99_ms': round(percentile(latencies, 99) * 1000, 1) if latencies else None,
+                    })
+            finally:
+                process.terminate()
+                process.wait()
+    finally:
+        if path:
+            os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='small')
+    parser.add_argument('--concurrency', default='1,8,32,128',
+                        type=lambda value: [int(n) for n in value.split(',')])
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds per concurrency level')
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Simulated delay per SQL statement')
+    parser.add_argument('--threads', type=int, default=4,
+                        help='gunicorn threads, and WSGI fallback threads in async mode')
+    parser.add_argument('--cpus', default='0', help='CPU list both servers are pinned to (taskset)')
+    parser.add_argument('--database-url')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args)
+    print(f"{'mode':<6} {'conns':>5} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'failed':>6}")
+    for row in results:
+        print(f"{row['mode']:<6} {row['concurrency']:>5} {row['throughput_per_s']:>8} "
+              f"{row['p50_ms']!s:>8} {row['p99_ms']!s:>8} {row['failures']:>6}")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""Batch product update benchmark
+
+Compares a warehouse price/stock sync done through ``PATCH
+/api/products/batch`` with the same sync done one ``PUT
+/api/products/<id>`` at a time. The per-item path is measured on up to
+``--per-item-max`` items and projected to the full size, since 100k
+individual requests take a long time.
+
+    python -m benchmarks.batch_update --sizes 1000,10000,100000
+"""
+import argparse
+import random
+import time
+
+from app import db
+from app.authz import create_user_token
+from app.models import Product, User
+
+from benchmarks.common import QueryCounter, benchmark_app
+from benchmarks.data import product_rows
+
+
+def _setup(size, rng):
+    rows = list(product_rows(size, rng))
+    for start in range(0, size, 10000):
+        db.session.execute(db.insert(Product), rows[start:start + 10000])
+    admin = User(username='batchadmin', email='batchadmin@example.com', password_hash='-', is_admin=True)
+    db.session.add(admin)
+    db.session.commit()
+    return [row['id'] for row in rows], {'Authorization': f'Bearer {create_user_token(admin)}'}
+
+
+def _changes(product_ids, rng):
+    return [
+        {'id': product_id, 'price': rng.randint(100, 20000), 'stock': rng.randint(0, 500)}
+        for product_id in product_ids
+    ]
+
+
+def run(size, per_item_max, chunk_size, seed=11):
+    rng = random.Random(seed)
+    with benchmark_app(CATALOG_CACHE_BACKEND='none') as app:
+        product_ids, headers = _setup(size, rng)
+        client = app.test_client()
+
+        sample = _changes(product_ids[:min(size, per_item_max)], rng)
+        with QueryCounter() as per_item_queries:
+            started = time.perf_counter()
+            for item in sample:
+                response = client.put(f"/api/products/{item['id']}", json={
+                    'price': item['price'], 'stock': item['stock']
+                }, headers=headers)
+                assert response.status_code == 200, response.get_json()
+            per_item_seconds = time.perf_counter() - started
+        per_item_rate = len(sample) / per_item_seconds
+
+        items = _changes(product_ids, rng)
+        with QueryCounter() as batch_queries:
+            started = time.perf_counter()
+            response = client.patch('/api/products/batch', json={
+                'items': items, 'chunk_size': chunk_size
+            }, headers=headers)
+            batch_seconds = time.perf_counter() - started
+        assert response.status_code == 200, response.get_json()
+        updated = response.get_json()['summary'].get('updated', 0)
+
+        sampled = db.session.execute(
+            db.select(Product.id, Product.price, Product.stock)
+            .where(Product.id.in_([item['id'] for item in items[:100]]))
+        ).all()
+        expected = {item['id']: (item['price'], item['stock']) for item in items[:100]}
+        assert all(expected[row.id] == (row.price, row.stock) for row in sampled)
+
+    return {
+        'size': size,
+        'per_item_measured': len(sample),
+        'per_item_per_s': round(per_item_rate, 1),
+        'per_item_projected_s': round(size / per_item_rate, 2),
+        'per_item_queries_per_item': round(per_item_queries.count / len(sample), 2),
+        'batch_s': round(batch_seconds, 3),
+        'batch_per_s': round(size / batch_seconds, 1),
+        'batch_queries': batch_queries.count,
+        'updated': updated,
+        'speedup': round((size / per_item_rate) / batch_seconds, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--per-item-max', type=int, default=2000)
+    parser.add_argument('--chunk-size', type=int, default=500)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        result = run(size, args.per_item_max, args.chunk_size)
+        print(
+            f"{result['size']:>7} items: per-item {result['per_item_per_s']:>8}/s "
+            f"(~{result['per_item_projected_s']}s, {result['per_item_queries_per_item']} q/item)  "
+            f"batch {result['batch_s']}s ({result['batch_per_s']}/s, {result['batch_queries']} queries)  "
+            f"x{result['speedup']}"
+        )
+
+
+if __name__ == '__main__':
+    main()
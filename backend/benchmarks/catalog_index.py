@@ -0,0 +1,95 @@
+"""Catalog index benchmark
+
+Serves ``GET /api/products`` listings (category, price range and stock
+filters, every sort, page numbers and keyset cursors) through the test
+client from the SQL path and from the in-memory ``CatalogIndex`` over the
+same synthetic catalog, and measures the index's build time and the cost of
+folding in one changed product.
+
+    python -m benchmarks.catalog_index --sizes 100000,200000
+"""
+import argparse
+import random
+import time
+
+from app import db
+from app.catalog_index import CatalogIndex
+from app.models import Product
+from app.signals import mark_products_changed
+
+from benchmarks.common import benchmark_app, summarize
+from benchmarks.search import populate
+
+LISTINGS = [
+    '?per_page=20',
+    '?per_page=20&page=50',
+    '?sort_by=price_asc&per_page=20',
+    '?sort_by=rating&category=toys&per_page=20',
+    '?sort_by=price_desc&min_price=5000&max_price=10000&per_page=20',
+    '?sort_by=created_at&category=food&in_stock=1&per_page=20',
+    '?sort_by=price_asc&per_page=20&cursor=&include_total=1',
+    '?sort_by=rating&min_price=2000&in_stock=1&per_page=20&cursor=',
+]
+
+
+def _timed_requests(client, repeat):
+    timings = []
+    for _ in range(repeat):
+        for listing in LISTINGS:
+            started = time.perf_counter()
+            response = client.get('/api/products' + listing)
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.get_data()
+    return timings
+
+
+def bench_size(app, size, repeat):
+    populate(size)
+    client = app.test_client()
+
+    index = CatalogIndex(refresh_interval=3600)
+    started = time.perf_counter()
+    index.rebuild()
+    build = time.perf_counter() - started
+
+    rows = {}
+    for label, extension in (('sql', None), ('index', index)):
+        app.extensions['catalog_index'] = extension
+        _timed_requests(client, 1)  # warm up
+        rows[label] = summarize(_timed_requests(client, repeat))
+
+    rng = random.Random(7)
+    product_ids = db.session.scalars(db.select(Product.id)).all()
+    timings = []
+    for _ in range(repeat * 10):
+        product_id = rng.choice(product_ids)
+        db.session.execute(
+            db.update(Product).where(Product.id == product_id).values(price=rng.randint(100, 20000))
+        )
+        mark_products_changed(db.session, [product_id], ['price'])
+        db.session.commit()
+        started = time.perf_counter()
+        index.sync()
+        timings.append(time.perf_counter() - started)
+    rows['index update (1 product)'] = summarize(timings)
+    return build, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='100000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        # Responses are not cached, so every request runs its listing
+        with benchmark_app(CATALOG_CACHE_BACKEND='none', PAGINATION_COUNT_TTL=0) as app:
+            build, rows = bench_size(app, size, args.repeat)
+        print(f'{size} products, index built in {build:.2f}s')
+        for label, row in rows.items():
+            print(f"  {label:<26} p50 {row['p50_ms']:>9.3f}ms  p95 {row['p95_ms']:>9.3f}ms  "
+                  f"p99 {row['p99_ms']:>9.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
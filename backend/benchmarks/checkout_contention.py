@@ -0,0 +1,118 @@
+"""Checkout contention check
+
+Fires many parallel checkouts at a low-stock product and verifies that stock
+never goes negative, exactly ``stock`` orders succeed and nothing deadlocks.
+Uses a throwaway SQLite file unless ``--database-url`` points elsewhere.
+
+    python -m benchmarks.checkout_contention --checkouts 300 --stock 7
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app, db
+from app.models import CartItem, Order, OrderItem, Product, User
+from config import TestingConfig
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--checkouts', type=int, default=300)
+    parser.add_argument('--stock', type=int, default=7)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    path = None
+    url = args.database_url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+
+    class ContentionConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = url
+        DB_AUTO_CREATE = True
+        SQLALCHEMY_ENGINE_OPTIONS = (
+            {'connect_args': {'timeout': 60}} if url.startswith('sqlite') else {}
+        )
+
+    try:
+        app = create_app(ContentionConfig)
+        with app.app_context():
+            scarce = Product(name='Limited Edition Cat Tower', price=9999,
+                             category='furniture', stock=args.stock)
+            plenty = Product(name='Catnip Mouse Toy', price=835,
+                             category='toys', stock=args.checkouts * 2)
+            db.session.add_all([scarce, plenty])
+            users = [
+                User(username=f'buyer{i}', email=f'buyer{i}@example.com', password_hash='-')
+                for i in range(args.checkouts)
+            ]
+            db.session.add_all(users)
+            db.session.flush()
+            for i, user in enumerate(users):
+                # Alternate cart order so lock ordering is actually exercised
+                first, second = (scarce, plenty) if i % 2 else (plenty, scarce)
+                db.session.add(CartItem(user_id=user.id, product_id=first.id, quantity=1))
+                db.session.add(CartItem(user_id=user.id, product_id=second.id, quantity=1))
+            db.session.commit()
+            scarce_id, plenty_id = scarce.id, plenty.id
+            tokens = [create_access_token(identity=user.id) for user in users]
+
+        statuses = Counter()
+        lock = threading.Lock()
+
+        def checkout(token):
+            response = app.test_client().post(
+                '/api/orders', json={'shipping_address': '221B Baker Street'},
+                headers={'Authorization': f'Bearer {token}'}
+            )
+            with lock:
+                statuses[response.status_code] += 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=checkout, args=(token,)) for token in tokens]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(timeout=120)
+        elapsed = time.perf_counter() - started
+        hung = sum(thread.is_alive() for thread in threads)
+
+        with app.app_context():
+            stock = db.session.get(Product, scarce_id).stock
+            plenty_stock = db.session.get(Product, plenty_id).stock
+            orders = Order.query.count()
+            sold = OrderItem.query.filter_by(product_id=scarce_id).count()
+            db.session.remove()
+            db.engine.dispose()
+
+        print(f'{args.checkouts} checkouts in {elapsed:.2f}s: {dict(statuses)}')
+        print(f'scarce stock left {stock}, sold {sold}, orders {orders}')
+        failures = []
+        if hung:
+            failures.append(f'{hung} checkouts did not finish (deadlock?)')
+        if stock < 0 or sold > args.stock:
+            failures.append('oversold')
+        if orders != min(args.stock, args.checkouts) or statuses[201] != orders:
+            failures.append('successful checkouts do not match available stock')
+        if plenty_stock != args.checkouts * 2 - orders:
+            failures.append('stock of the second product is inconsistent')
+        if statuses[500]:
+            failures.append(f'{statuses[500]} checkouts errored')
+        for failure in failures:
+            print(f'FAIL: {failure}')
+        return 1 if failures else 0
+    finally:
+        if path:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,96 @@
+"""Shared helpers for the benchmark scripts"""
+import os
+import statistics
+import tempfile
+import time
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.counters import counters
+from app.search import create_search_schema
+from config import TestingConfig
+
+
+@contextmanager
+def benchmark_app(database_url=None, **settings):
+    """App built by ``create_app()`` on a throwaway SQLite file (or ``database_url``)
+
+    Extra keyword arguments override config values. Yields the app with an
+    app context pushed.
+    """
+    path = None
+    if not database_url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        database_url = f'sqlite:///{path}'
+
+    class BenchmarkConfig(TestingConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+
+    for key, value in settings.items():
+        setattr(BenchmarkConfig, key, value)
+
+    try:
+        app = create_app(BenchmarkConfig)
+        with app.app_context():
+            db.create_all()
+            if app.config.get('SEARCH_BACKEND') == 'sql':
+                with db.engine.begin() as conn:
+                    create_search_schema(conn)
+            yield app
+            # Write buffered counters while the database still exists
+            counters.flush()
+            db.session.remove()
+            db.engine.dispose()
+    finally:
+        if path:
+            os.remove(path)
+
+
+class QueryCounter:
+    """Counts SQL statements and their time on the current app's engine"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self._started = {}
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        self._started[id(cursor)] = time.perf_counter()
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        started = self._started.pop(id(cursor), None)
+        if started is not None:
+            self.seconds += time.perf_counter() - started
+
+    def __enter__(self):
+        event.listen(db.engine, 'before_cursor_execute', self._before)
+        event.listen(db.engine, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(db.engine, 'before_cursor_execute', self._before)
+        event.remove(db.engine, 'after_cursor_execute', self._after)
+
+
+def percentile(samples, pct):
+    """Nearest-rank percentile of ``samples``"""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def summarize(timings, queries=0, calls=None):
+    """Latency/throughput summary for per-call timings in seconds"""
+    calls = calls or len(timings)
+    total = sum(timings)
+    return {
+        'calls': calls,
+        'throughput_per_s': round(calls / total, 1) if total else None,
+        'p50_ms': round(statistics.median(timings) * 1000, 3),
+        'p95_ms': round(percentile(timings, 95) * 1000, 3),
+        'p99_ms': round(percentile(timings, 99) * 1000, 3),
+        'queries_per_call': round(queries / calls, 2),
+    }
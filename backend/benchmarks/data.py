@@ -0,0 +1,148 @@
+"""Synthetic catalog, user, order and review data for benchmarks"""
+import random
+import uuid
+from datetime import datetime, timedelta
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import Order, OrderItem, Product, Review, User
+
+WORDS = (
+    'cat kitten toy mouse feather laser ball bed blanket cushion tower tree '
+    'scratching post food salmon tuna chicken treat crunchy grain free bowl '
+    'fountain feeder automatic litter box scoop brush comb grooming nail '
+    'clipper collar bell harness leash carrier travel window perch tunnel '
+    'catnip organic premium soft warm washable interactive rechargeable'
+).split()
+CATEGORIES = ['food', 'toys', 'beds', 'accessories', 'furniture', 'grooming']
+
+# name -> (products, users, orders per user, items per order, reviews per product)
+SCALES = {
+    'small': (200, 50, 3, 3, 5),
+    'medium': (5000, 500, 5, 4, 10),
+    'large': (50000, 2000, 10, 5, 20),
+}
+
+PASSWORD = 'benchmark'
+
+
+def _bulk_insert(model, rows, chunk_size=5000):
+    for start in range(0, len(rows), chunk_size):
+        db.session.execute(db.insert(model), rows[start:start + chunk_size])
+
+
+def product_rows(count, rng, now=None):
+    """Generate ``count`` product rows ready for a bulk insert"""
+    now = now or datetime.utcnow()
+    for i in range(count):
+        created = now - timedelta(minutes=count - i)
+        yield {
+            'id': str(uuid.uuid4()),
+            'name': ' '.join(rng.choices(WORDS, k=rng.randint(2, 5))).title(),
+            'description': ' '.join(rng.choices(WORDS, k=rng.randint(8, 30))),
+            'price': rng.randint(100, 20000),
+            'category': rng.choice(CATEGORIES),
+            'image_url': f'https://img.example.com/{i}.jpg',
+            'stock': rng.randint(0, 200),
+            'rating': 0.0,
+            'review_count': 0,
+            'rating_sum': 0,
+            'is_active': True,
+            'created_at': created,
+            'updated_at': created,
+        }
+
+
+def generate(scale, seed=42):
+    """Populate the current database; returns ids useful to the scenarios"""
+    products, users, orders_per_user, items_per_order, reviews_per_product = SCALES[scale]
+    rng = random.Random(seed)
+    now = datetime.utcnow()
+
+    product_data = list(product_rows(products, rng, now))
+    _bulk_insert(Product, product_data)
+    product_ids = [p['id'] for p in product_data]
+    products_by_id = {p['id']: p for p in product_data}
+
+    # One hash shared by every generated user keeps generation fast
+    password_hash = generate_password_hash(PASSWORD)
+    user_data = [
+        {
+            'id': str(uuid.uuid4()),
+            'username': f'user{i}',
+            'email': f'user{i}@example.com',
+            'password_hash': password_hash,
+            'is_admin': i == 0,
+            'is_active': True,
+            'token_version': 0,
+            'created_at': now - timedelta(days=users - i),
+            'updated_at': now,
+        }
+        for i in range(users)
+    ]
+    _bulk_insert(User, user_data)
+    user_ids = [u['id'] for u in user_data]
+
+    order_data, item_data = [], []
+    for user_id in user_ids:
+        for n in range(orders_per_user):
+            order_id = str(uuid.uuid4())
+            created = now - timedelta(hours=n)
+            total = units = 0
+            items = rng.sample(product_ids, items_per_order)
+            for product_id in items:
+                product = products_by_id[product_id]
+                quantity = rng.randint(1, 3)
+                total += product['price'] * quantity
+                units += quantity
+                item_data.append({
+                    'id': str(uuid.uuid4()), 'order_id': order_id,
+                    'product_id': product_id, 'product_name': product['name'],
+                    'product_image_url': product['image_url'], 'quantity': quantity,
+                    'price_at_purchase': product['price'], 'created_at': created,
+                })
+            order_data.append({
+                'id': order_id, 'user_id': user_id, 'total_price': total,
+                'tax': int(total * 0.08), 'status': rng.choice(['pending', 'delivered']),
+                'shipping_address': '1 Benchmark Road', 'payment_method': 'card',
+                'item_count': units,
+                'thumbnail_url': products_by_id[items[0]]['image_url'],
+                'order_date': created, 'created_at': created, 'updated_at': created,
+            })
+    _bulk_insert(Order, order_data)
+    _bulk_insert(OrderItem, item_data)
+
+    review_data = []
+    aggregates = {}
+    for product_id in product_ids:
+        for user_id in rng.sample(user_ids, min(reviews_per_product, len(user_ids))):
+            rating = rng.randint(1, 5)
+            review_data.append({
+                'id': str(uuid.uuid4()), 'product_id': product_id, 'user_id': user_id,
+                'rating': rating, 'comment': ' '.join(rng.choices(WORDS, k=12)),
+                'is_verified': rng.random() < 0.3, 'helpful_count': rng.randint(0, 50),
+                'created_at': now, 'updated_at': now,
+            })
+            count, total, stars = aggregates.get(product_id, (0, 0, [0] * 5))
+            stars[rating - 1] += 1
+            aggregates[product_id] = (count + 1, total + rating, stars)
+    _bulk_insert(Review, review_data)
+
+    db.session.execute(db.update(Product), [
+        {
+            'id': product_id, 'review_count': count, 'rating_sum': total,
+            'rating': total / count,
+            **{f'rating_{s}_count': stars[s - 1] for s in range(1, 6)},
+        }
+        for product_id, (count, total, stars) in aggregates.items()
+    ])
+    db.session.commit()
+
+    return {
+        'product_ids': product_ids,
+        'user_ids': user_ids,
+        'admin_id': user_ids[0],
+        'order_ids': [o['id'] for o in order_data],
+        'review_ids': [r['id'] for r in review_data],
+    }
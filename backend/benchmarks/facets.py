@@ -0,0 +1,114 @@
+"""Catalog facets benchmark
+
+Compares answering facet counts from the incrementally maintained
+``CatalogSummary`` with aggregating the products table per request (the
+``GROUP BY`` a facets endpoint would otherwise run), and measures what it
+costs to keep the summary current after a product changes.
+
+    python -m benchmarks.facets --sizes 10000,100000
+"""
+import argparse
+import random
+import time
+
+from sqlalchemy import case, func
+
+from app import db
+from app.facets import RATING_EDGES, CatalogSummary, parse_price_buckets
+from app.models import Product
+from app.signals import mark_products_changed
+
+from benchmarks.common import benchmark_app, summarize
+from benchmarks.search import populate
+
+PRICE_BUCKETS = '0,1000,2500,5000,10000'
+
+
+def _bucket_expression(column, edges):
+    return case(
+        *[(column >= edge, index) for index, edge in reversed(list(enumerate(edges)))],
+        else_=0
+    )
+
+
+def sql_facets(category=None):
+    """Facet counts aggregated from the products table"""
+    edges = parse_price_buckets(PRICE_BUCKETS)
+    active = db.select(Product).filter_by(is_active=True).subquery()
+    categories = db.session.execute(
+        db.select(active.c.category, func.count(), func.sum(case((active.c.stock > 0, 1), else_=0)))
+        .group_by(active.c.category)
+    ).all()
+    filtered = db.select(active)
+    if category:
+        filtered = filtered.where(active.c.category == category)
+    filtered = filtered.subquery()
+    price = db.session.execute(
+        db.select(_bucket_expression(filtered.c.price, edges).label('bucket'), func.count())
+        .group_by('bucket')
+    ).all()
+    rating = db.session.execute(
+        db.select(_bucket_expression(filtered.c.rating, RATING_EDGES).label('bucket'), func.count())
+        .group_by('bucket')
+    ).all()
+    return categories, price, rating
+
+
+def _timed(call, repeat):
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        call()
+        timings.append(time.perf_counter() - started)
+    return timings
+
+
+def bench_size(size, repeat):
+    populate(size)
+    product_ids = db.session.scalars(db.select(Product.id)).all()
+
+    summary = CatalogSummary(parse_price_buckets(PRICE_BUCKETS), refresh_interval=3600)
+    started = time.perf_counter()
+    summary.rebuild()
+    build = time.perf_counter() - started
+
+    rows = {
+        'sql': summarize(_timed(sql_facets, repeat)),
+        'sql, one category': summarize(_timed(lambda: sql_facets('toys'), repeat)),
+        'summary': summarize(_timed(summary.facets, repeat)),
+        'summary, one category': summarize(_timed(lambda: summary.facets('toys'), repeat)),
+    }
+
+    # One product changed through the ORM path, then the summary catches up
+    rng = random.Random(7)
+    timings = []
+    for _ in range(repeat):
+        product_id = rng.choice(product_ids)
+        db.session.execute(
+            db.update(Product).where(Product.id == product_id).values(stock=rng.randint(0, 5))
+        )
+        mark_products_changed(db.session, [product_id], ['stock'])
+        db.session.commit()
+        started = time.perf_counter()
+        summary.sync()
+        timings.append(time.perf_counter() - started)
+    rows['summary update (1 product)'] = summarize(timings)
+    return build, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--repeat', type=int, default=50)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        with benchmark_app(FACETS_PRICE_BUCKETS=PRICE_BUCKETS):
+            build, rows = bench_size(size, args.repeat)
+        print(f'{size} products, summary built in {build:.2f}s')
+        for label, row in rows.items():
+            print(f"  {label:<28} p50 {row['p50_ms']:>9.3f}ms  p99 {row['p99_ms']:>9.3f}ms")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""Login throughput benchmark
+
+Serves the app from a threaded HTTP server, fires a burst of concurrent
+logins and, at the same time, a steady stream of catalog reads. Reports
+logins per second, login latency, how many were shed with 503 and how the
+catalog latency holds up, once with inline hashing and once per process-pool
+size.
+
+    python -m benchmarks.login --logins 200 --concurrency 16 --pool-sizes 0,1,2
+"""
+import argparse
+import json
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import db
+from app.models import User
+from app.passwords import hasher
+
+from benchmarks.common import benchmark_app, percentile
+
+PASSWORD = 'benchmark'
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def _request(url, payload=None):
+    data = json.dumps(payload).encode() if payload is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            response.read()
+            status = response.status
+    except urllib.error.HTTPError as e:
+        status = e.code
+    return status, time.perf_counter() - started
+
+
+def _ms(samples, pct=None):
+    if not samples:
+        return None
+    value = statistics.median(samples) if pct is None else percentile(samples, pct)
+    return round(value * 1000, 1)
+
+
+def run(pool_size, args):
+    settings = {'PASSWORD_HASH_WORKERS': pool_size, 'PASSWORD_HASH_MAX_QUEUE': args.max_queue,
+                'PASSWORD_HASH_METHOD': args.method, 'CATALOG_CACHE_BACKEND': 'none'}
+    with benchmark_app(**settings) as app:
+        password_hash = hasher.hash(PASSWORD)
+        db.session.execute(db.insert(User), [
+            {'username': f'login{i}', 'email': f'login{i}@example.com', 'password_hash': password_hash}
+            for i in range(args.users)
+        ])
+        db.session.commit()
+
+        server = make_server('127.0.0.1', 0, app, threaded=True, request_handler=_QuietHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f'http://127.0.0.1:{server.server_port}'
+        _request(f'{base}/api/products')
+        # Warm the pool so process start-up is not measured
+        _request(f'{base}/api/auth/login', {'email': 'login0@example.com', 'password': PASSWORD})
+
+        statuses = Counter()
+        logins, catalog = [], []
+        done = threading.Event()
+
+        def login(i):
+            status, seconds = _request(f'{base}/api/auth/login', {
+                'email': f'login{i % args.users}@example.com', 'password': PASSWORD
+            })
+            statuses[status] += 1
+            if status == 200:
+                logins.append(seconds)
+
+        def browse():
+            while not done.is_set():
+                catalog.append(_request(f'{base}/api/products')[1])
+
+        browser = threading.Thread(target=browse)
+        browser.start()
+        started = time.perf_counter()
+        with ThreadPoolExecutor(args.concurrency) as executor:
+            list(executor.map(login, range(args.logins)))
+        elapsed = time.perf_counter() - started
+        done.set()
+        browser.join()
+        server.shutdown()
+        hasher.shutdown()
+
+    return {
+        'pool_size': pool_size,
+        'logins_per_s': round(statuses[200] / elapsed, 1),
+        'login_p50_ms': _ms(logins),
+        'login_p95_ms': _ms(logins, 95),
+        'rejected_503': statuses[503],
+        'statuses': dict(statuses),
+        'catalog_p50_ms': _ms(catalog),
+        'catalog_p95_ms': _ms(catalog, 95),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--pool-sizes', default='0,1,2', help='0 hashes inline')
+    parser.add_argument('--max-queue', type=int, default=4)
+    parser.add_argument('--method', default='pbkdf2:sha256:600000')
+    args = parser.parse_args()
+
+    for pool_size in (int(size) for size in args.pool_sizes.split(',')):
+        result = run(pool_size, args)
+        print(
+            f"pool {result['pool_size']}: {result['logins_per_s']:>6} logins/s  "
+            f"login p50 {result['login_p50_ms']}ms p95 {result['login_p95_ms']}ms  "
+            f"503s {result['rejected_503']:>4}  "
+            f"catalog p50 {result['catalog_p50_ms']}ms p95 {result['catalog_p95_ms']}ms"
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Order endpoint query-count check
+
+Counts the SQL statements each order endpoint issues (create, list in page,
+cursor and summary mode, detail, status update, payment confirmation) for
+orders of one line item and of ``--items`` line items, and exits non-zero
+when a count depends on the number of items (an N+1 regression). Uses a
+throwaway SQLite file unless ``--database-url`` points elsewhere.
+
+    python -m benchmarks.order_queries --items 25
+"""
+import argparse
+import sys
+
+from app import db
+from app.authz import create_user_token
+from app.models import CartItem, Product, User
+
+from benchmarks.common import QueryCounter, benchmark_app
+
+ORDERS = 3  # per user, so the list pages hold several orders
+
+
+def _user(name, admin=False):
+    user = User(username=name, email=f'{name}@example.com', password_hash='-', is_admin=admin)
+    db.session.add(user)
+    db.session.commit()
+    return user.id, {'Authorization': f'Bearer {create_user_token(user)}'}
+
+
+def _count(client, method, url, **kwargs):
+    db.session.remove()
+    with QueryCounter() as counter:
+        response = client.open(url, method=method, **kwargs)
+    assert response.status_code < 300, (url, response.status_code, response.get_data())
+    return counter.count, response
+
+
+def measure(app, product_ids, items):
+    """Statements per endpoint for orders of ``items`` line items"""
+    client = app.test_client()
+    # Fresh users per size: token checks then behave the same in every run
+    user_id, headers = _user(f'shopper{items}')
+    _, admin = _user(f'admin{items}', admin=True)
+
+    counts = {}
+    for _ in range(ORDERS):
+        for product_id in product_ids[:items]:
+            db.session.add(CartItem(user_id=user_id, product_id=product_id, quantity=1))
+        db.session.commit()
+        counts['create'], response = _count(
+            client, 'POST', '/api/orders', json={'shipping_address': '1 Test Road'}, headers=headers
+        )
+    order_id = response.json['order']['id']
+
+    for name, url in (('list', '/api/orders'), ('list_cursor', '/api/orders?cursor='),
+                      ('list_summary', '/api/orders?summary=1')):
+        counts[name], _ = _count(client, 'GET', url, headers=headers)
+    counts['detail'], _ = _count(client, 'GET', f'/api/orders/{order_id}', headers=headers)
+    counts['update'], _ = _count(
+        client, 'PUT', f'/api/orders/{order_id}', json={'status': 'shipped'}, headers=admin
+    )
+    counts['confirm_payment'], _ = _count(
+        client, 'POST', f'/api/orders/{order_id}/confirm-payment',
+        json={'transaction_id': f'txn-{items}'}, headers=headers
+    )
+    return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--database-url')
+    args = parser.parse_args()
+
+    # Responses are not cached, so every request reaches the database
+    with benchmark_app(args.database_url, CATALOG_CACHE_BACKEND='none') as app:
+        products = [
+            Product(name=f'Product {i}', price=100 + i, category='toys', stock=1000)
+            for i in range(args.items)
+        ]
+        db.session.add_all(products)
+        db.session.commit()
+        product_ids = [product.id for product in products]
+
+        single = measure(app, product_ids, 1)
+        many = measure(app, product_ids, args.items)
+
+    failures = []
+    for name in single:
+        verdict = 'ok' if single[name] == many[name] else 'FAIL'
+        print(f'{name:<16} 1 item: {single[name]:>2} statements  '
+              f'{args.items} items: {many[name]:>2} statements  {verdict}')
+        if single[name] != many[name]:
+            failures.append(name)
+    for name in failures:
+        print(f'FAIL: {name} issues more statements with more items')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,169 @@
+"""Query plan regression check
+
+Seeds a large database, runs every scenario of ``benchmarks.api`` (each
+route in ``app/routes/``) through the test client, captures the SQL each
+request executes and runs ``EXPLAIN`` on it with the same parameters. Exits
+non-zero when a statement reads a whole table instead of an index:
+
+- SQLite: a ``SCAN <table>`` step without ``USING INDEX`` / ``USING COVERING INDEX``
+- PostgreSQL: a ``Seq Scan`` node
+
+Statements that scan by design are listed in ``ALLOWED_SCANS``. Sorts that
+could not use an index (``USE TEMP B-TREE``, PostgreSQL ``Sort`` nodes) are
+reported but do not fail the run. ``ANALYZE`` runs after seeding so the
+planner sees realistic statistics.
+
+    python -m benchmarks.query_plans --scale large
+    python -m benchmarks.query_plans --database-url postgresql://.../empty_db
+"""
+import argparse
+import json
+import re
+import sys
+import time
+
+from sqlalchemy import event
+
+from app import db
+from app.facets import get_catalog_summary
+from app.search import get_search_backend
+
+from benchmarks.api import Context, scenarios
+from benchmarks.common import benchmark_app
+from benchmarks.data import generate
+
+# (scenario prefix, table, statement prefix): reason
+ALLOWED_SCANS = {
+    # Counting the whole active catalog reads every active row; when (nearly)
+    # all products are active the partial indexes hold the same rows and the
+    # planner rightly prefers the table
+    ('products.', 'products', 'SELECT count(*)'): 'unfiltered catalog total',
+}
+
+
+def _allowed(key, table, statement):
+    return any(
+        key.startswith(scenario) and table == allowed_table and statement.startswith(prefix)
+        for scenario, allowed_table, prefix in ALLOWED_SCANS
+    )
+
+_SQLITE_SCAN = re.compile(r'^SCAN (\w+)(?: AS \w+)?$')
+
+
+def _table(name, tables):
+    # Aliases such as products_1 belong to their table
+    base = re.sub(r'_\d+$', '', name)
+    return base if base in tables else None
+
+
+def sqlite_plan(conn, statement, parameters, tables):
+    """(full scans, sorts) of one statement on SQLite"""
+    rows = conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters).all()
+    scans, sorts = [], []
+    for row in rows:
+        detail = row[-1]
+        match = _SQLITE_SCAN.match(detail)
+        if match and _table(match.group(1), tables):
+            scans.append(_table(match.group(1), tables))
+        if 'TEMP B-TREE' in detail:
+            sorts.append(detail)
+    return scans, sorts
+
+
+def postgresql_plan(conn, statement, parameters, tables):
+    """(full scans, sorts) of one statement on PostgreSQL"""
+    plan = conn.exec_driver_sql('EXPLAIN (FORMAT JSON) ' + statement, parameters).scalar()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    scans, sorts = [], []
+
+    def walk(node):
+        if node.get('Node Type') == 'Seq Scan' and node.get('Relation Name') in tables:
+            scans.append(node['Relation Name'])
+        if node.get('Node Type') in ('Sort', 'Incremental Sort'):
+            sorts.append(', '.join(node.get('Sort Key', [])))
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return scans, sorts
+
+
+PLANNERS = {'sqlite': sqlite_plan, 'postgresql': postgresql_plan}
+
+
+def capture(ctx, prepare):
+    """Run one scenario request; returns (status, [(statement, parameters)])"""
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE', 'WITH')):
+            statements.append((statement, parameters[0] if executemany else parameters))
+
+    method, url, kwargs = prepare()
+    db.session.remove()
+    event.listen(db.engine, 'before_cursor_execute', record)
+    try:
+        response = ctx.client.open(url, method=method, **kwargs)
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', record)
+    return response.status_code, statements
+
+
+def run(args):
+    failures = []
+    settings = {'CATALOG_CACHE_BACKEND': 'none', 'PAGINATION_COUNT_TTL': 0}
+    with benchmark_app(args.database_url, **settings) as app:
+        started = time.perf_counter()
+        data = generate(args.scale)
+        print(f'[{args.scale}] data generated in {time.perf_counter() - started:.1f}s')
+        dialect = db.engine.dialect.name
+        planner = PLANNERS.get(dialect)
+        if planner is None:
+            raise SystemExit(f'No EXPLAIN support for {dialect}')
+        with db.engine.begin() as conn:
+            conn.exec_driver_sql('ANALYZE')
+        # Per-worker mirrors load the whole catalog once; that is not a request path
+        get_search_backend().sync()
+        get_catalog_summary().sync()
+
+        ctx = Context(app, data)
+        tables = set(db.metadata.tables)
+        for blueprint, name, prepare in scenarios(ctx):
+            key = f'{blueprint}.{name}'
+            if args.only and blueprint not in args.only and key not in args.only:
+                continue
+            status, statements = capture(ctx, prepare)
+            scans, sorts = set(), set()
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    statement_scans, statement_sorts = planner(conn, statement, parameters, tables)
+                    for table in statement_scans:
+                        if _allowed(key, table, statement):
+                            continue
+                        scans.add(table)
+                        failures.append((key, table, ' '.join(statement.split())[:200]))
+                    sorts.update(statement_sorts)
+            verdict = 'FULL SCAN ' + ', '.join(sorted(scans)) if scans else 'ok'
+            print(f'{key:<40} {status}  {len(statements):>2} statements  {verdict}'
+                  + (f'  (sorts: {len(sorts)})' if sorts and args.verbose else ''))
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='large')
+    parser.add_argument('--only', type=lambda value: set(value.split(',')),
+                        help='Comma-separated blueprints or blueprint.scenario names')
+    parser.add_argument('--database-url', help='Empty database to use instead of a temporary SQLite file')
+    parser.add_argument('--verbose', action='store_true', help='Also report sorts not served by an index')
+    args = parser.parse_args()
+
+    failures = run(args)
+    for key, table, statement in failures:
+        print(f'FULL SCAN {key}: {table}: {statement}')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,78 @@
+"""Product search benchmark
+
+Generates synthetic catalogs in a throwaway SQLite database and measures
+index build time and query latency for each search backend.
+
+    python -m benchmarks.search --sizes 10000,100000,1000000
+"""
+import argparse
+import random
+import statistics
+import time
+
+from app import db
+from app.models import Product
+from app.search import BACKENDS
+
+from benchmarks.common import benchmark_app, percentile
+from benchmarks.data import product_rows
+
+QUERIES = ['cat toy', 'salmon', 'scratching post', 'premium food', 'lit', 'interactive laser feather']
+
+
+def populate(count, seed=42, chunk_size=10000):
+    chunk = []
+    for row in product_rows(count, random.Random(seed)):
+        chunk.append(row)
+        if len(chunk) == chunk_size:
+            db.session.execute(db.insert(Product), chunk)
+            chunk = []
+    if chunk:
+        db.session.execute(db.insert(Product), chunk)
+    db.session.commit()
+
+
+def bench_backend(name, repeat):
+    backend = BACKENDS[name]()
+    started = time.perf_counter()
+    backend.rebuild()
+    build = time.perf_counter() - started
+
+    timings = []
+    for _ in range(repeat):
+        for query in QUERIES:
+            started = time.perf_counter()
+            backend.search(query, limit=20)
+            timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'backend': name,
+        'build_s': round(build, 3),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 95), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', default='10000,100000')
+    parser.add_argument('--backends', default='memory,sql,like')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    for size in (int(s) for s in args.sizes.split(',')):
+        with benchmark_app():
+            started = time.perf_counter()
+            populate(size)
+            print(f'{size} products generated in {time.perf_counter() - started:.1f}s')
+            for name in args.backends.split(','):
+                result = bench_backend(name, args.repeat)
+                print(
+                    f"  {result['backend']:<7} build {result['build_s']:>8.3f}s  "
+                    f"p50 {result['p50_ms']:>9.3f}ms  p95 {result['p95_ms']:>9.3f}ms  "
+                    f"max {result['max_ms']:>9.3f}ms"
+                )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Serialization benchmark
+
+Measures bytes and CPU time per response for the product, review and order
+list endpoints with each JSON encoder, with all fields and with a sparse
+``fields=`` selection, and the cost of turning the loaded rows into JSON with
+``to_dict()`` + the stdlib encoder versus the compiled serializers + orjson.
+
+    python -m benchmarks.serialization --scale medium --iterations 200
+"""
+import argparse
+import json
+import time
+
+from app import db
+from app.authz import create_user_token
+from app.models import Order, Product, Review, User
+from app.serializers import order_serializer, product_serializer, review_serializer
+
+from benchmarks.common import QueryCounter, benchmark_app
+from benchmarks.data import generate
+
+# name -> (path, sparse fields, serializer, per_page)
+LISTS = {
+    'products': ('/api/products', 'id,name,price,image_url,rating', product_serializer, 50),
+    'reviews': ('/api/reviews/product/{product_id}', 'username,rating,comment', review_serializer, 50),
+    'orders': ('/api/orders', 'total_price,status,order_date', order_serializer, 20),
+}
+
+
+def _measure(client, url, headers, iterations):
+    response = client.get(url, headers=headers)
+    assert response.status_code == 200, response.get_json()
+    with QueryCounter() as queries:
+        cpu, wall = time.process_time(), time.perf_counter()
+        for _ in range(iterations):
+            client.get(url, headers=headers)
+        cpu, wall = time.process_time() - cpu, time.perf_counter() - wall
+    return {
+        'bytes': len(response.get_data()),
+        'cpu_ms': round(cpu / iterations * 1000, 3),
+        'wall_ms': round(wall / iterations * 1000, 3),
+        'queries': round(queries.count / iterations, 2),
+    }
+
+
+def _encode_only(app, rows, serializer, iterations):
+    """CPU per page for ``to_dict()`` + json vs compiled serializer + app encoder"""
+    started = time.process_time()
+    for _ in range(iterations):
+        json.dumps([row.to_dict() for row in rows], separators=(',', ':'))
+    to_dict = time.process_time() - started
+
+    started = time.process_time()
+    for _ in range(iterations):
+        app.json.dumps(serializer.many(rows))
+    compiled = time.process_time() - started
+    return round(to_dict / iterations * 1000, 3), round(compiled / iterations * 1000, 3)
+
+
+def run(scale, iterations):
+    results = []
+    for backend in ('stdlib', 'orjson'):
+        with benchmark_app(JSON_BACKEND=backend, CATALOG_CACHE_BACKEND='none', DEBUG=False) as app:
+            ids = generate(scale)
+            user = db.session.get(User, ids['user_ids'][1])
+            headers = {'Authorization': f'Bearer {create_user_token(user)}'}
+            client = app.test_client()
+
+            for name, (path, sparse, serializer, per_page) in LISTS.items():
+                base = path.format(product_id=ids['product_ids'][0]) + f'?per_page={per_page}'
+                full = _measure(client, base, headers, iterations)
+                few = _measure(client, f'{base}&fields={sparse}', headers, iterations)
+                row = {'backend': backend, 'list': name, 'full': full, 'sparse': few}
+
+                if backend == 'orjson':
+                    model = serializer.model
+                    query = model.query.options(*serializer.load_options())
+                    if model is Review:
+                        query = query.filter_by(product_id=ids['product_ids'][0])
+                    elif model is Order:
+                        query = query.filter_by(user_id=user.id)
+                    elif model is Product:
+                        query = query.filter_by(is_active=True)
+                    rows = query.limit(per_page).all()
+                    row['encode_to_dict_ms'], row['encode_compiled_ms'] = \
+                        _encode_only(app, rows, serializer, iterations)
+                results.append(row)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', default='medium')
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args.scale, args.iterations)
+    for row in results:
+        full, few = row['full'], row['sparse']
+        line = (
+            f"{row['backend']:>6} {row['list']:<8}  full {full['bytes']:>6}B {full['cpu_ms']:>7}ms cpu  "
+            f"sparse {few['bytes']:>6}B {few['cpu_ms']:>7}ms cpu"
+        )
+        if 'encode_to_dict_ms' in row:
+            line += f"  encode: to_dict+json {row['encode_to_dict_ms']}ms, compiled+orjson {row['encode_compiled_ms']}ms"
+        print(line)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,148 @@
+"""Worker startup benchmark
+
+Measures how long a new process takes to serve its first request, the cost
+paid on every scale-out:
+
+- in-process breakdown (import, ``create_app()``, first request through the
+  test client), with and without ``DB_AUTO_CREATE``
+- gunicorn from process start to the first ``200`` from ``/api/products``,
+  with tables created at boot, migrations only, and ``--preload``
+
+Uses a throwaway SQLite file unless ``--database-url`` points elsewhere (the
+schema must already be there, e.g. ``flask db upgrade``).
+
+    python -m benchmarks.startup --runs 5 --workers 4
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from benchmarks.common import benchmark_app
+from benchmarks.data import generate
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/products')
+served = time.perf_counter()
+assert response.status_code == 200, response.get_data()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+}))
+'''
+
+# name -> (DB_AUTO_CREATE, extra gunicorn arguments)
+SERVERS = {
+    'create_all at boot': ('true', []),
+    'migrations only': ('false', []),
+    'migrations only, --preload': ('false', ['--preload']),
+}
+
+
+def _env(url, auto_create):
+    return dict(os.environ, FLASK_ENV='development', DATABASE_URL=url, DB_AUTO_CREATE=auto_create,
+                PASSWORD_HASH_WORKERS='0', METRICS_DIR='')
+
+
+def _probe(url, auto_create):
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=BACKEND_DIR, env=_env(url, auto_create),
+        check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _time_to_first_request(url, auto_create, workers, extra):
+    port = _free_port()
+    command = [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}',
+               '--workers', str(workers), '--log-level', 'warning', *extra, 'app:create_app()']
+    started = time.perf_counter()
+    process = subprocess.Popen(command, cwd=BACKEND_DIR, env=_env(url, auto_create))
+    try:
+        while time.perf_counter() - started < 60:
+            try:
+                with urllib.request.urlopen(f'http://127.0.0.1:{port}/api/products', timeout=5) as response:
+                    if response.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError('server did not start')
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def run(args):
+    path = None
+    url = args.database_url
+    if not url:
+        fd, path = tempfile.mkstemp(suffix='.db')
+        os.close(fd)
+        url = f'sqlite:///{path}'
+        with benchmark_app(database_url=url):
+            generate('small')
+
+    results = {'in_process': {}, 'gunicorn': {}}
+    try:
+        for label, auto_create in (('create_all at boot', 'true'), ('migrations only', 'false')):
+            samples = [_probe(url, auto_create) for _ in range(args.runs)]
+            results['in_process'][label] = {
+                key: round(statistics.median(sample[key] for sample in samples), 1)
+                for key in samples[0]
+            }
+        for label, (auto_create, extra) in SERVERS.items():
+            samples = [_time_to_first_request(url, auto_create, args.workers, extra) for _ in range(args.runs)]
+            results['gunicorn'][label] = {
+                'first_request_ms': round(statistics.median(samples), 1),
+                'max_ms': round(max(samples), 1),
+            }
+    finally:
+        if path:
+            os.remove(path)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--database-url')
+    parser.add_argument('--output', help='Write the results as JSON')
+    args = parser.parse_args()
+
+    results = run(args)
+    for label, row in results['in_process'].items():
+        print(f"{label:<28} import {row['import_ms']:>7.1f}ms  create_app {row['create_app_ms']:>6.1f}ms  "
+              f"first request {row['first_request_ms']:>6.1f}ms")
+    for label, row in results['gunicorn'].items():
+        print(f"gunicorn, {label:<28} first request after {row['first_request_ms']:>7.1f}ms "
+              f"(max {row['max_ms']}ms)")
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -12,16 +12,90 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///cat_ecommerce.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     SQLALCHEMY_ECHO = os.getenv('SQLALCHEMY_ECHO', False)
+    # Create missing tables at boot (development only; otherwise run `flask db upgrade`)
+    DB_AUTO_CREATE = os.getenv('DB_AUTO_CREATE', 'false').lower() == 'true'
+    
+    # Connection pool per worker (ignored for SQLite) and statement timeout (0 disables)
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 10))
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    DB_CONNECT_TIMEOUT = int(os.getenv('DB_CONNECT_TIMEOUT', 5))
+    DB_STATEMENT_TIMEOUT_MS = int(os.getenv('DB_STATEMENT_TIMEOUT_MS', 30000))
+    
+    # Read replica for catalog GET endpoints; empty reads from the primary
+    DATABASE_REPLICA_URL = os.getenv('DATABASE_REPLICA_URL', '')
+    REPLICA_STICKY_SECONDS = float(os.getenv('REPLICA_STICKY_SECONDS', 5))  # primary reads after a write
+    REPLICA_RETRY_SECONDS = float(os.getenv('REPLICA_RETRY_SECONDS', 30))
     
     # JWT
     JWT_SECRET_KEY = os.getenv('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(hours=1)
+    TOKEN_VERSION_CACHE_TTL = int(os.getenv('TOKEN_VERSION_CACHE_TTL', 30))  # max seconds a revoked token keeps working
+    
+    # Password hashing: werkzeug method/cost and a bounded process pool per worker
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 1))  # 0 hashes inline
+    PASSWORD_HASH_MAX_QUEUE = int(os.getenv('PASSWORD_HASH_MAX_QUEUE', 4))
+    PASSWORD_HASH_TIMEOUT = float(os.getenv('PASSWORD_HASH_TIMEOUT', 5))
     
     # CORS
     CORS_ORIGINS = os.getenv('CORS_ORIGINS', 'http://localhost:3000').split(',')
     
+    # Cache-Control max-age of public catalog responses (clients revalidate with ETags)
+    HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 0))
+    
+    # JSON encoder for responses: auto, orjson or stdlib
+    JSON_BACKEND = os.getenv('JSON_BACKEND', 'auto')
+    
+    # ASGI mode (asgi.py): threads running the requests it hands to the WSGI app
+    ASGI_WSGI_THREADS = int(os.getenv('ASGI_WSGI_THREADS', 8))
+    
     # Pagination
     ITEMS_PER_PAGE = 20
+    PAGINATION_COUNT_TTL = int(os.getenv('PAGINATION_COUNT_TTL', 30))  # seconds a keyset total is reused
+    
+    PRODUCT_BATCH_MAX_ITEMS = int(os.getenv('PRODUCT_BATCH_MAX_ITEMS', 100000))  # PATCH /api/products/batch
+    
+    # Catalog response cache: local, redis or none
+    CATALOG_CACHE_BACKEND = os.getenv('CATALOG_CACHE_BACKEND', 'local')
+    CATALOG_CACHE_URL = os.getenv('CATALOG_CACHE_URL', 'redis://localhost:6379/0')
+    CATALOG_CACHE_TTL = int(os.getenv('CATALOG_CACHE_TTL', 60))
+    CATALOG_CACHE_MAX_BYTES = int(os.getenv('CATALOG_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+    
+    # Write-behind counters (review helpful votes, ...)
+    COUNTER_FLUSH_INTERVAL = float(os.getenv('COUNTER_FLUSH_INTERVAL', 2))
+    COUNTER_MAX_PENDING = int(os.getenv('COUNTER_MAX_PENDING', 1000))
+    
+    # Product search: memory, sql or like
+    SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'memory')
+    SEARCH_REFRESH_INTERVAL = float(os.getenv('SEARCH_REFRESH_INTERVAL', 5))
+    SEARCH_MAX_RESULTS = int(os.getenv('SEARCH_MAX_RESULTS', 1000))
+    
+    # Catalog facets (GET /api/products/facets)
+    FACETS_PRICE_BUCKETS = os.getenv('FACETS_PRICE_BUCKETS', '0,1000,2500,5000,10000')  # lower bounds, paisa
+    FACETS_REFRESH_INTERVAL = float(os.getenv('FACETS_REFRESH_INTERVAL', 5))
+    
+    # In-memory catalog index for product listings (per worker)
+    CATALOG_INDEX_ENABLED = os.getenv('CATALOG_INDEX_ENABLED', 'false').lower() == 'true'
+    CATALOG_INDEX_REFRESH_INTERVAL = float(os.getenv('CATALOG_INDEX_REFRESH_INTERVAL', 5))
+    
+    # Request metrics (GET /metrics); METRICS_DIR shares them across workers
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_DIR = os.getenv('METRICS_DIR', '')
+    METRICS_SYNC_INTERVAL = float(os.getenv('METRICS_SYNC_INTERVAL', 1))
+    # Bearer token for /metrics; without one only loopback clients may scrape
+    METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+    
+    # SQL profiler: captures statements/requests slower than the thresholds
+    PROFILER_ENABLED = os.getenv('PROFILER_ENABLED', 'false').lower() == 'true'
+    PROFILER_STATEMENT_THRESHOLD_MS = float(os.getenv('PROFILER_STATEMENT_THRESHOLD_MS', 100))
+    PROFILER_REQUEST_THRESHOLD_MS = float(os.getenv('PROFILER_REQUEST_THRESHOLD_MS', 500))
+    PROFILER_SAMPLE_RATE = float(os.getenv('PROFILER_SAMPLE_RATE', 1.0))
+    PROFILER_BUFFER_SIZE = int(os.getenv('PROFILER_BUFFER_SIZE', 500))
+    PROFILER_EXPLAIN = os.getenv('PROFILER_EXPLAIN', 'false').lower() == 'true'
+    PROFILER_LOG_PATH = os.getenv('PROFILER_LOG_PATH', '')  # JSONL file, optional
     
     # Upload
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
@@ -37,11 +111,13 @@ class TestingConfig(Config):
     DEBUG = True
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    PASSWORD_HASH_WORKERS = 0
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    DB_AUTO_CREATE = False  # schema changes only through migrations
 
 # Select config based on environment
 config = {
@@ -0,0 +1,73 @@
+"""Product full-text search structures
+
+Revision ID: 4b7e2f9c1d3a
+Revises: 7c286c22d122
+Create Date: 2026-10-18 21:05:12.418330
+
+The ``sql`` search backend reads an external-content FTS5 table kept in sync
+by triggers on SQLite, and a GIN expression index on PostgreSQL. Databases
+where the backend created them at request time get them dropped and
+recreated, so the FTS table is rebuilt from the current products.
+
+On SQLite, a later ``batch_alter_table`` that recreates ``products`` drops
+the triggers (and renumbers rowids): such a migration must drop and
+recreate these structures as ``upgrade()`` does here.
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '4b7e2f9c1d3a'
+down_revision = '7c286c22d122'
+branch_labels = None
+depends_on = None
+
+SQLITE_TRIGGERS = ('products_fts_ai', 'products_fts_ad', 'products_fts_au')
+
+
+def _drop(dialect):
+    if dialect == 'sqlite':
+        for trigger in SQLITE_TRIGGERS:
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS products_fts')
+    elif dialect == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_products_search')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    _drop(dialect)
+    if dialect == 'sqlite':
+        op.execute(
+            "CREATE VIRTUAL TABLE products_fts USING fts5("
+            "name, description, content='products', content_rowid='rowid', "
+            "tokenize='porter unicode61')"
+        )
+        op.execute(
+            "CREATE TRIGGER products_fts_ai AFTER INSERT ON products BEGIN "
+            "INSERT INTO products_fts(rowid, name, description) "
+            "VALUES (new.rowid, new.name, new.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER products_fts_ad AFTER DELETE ON products BEGIN "
+            "INSERT INTO products_fts(products_fts, rowid, name, description) "
+            "VALUES ('delete', old.rowid, old.name, old.description); END"
+        )
+        op.execute(
+            "CREATE TRIGGER products_fts_au AFTER UPDATE OF name, description "
+            "ON products BEGIN "
+            "INSERT INTO products_fts(products_fts, rowid, name, description) "
+            "VALUES ('delete', old.rowid, old.name, old.description); "
+            "INSERT INTO products_fts(rowid, name, description) "
+            "VALUES (new.rowid, new.name, new.description); END"
+        )
+        op.execute("INSERT INTO products_fts(products_fts) VALUES ('rebuild')")
+    elif dialect == 'postgresql':
+        op.execute(
+            'CREATE INDEX ix_products_search ON products USING GIN ('
+            "to_tsvector('english', coalesce(name, '') || ' ' || coalesce(description, '')))"
+        )
+
+
+def downgrade():
+    _drop(op.get_bind().dialect.name)
@@ -0,0 +1,32 @@
+"""Product helpful votes rollup
+
+Revision ID: 5c8e1f3a7b94
+Revises: 9e2d4a6b8c10
+Create Date: 2026-10-18 22:41:05.337862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5c8e1f3a7b94'
+down_revision = '9e2d4a6b8c10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Plain ALTER TABLE rather than batch mode: recreating products on SQLite
+    # would drop the full-text search triggers and renumber rowids
+    op.add_column('products', sa.Column('helpful_votes', sa.Integer(), server_default='0', nullable=False))
+
+    op.execute(
+        'UPDATE products SET helpful_votes = COALESCE('
+        '(SELECT SUM(r.helpful_count) FROM reviews r WHERE r.product_id = products.id), 0)'
+    )
+
+
+def downgrade():
+    # Native DROP COLUMN (SQLite 3.35+) for the same reason
+    op.execute('ALTER TABLE products DROP COLUMN helpful_votes')
@@ -87,6 +87,15 @@ def seed_products():
         ]
         
         for product_data in products:
+            # Keep the running sum and the per-star histogram consistent with
+            # the seeded average: every review gets one of the two neighbouring stars
+            count = product_data['review_count']
+            rating_sum = round(product_data['rating'] * count)
+            lower = min(int(product_data['rating']), 4)
+            upper_count = rating_sum - lower * count
+            product_data['rating_sum'] = rating_sum
+            product_data[f'rating_{lower}_count'] = count - upper_count
+            product_data[f'rating_{lower + 1}_count'] = upper_count
             product = Product(**product_data)
             db.session.add(product)
         